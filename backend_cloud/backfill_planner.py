@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""历史块回填的分片规划。
+
+原来每轮最多只处理 10 万个缺块, 新链回填要反复重启, 而且块完成的先后
+没有任何顺序保证, 水位线只能等下次重启扫库时才推进。这里把整个缺口
+区间 (gap_index.missing_ranges 的结果) 切成分片, 不再设上限:
+
+  - 分片按需切出: 端点来要活时, 从还没分出去的缺口里按升序切一个分片给它,
+    大小约等于该端点 shard_seconds 秒能抓完的块数 (按实测吞吐, 没测过的用默认值),
+    快端点拿大分片, 慢端点拿小分片, 慢端点不会长时间占住靠前的块
+  - 失败的块放进共享的重试队列, 由下一个来要活的端点优先重抓
+  - 缺口都分完后, 空闲端点从最靠前的未分完分片里抢活, 尽快补齐水位线前沿
+  - 写者每提交一个事务回调 committed(), 靠前的分片全部落库后
+    on_contiguous(block) 推进水位线
+
+断点: 已落库的块就是检查点。重启后从水位线起重新扫库, 已完成的分片
+(包括水位线之后、前面还有未完成分片的) 不会出现在缺口里, 直接从中途续跑。
+
+用法:
+    work = ShardQueue(ranges, end=latest_block, contiguous_base=wm, on_contiguous=advance)
+    items = work.take(limits.batch_size(url), url)
+    work.done(items, url) / work.retry(items)
+    writer 的 on_commit -> work.committed(block_numbers)
+"""
+
+import time
+import bisect
+import itertools
+import threading
+from collections import deque
+
+import gap_index
+
+
+def ranges_from_blocks(block_numbers):
+    """升序块号 -> [(lo, hi), ...] 闭区间"""
+    ranges = []
+    for block_number in block_numbers:
+        if ranges and block_number == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], block_number)
+        else:
+            ranges.append((block_number, block_number))
+    return ranges
+
+
+class Shard:
+    def __init__(self, ranges):
+        self.first = ranges[0][0]
+        self.last = ranges[-1][1]
+        self.size = gap_index.count_blocks(ranges)
+        self.blocks = gap_index.iter_blocks(ranges)
+        self.handed_out = 0
+        self.committed = 0
+        self.failed = 0
+
+    def exhausted(self):
+        return self.handed_out >= self.size
+
+    def take(self, n):
+        blocks = list(itertools.islice(self.blocks, n))
+        self.handed_out += len(blocks)
+        return blocks
+
+
+class ShardQueue:
+    """待抓块的共享队列 (线程和协程共用, 锁内无阻塞), 接口与原 BlockWorkQueue 相同,
+    take/done 多了端点参数用于分片归属和吞吐统计。"""
+
+    MAX_ATTEMPTS = 8
+
+    def __init__(self, ranges, end=None, contiguous_base=None, on_contiguous=None,
+                 shard_seconds=30, default_shard=2000, max_shard=20000):
+        """
+        :param ranges: 缺口区间 [(lo, hi), ...], 升序
+        :param end: 本轮目标链头 (不含), 全部完成时水位线推到 end-1
+        :param contiguous_base: 已知从起始块连续到此的块号 (即水位线); None 表示不推水位线
+        :param on_contiguous: 回调 on_contiguous(block), 返回 False 表示停止推进 (例如水位线被外部回退)
+        """
+        self.lock = threading.Lock()
+        self.remaining = deque(ranges)
+        self.total = gap_index.count_blocks(ranges)
+        self.end = end
+        self.shard_seconds = shard_seconds
+        self.default_shard = default_shard
+        self.max_shard = max_shard
+        self.shards = []
+        self.firsts = []   # 各分片首块, 二分查块所属分片
+        self.head = 0      # 第一个还没全部落库的分片
+        self.owned = {}    # 端点 -> 当前分片
+        self.throughput = {}  # 端点 -> [完成块数, 首次取活时间]
+        self.retry_queue = deque()
+        self.waiting = deque()  # (可再取的时间, 块): retry(delay=...) 放回的块, 到时间才进重试队列
+        self.outstanding = 0
+        self.success = 0
+        self.error = 0
+        self.failed = []  # 放弃的块号, follow 模式下一轮再试
+        self.contiguous = contiguous_base if on_contiguous else None
+        self.on_contiguous = on_contiguous
+
+    # ---- 分片 ----
+
+    def _shard_size(self, owner, n):
+        done, since = self.throughput.get(owner, (0, None))
+        elapsed = time.monotonic() - since if since is not None else 0
+        if done == 0 or elapsed < 1:
+            size = self.default_shard
+        else:
+            size = int(done / elapsed * self.shard_seconds)
+        return max(n, min(size, self.max_shard))
+
+    def _carve(self, size):
+        """从还没分出去的缺口里按升序切至多 size 个块"""
+        ranges = []
+        while self.remaining and size > 0:
+            lo, hi = self.remaining.popleft()
+            if hi - lo + 1 > size:
+                self.remaining.appendleft((lo + size, hi))
+                hi = lo + size - 1
+            ranges.append((lo, hi))
+            size -= hi - lo + 1
+        if not ranges:
+            return None
+        shard = Shard(ranges)
+        self.shards.append(shard)
+        self.firsts.append(shard.first)
+        return shard
+
+    def _assign(self, owner, n):
+        shard = self._carve(self._shard_size(owner, n))
+        if shard is None:
+            # 缺口都分完了: 帮最靠前的未分完分片抢活
+            shard = next((s for s in self.shards[self.head:] if not s.exhausted()), None)
+        self.owned[owner] = shard
+        return shard
+
+    def _shard_of(self, block_number):
+        index = bisect.bisect_right(self.firsts, block_number) - 1
+        if index >= 0 and block_number <= self.shards[index].last:
+            return self.shards[index]
+        return None
+
+    # ---- BlockWorkQueue 接口 ----
+
+    def take(self, n, owner=None):
+        """取至多 n 个块, 返回 [(block_number, attempt), ...]; 先取重试队列, 再取 owner 的分片"""
+        with self.lock:
+            self.throughput.setdefault(owner, [0, time.monotonic()])
+            now = time.monotonic()
+            while self.waiting and self.waiting[0][0] <= now:
+                self.retry_queue.append(self.waiting.popleft()[1])
+            items = [self.retry_queue.popleft() for _ in range(min(n, len(self.retry_queue)))]
+            shard = self.owned.get(owner)
+            while len(items) < n:
+                if shard is None or shard.exhausted():
+                    shard = self._assign(owner, n)
+                    if shard is None:
+                        break
+                items.extend((block_number, 0) for block_number in shard.take(n - len(items)))
+            self.outstanding += len(items)
+            return items
+
+    def done(self, items, owner=None):
+        with self.lock:
+            self.outstanding -= len(items)
+            self.success += len(items)
+            if owner in self.throughput:
+                self.throughput[owner][0] += len(items)
+
+    def retry(self, items, delay=0):
+        """
+        放回队列重试, 超过 MAX_ATTEMPTS 次放弃
+        :param delay: 过这么多秒才能再被取走 (调用方对同一类重试用固定值, waiting 保持有序)
+        """
+        with self.lock:
+            self.outstanding -= len(items)
+            ready_at = time.monotonic() + delay
+            for block_number, attempt in reversed(items):
+                if attempt + 1 >= self.MAX_ATTEMPTS:
+                    print(f"Failed to process block #{block_number} after {self.MAX_ATTEMPTS} attempts, skipping...")
+                    self.error += 1
+                    self.failed.append(block_number)
+                    shard = self._shard_of(block_number)
+                    if shard is not None:
+                        shard.failed += 1  # 水位线停在这个分片之前
+                elif delay:
+                    self.waiting.append((ready_at, (block_number, attempt + 1)))
+                else:
+                    self.retry_queue.appendleft((block_number, attempt + 1))
+
+    def extend(self, ranges, end):
+        """follow 模式: 追加链头新出的块 (都在已有区间之后), 水位线接着往后推"""
+        with self.lock:
+            self.remaining.extend(ranges)
+            self.total += gap_index.count_blocks(ranges)
+            self.end = end
+
+    def requeue_failed(self):
+        """follow 模式: 上一轮放弃的块重新排进重试队列"""
+        with self.lock:
+            for block_number in self.failed:
+                shard = self._shard_of(block_number)
+                if shard is not None:
+                    shard.failed -= 1
+                self.retry_queue.append((block_number, 0))
+            self.error -= len(self.failed)
+            self.failed = []
+
+    def finished(self):
+        with self.lock:
+            return (not self.remaining and not self.retry_queue and not self.waiting and self.outstanding == 0
+                    and all(shard.exhausted() for shard in self.shards[self.head:]))
+
+    # ---- 落库回调 / 水位线 ----
+
+    def committed(self, block_numbers):
+        """写者提交成功后调用 (写线程里), 靠前分片全部落库时推进水位线"""
+        with self.lock:
+            for block_number in block_numbers:
+                shard = self._shard_of(block_number)
+                if shard is not None:
+                    shard.committed += 1
+            while self.head < len(self.shards) and self.shards[self.head].committed >= self.shards[self.head].size:
+                self.head += 1
+            if self.head >= 64:
+                # follow 模式每轮都会切出小分片, 已全部落库的丢掉, 免得常驻进程越攒越多
+                del self.shards[:self.head]
+                del self.firsts[:self.head]
+                self.head = 0
+            if self.contiguous is None or not self.shards:
+                return
+            if self.head < len(self.shards):
+                contiguous = self.shards[self.head].first - 1
+            elif self.remaining:
+                contiguous = self.remaining[0][0] - 1
+            elif self.end is not None:
+                contiguous = self.end - 1
+            else:
+                contiguous = self.shards[-1].last
+            if contiguous <= self.contiguous:
+                return
+            self.contiguous = contiguous
+        if self.on_contiguous(contiguous) is False:
+            with self.lock:
+                self.contiguous = None
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""块库单写者。
+
+抓取线程/协程只负责拉数据和解析, 把 (blocks, type4_txs) 行交给这里;
+唯一的写线程把多个批次攒成一个大事务提交 (按 commit_interval 秒或
+max_pending_blocks 块触发), 不再每批一连接一提交, 避免 "database is locked"
+重试和 fsync 风暴。
+
+WAL + synchronous=NORMAL: 掉电最多丢最后几个事务, 丢的块下一轮扫描时
+会被当作缺口重新抓取, 换来的是提交不再逐个 fsync。
+
+compact=True 时 type4 交易按 type4_codec 的紧凑格式写入 (typed 列 + zlib blob),
+写线程空闲时顺带把库里的旧格式行分块迁移过去。
+
+用法:
+    writer = BlockWriter(block_db_path, commit_interval=2.0)
+    writer.submit(block_rows, type4_rows)
+    ...
+    writer.close()  # 提交尾巴并等待写线程退出
+"""
+
+import time
+import queue
+import sqlite3
+import threading
+import type4_codec
+
+
+class BlockWriter:
+    def __init__(self, db_path, commit_interval=2.0, max_pending_blocks=5000,
+                 on_commit=None, compact=False):
+        self.db_path = db_path
+        self.compact = compact
+        self.schema_ready = not compact
+        self.migrate_after_rowid = 0
+        self.migration_done = not compact
+        self.commit_interval = commit_interval
+        self.max_pending_blocks = max_pending_blocks
+        # on_commit(block_rows): 每个事务提交成功后回调 (在写线程里执行)
+        self.on_commit = on_commit
+        # 有界队列: 写库跟不上时让抓取侧阻塞, 而不是在内存里无限堆积
+        self.queue = queue.Queue(maxsize=1000)
+        self.committed_blocks = 0
+        self.failed_blocks = 0
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, block_rows, type4_rows):
+        """交给写线程, 队列满时阻塞"""
+        self.queue.put((block_rows, type4_rows))
+
+    def close(self):
+        """提交剩余数据并等待写线程退出 (可重复调用)"""
+        if not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        # 转换需要独占, 拿不到就保持原模式, 不影响正确性
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.OperationalError:
+            pass
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _ensure_schema(self, conn):
+        # 写线程可能先于 init_db 建表启动, 紧凑格式的列等表建好后再补
+        if not self.schema_ready:
+            self.schema_ready = type4_codec.ensure_schema(conn)
+        return self.schema_ready
+
+    def _loop(self):
+        conn = self._connect()
+        block_rows, type4_rows = [], []
+        deadline = None
+        while True:
+            if deadline is not None:
+                wait = max(0.0, deadline - time.monotonic())
+            else:
+                wait = None if self.migration_done else self.commit_interval
+            try:
+                item = self.queue.get(timeout=wait)
+            except queue.Empty:
+                item = ()  # 到点提交
+                if deadline is None:
+                    # 彻底空闲 (没有待提交的数据): 顺手迁移一批旧格式行
+                    self._migrate_some(conn)
+                    continue
+            if item is None:
+                break
+            if item:
+                if deadline is None:
+                    deadline = time.monotonic() + self.commit_interval
+                block_rows.extend(item[0])
+                type4_rows.extend(item[1])
+                if len(block_rows) < self.max_pending_blocks:
+                    continue
+            self._commit(conn, block_rows, type4_rows)
+            block_rows, type4_rows = [], []
+            deadline = None
+
+        if block_rows or type4_rows:
+            self._commit(conn, block_rows, type4_rows)
+        conn.close()
+
+    def _migrate_some(self, conn):
+        if not self._ensure_schema(conn):
+            return
+        try:
+            next_rowid, migrated = type4_codec.migrate_chunk(conn, self.migrate_after_rowid)
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"[block_writer] type4 migration chunk failed: {e}")
+            return
+        if next_rowid == self.migrate_after_rowid:
+            self.migration_done = True
+            print("[block_writer] type4 rows all in compact format")
+            return
+        self.migrate_after_rowid = next_rowid
+        print(f"[block_writer] migrated {migrated} type4 rows to compact format")
+
+    def _commit(self, conn, block_rows, type4_rows):
+        if self.compact:
+            self._ensure_schema(conn)
+            type4_rows = [self._encode(row) for row in type4_rows]
+        max_retries = 3
+        for retry in range(max_retries):
+            try:
+                # OR IGNORE: 一个事务里攒了很多批, 不能让单个重复块把整个事务拖下水
+                conn.executemany(
+                    "INSERT OR IGNORE INTO blocks (block_number, tx_count, type4_tx_count, timestamp) "
+                    "VALUES (?, ?, ?, ?)", block_rows)
+                if self.compact:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO type4_transactions (tx_hash, block_number, tx_data, "
+                        "tx_index, from_address, auth_count, tx_blob) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", type4_rows)
+                else:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO type4_transactions (tx_hash, block_number, tx_data) "
+                        "VALUES (?, ?, ?)", type4_rows)
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                print(f"[block_writer] commit of {len(block_rows)} blocks failed "
+                      f"(retry {retry + 1}/{max_retries}): {e}")
+                time.sleep(1)
+                continue
+            self.committed_blocks += len(block_rows)
+            print(f"[block_writer] committed {len(block_rows)} blocks, "
+                  f"{len(type4_rows)} type4 txs")
+            if self.on_commit:
+                try:
+                    self.on_commit(block_rows)
+                except Exception as e:
+                    print(f"[block_writer] on_commit callback error: {e}")
+            return True
+        # 这些块没落库, 下一轮扫描会当缺口重新抓
+        self.failed_blocks += len(block_rows)
+        return False
+
+    def _encode(self, row):
+        tx_hash, block_number, tx_data = row
+        try:
+            return type4_codec.encode(tx_hash, block_number, tx_data)
+        except (ValueError, TypeError, AttributeError):
+            # 解析不了的保持原文, 读端 decode 对旧格式行直接返回 tx_data
+            return (tx_hash, block_number, tx_data, None, None, None, None)
@@ -10,7 +10,9 @@
 读旧库的请求顺着已打开的 fd 正常完成), 最后把水位退到确认高度。
 没有 DELETE 没有 VACUUM, 旧库整个文件 unlink, IO 只花在复制小尾巴上。
 
-放在 get_{name}.sh 串行末尾执行, 那是这条链抓块进程的安静点。
+放在 get_{name}.sh 串行末尾执行, 那是这条链抓块进程的安静点。follow.sh
+模式下抓块进程常驻不退出, 它发现库文件 inode 变化后会重开写者并从回退后的
+水位重新扫缺口, 替换瞬间写进旧库的块因此会被补回来。
 """
 
 import os
@@ -19,6 +21,7 @@ import glob
 import sqlite3
 import argparse
 import watermark
+import type4_codec
 
 parser = argparse.ArgumentParser(description='Rotate block db: drop confirmed history')
 parser.add_argument('--name', required=True, help='Blockchain network name')
@@ -64,6 +67,8 @@ def create_schema(conn):
     ON type4_transactions(block_number ASC);
     ''')
     conn.commit()
+    # 紧凑格式的列 (type4_codec), 新旧格式行原样复制
+    type4_codec.ensure_schema(conn)
 
 
 def main():
@@ -93,6 +98,8 @@ def main():
     # 防抖: 如果确认高度太旧, 要保留的尾巴占大头, 轮换释放不了多少空间,
     # 反而每轮重写一遍大文件。保留行数占比超过一半就先不动, 等确认追上来。
     old_conn = sqlite3.connect(block_db_path)
+    # 旧库可能还没有紧凑格式的列, 补上后下面的复制语句才能统一写
+    type4_codec.ensure_schema(old_conn)
     old_cursor = old_conn.cursor()
     old_cursor.execute("SELECT COUNT(*) FROM blocks WHERE block_number > ?", (confirmed,))
     keep_blocks = old_cursor.fetchone()[0]
@@ -125,8 +132,9 @@ def main():
             "SELECT block_number, tx_count, type4_tx_count, timestamp "
             "FROM src.blocks WHERE block_number > ?", (confirmed,))
         new_conn.execute(
-            "INSERT INTO type4_transactions (tx_hash, block_number, tx_data) "
-            "SELECT tx_hash, block_number, tx_data "
+            "INSERT INTO type4_transactions (tx_hash, block_number, tx_data, "
+            "tx_index, from_address, auth_count, tx_blob) "
+            "SELECT tx_hash, block_number, tx_data, tx_index, from_address, auth_count, tx_blob "
             "FROM src.type4_transactions WHERE block_number > ?", (confirmed,))
         new_conn.commit()
 
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""端点调度器, 取代各抓取脚本里的 random.choice(web3s)。
+
+每个端点维护 EWMA 延迟、EWMA 成功率和在途请求数, 每次请求挑得分最低的端点:
+    score = 延迟 * (在途数 + 1) / 成功率
+慢节点、被限流的节点自然少分流量; 连续失败 (或 429) 的端点进罚站区,
+罚站时间按连续失败次数指数增长, 到期后放出来试一次, 成功即恢复。
+
+用法:
+    scheduler = EndpointScheduler(WEB3_ENPOINTS)
+    url = scheduler.acquire()
+    ...请求...
+    scheduler.release(url, ok=True, latency=elapsed)
+
+    # 或者
+    with scheduler.request() as req:
+        ...用 req.url 请求, 失败时抛异常 (或 req.fail('rate_limited'))...
+
+snapshot() 给 stats 上报用, 服务端看板按端点展示。
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+
+class EndpointScheduler:
+    FAILURES_BEFORE_PENALTY = 3
+
+    def __init__(self, endpoints, alpha=0.2, penalty_base=10, penalty_max=300):
+        self.endpoints = list(endpoints)
+        self.alpha = alpha
+        self.penalty_base = penalty_base
+        self.penalty_max = penalty_max
+        self.lock = threading.Lock()
+        self.state = {url: {'latency': None, 'success_rate': 1.0, 'inflight': 0,
+                            'requests': 0, 'failures': 0, 'consecutive_failures': 0,
+                            'penalty_until': 0.0}
+                      for url in self.endpoints}
+
+    def add_endpoints(self, endpoints):
+        """运行中补充新端点 (已有的保持原有统计)"""
+        with self.lock:
+            for url in endpoints:
+                if url not in self.state:
+                    self.endpoints.append(url)
+                    self.state[url] = {'latency': None, 'success_rate': 1.0, 'inflight': 0,
+                                       'requests': 0, 'failures': 0, 'consecutive_failures': 0,
+                                       'penalty_until': 0.0}
+
+    def _score(self, item):
+        # 还没测过延迟的端点按 0 算, 先被挑中试一试
+        latency = item['latency'] or 0.0
+        return (latency + 0.01) * (item['inflight'] + 1) / max(item['success_rate'], 0.05)
+
+    def acquire(self, accept=None):
+        """
+        挑当前最优的端点并计入在途
+        :param accept: 可选回调 accept(url) -> bool, 例如按端点并发上限占槽位;
+                       返回 False 的端点跳过
+        :return: url, 全部被拒时返回 None
+        """
+        with self.lock:
+            now = time.time()
+            available = [url for url in self.endpoints if self.state[url]['penalty_until'] <= now]
+            if not available:
+                # 全在罚站: 挑最早到期的那个, 总比不发请求强
+                available = [min(self.endpoints, key=lambda url: self.state[url]['penalty_until'])]
+            for url in sorted(available, key=lambda url: self._score(self.state[url])):
+                if accept is None or accept(url):
+                    self.state[url]['inflight'] += 1
+                    return url
+        return None
+
+    def cancel(self, url):
+        """acquire 之后没真正发出请求, 只退还在途计数"""
+        with self.lock:
+            self.state[url]['inflight'] = max(0, self.state[url]['inflight'] - 1)
+
+    def release(self, url, ok, latency=None, kind=None):
+        """
+        请求结束后回写结果
+        :param ok: 是否成功
+        :param latency: 本次耗时 (秒), 失败时可不传
+        :param kind: 失败类型, rate_limited 直接进罚站区
+        """
+        with self.lock:
+            item = self.state[url]
+            item['inflight'] = max(0, item['inflight'] - 1)
+            item['requests'] += 1
+            item['success_rate'] = (1 - self.alpha) * item['success_rate'] + self.alpha * (1.0 if ok else 0.0)
+            if latency is not None:
+                if item['latency'] is None:
+                    item['latency'] = latency
+                else:
+                    item['latency'] = (1 - self.alpha) * item['latency'] + self.alpha * latency
+            if ok:
+                item['consecutive_failures'] = 0
+                item['penalty_until'] = 0.0
+                return
+            item['failures'] += 1
+            item['consecutive_failures'] += 1
+            strikes = item['consecutive_failures'] - self.FAILURES_BEFORE_PENALTY
+            if kind == 'rate_limited':
+                strikes = max(strikes, 0)
+            if strikes >= 0:
+                penalty = min(self.penalty_max, self.penalty_base * 2 ** strikes)
+                item['penalty_until'] = time.time() + penalty
+                print(f"[scheduler] {url} penalized for {penalty}s "
+                      f"({item['consecutive_failures']} consecutive failures{', ' + kind if kind else ''})")
+
+    @contextmanager
+    def request(self):
+        """with 包装: 正常退出算成功并记录耗时, 抛异常算失败"""
+        url = self.acquire()
+        req = _Request(url)
+        started = time.monotonic()
+        try:
+            yield req
+        except Exception:
+            self.release(url, ok=False, kind=req.kind)
+            raise
+        if req.kind is None:
+            self.release(url, ok=True, latency=time.monotonic() - started)
+        else:
+            self.release(url, ok=False, kind=req.kind)
+
+    def snapshot(self):
+        """各端点当前指标, 供 stats 上报"""
+        with self.lock:
+            now = time.time()
+            return {url: {'latency_ms': int(item['latency'] * 1000) if item['latency'] is not None else None,
+                          'success_rate': round(item['success_rate'], 3),
+                          'inflight': item['inflight'],
+                          'requests': item['requests'],
+                          'failures': item['failures'],
+                          'penalized': item['penalty_until'] > now}
+                    for url, item in self.state.items()}
+
+
+class _Request:
+    def __init__(self, url):
+        self.url = url
+        self.kind = None
+
+    def fail(self, kind='error'):
+        """不抛异常地标记本次请求失败"""
+        self.kind = kind
@@ -0,0 +1,22 @@
+#!/bin/bash
+# 常驻追块: ./follow.sh arb
+# get_block_batch.py 以 --follow 常驻 (参数取自 get_<name>.sh, 进程退出 10 秒后拉起),
+# 端点池/缺口状态留在内存里, 新块几秒内入库; tvl / code / clean_block 仍由
+# loop.sh 串行循环, 通过 SKIP_BLOCKS=1 跳过其中的一次性抓块 (跳过时 sleep SKIP_SLEEP 秒保持节奏)。
+# clean_block 轮换库文件时 follower 会发现 inode 变化, 自动重开写者并重新扫缺口。
+
+name=$1
+cmd=$(grep -o 'python3 get_block_batch.py.*' get_$name.sh | head -1)
+if [ -z "$cmd" ]; then
+    echo "no get_block_batch.py line in get_$name.sh"
+    exit 1
+fi
+
+(while true; do
+    $cmd --follow
+    timestamp=$(date +%Y-%m-%d_%H:%M:%S)
+    echo "$timestamp $name follower exited, restarting" >> loop.log
+    sleep 10
+done) &
+
+SKIP_BLOCKS=1 ./loop.sh $name
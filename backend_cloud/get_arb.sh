@@ -1,8 +1,15 @@
 #!/bin/bash
 # endpoints 省略时由 rpc_manager 自动从 chainlist 缓存中探测存活端点
 # batch_size 省略时使用 rpc_manager.CHAIN_CONFIG 里该链的默认批大小
+# SKIP_BLOCKS=1 时跳过抓块 (follow.sh 模式下由常驻的 --follow 进程负责),
+# 改为 sleep SKIP_SLEEP 秒 (默认 60), 保持 loop.sh 原来的轮询节奏
 
-python3 get_block_batch.py --name arb --num_threads 10 --start_block 429900000
+# async_fetch: 追块时在途批次数 = 端点数 x max_inflight, 不受线程数限制
+if [ -n "$SKIP_BLOCKS" ]; then
+    sleep "${SKIP_SLEEP:-60}"
+else
+    python3 get_block_batch.py --name arb --async_fetch --max_inflight 4 --start_block 429900000
+fi
 
 python3 get_tvl.py --name arb --contract 0x3aF42ae5A628e7bC0824B9b786DA512cFd18D4e9 --num_threads 5
 
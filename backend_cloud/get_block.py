@@ -11,6 +11,9 @@ from hexbytes import HexBytes
 import random
 import argparse
 from concurrent.futures import ThreadPoolExecutor
+from block_writer import BlockWriter
+import gap_index
+from endpoint_scheduler import EndpointScheduler
 
 # Add command line argument parsing
 parser = argparse.ArgumentParser(description='Process blockchain transaction data')
@@ -19,6 +22,10 @@ parser.add_argument('--endpoints', nargs='+', help='List of Web3 endpoints')
 parser.add_argument('--start_block', type=int, help='Starting block number')
 parser.add_argument('--num_threads', type=int, default=4, help='Number of parallel threads')
 parser.add_argument('--block_db_path', type=str, default='', help='block_db_path')
+parser.add_argument('--commit_interval', type=float, default=2.0,
+                    help='Seconds the single writer groups fetched blocks into one transaction')
+parser.add_argument('--compact_type4', action='store_true',
+                    help='Store type4 txs as typed columns + zlib blob (see type4_codec)')
 
 args = parser.parse_args()
 
@@ -27,6 +34,8 @@ WEB3_ENPOINTS = args.endpoints
 START_BLOCK = args.start_block
 NUM_THREADS = args.num_threads
 BLOCK_DB_PATH = args.block_db_path
+COMMIT_INTERVAL = args.commit_interval
+COMPACT_TYPE4 = args.compact_type4
 
 block_db_path = f'{NAME}_block.db'
 if BLOCK_DB_PATH != '':
@@ -35,9 +44,13 @@ if BLOCK_DB_PATH != '':
 web3s = [
     Web3(Web3.HTTPProvider(endpoint, request_kwargs={'timeout': 10})) for endpoint in WEB3_ENPOINTS
 ]
+web3_by_url = dict(zip(WEB3_ENPOINTS, web3s))
 
-# Create thread-local storage
-thread_local = threading.local()
+# 按延迟/成功率/在途数给每个请求挑端点, 连续失败的端点暂时罚站
+scheduler = EndpointScheduler(WEB3_ENPOINTS)
+
+# 所有抓取线程共用的唯一写者
+writer = BlockWriter(block_db_path, commit_interval=COMMIT_INTERVAL, compact=COMPACT_TYPE4)
 
 if NAME == 'bsc' or NAME == 'scroll':
     from web3.middleware import ExtraDataToPOAMiddleware
@@ -61,12 +74,6 @@ def serialize_web3_tx(tx_dict):
             result[key] = value
     return result
 
-# Get thread-local database connection
-def get_db_connection():
-    if not hasattr(thread_local, "db_connection"):
-        thread_local.db_connection = sqlite3.connect(block_db_path)
-    return thread_local.db_connection
-
 # Initialize database
 def init_db():
     conn = sqlite3.connect(block_db_path)
@@ -114,19 +121,12 @@ def init_db():
     return conn
 
 
-# Get all existing block numbers from database
-def get_existing_blocks(conn):
-    cursor = conn.cursor()
-    cursor.execute("SELECT block_number FROM blocks WHERE block_number >= ?", (START_BLOCK,))
-    existing_blocks = set(row[0] for row in cursor.fetchall())
-    return existing_blocks
-
 # Process and store block information
 def process_block(block_number):
-    conn = get_db_connection()
     try:
         # Get complete block information
-        block = random.choice(web3s).eth.get_block(block_number, full_transactions=True)
+        with scheduler.request() as req:
+            block = web3_by_url[req.url].eth.get_block(block_number, full_transactions=True)
         transactions = block.transactions
         
         # Calculate number of type=4 transactions
@@ -142,27 +142,13 @@ def process_block(block_number):
                 tx_data = json.dumps(serialize_web3_tx(dict(tx)))
                 type4_txs.append((tx_hash, block_number, tx_data))
         
-        # Store block information
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO blocks (block_number, tx_count, type4_tx_count, timestamp) VALUES (?, ?, ?, ?)",
-            (block_number, len(transactions), type4_count, block.timestamp)
-        )
-        
-        # Store type=4 transactions
-        if type4_txs:
-            cursor.executemany(
-                "INSERT INTO type4_transactions (tx_hash, block_number, tx_data) VALUES (?, ?, ?)",
-                type4_txs
-            )
-        
-        conn.commit()
+        # Hand block and type=4 transactions to the single writer
+        writer.submit([(block_number, len(transactions), type4_count, block.timestamp)], type4_txs)
         print(f"Block #{block_number}: {len(transactions)} txs, {type4_count} type4")
         return True
     
     except Exception as e:
         print(f"Block #{block_number} error: {str(e)}")
-        conn.rollback()
         return False
 
 def process_block_with_retry(block_number):
@@ -181,21 +167,15 @@ def main():
     
     try:
         # Get latest block number
-        latest_block = random.choice(web3s).eth.block_number
+        with scheduler.request() as req:
+            latest_block = web3_by_url[req.url].eth.block_number
         print(f"Current latest block: {latest_block}")
         
-        # Get all existing block numbers at once
-        existing_blocks = get_existing_blocks(conn)
-        print(f"Found {len(existing_blocks)} existing blocks in database")
-        
-        blocks_needed = []
-        for block_number in range(START_BLOCK, latest_block):
-            if block_number not in existing_blocks:
-                blocks_needed.append(block_number)
-                if len(blocks_needed) > 100000:
-                    break
-        
-        del existing_blocks
+        # 缺口区间直接由 SQL 算出, 不再把已有块号全读进内存
+        ranges = gap_index.missing_ranges(conn, 'blocks', START_BLOCK, latest_block)
+        print(f"Found {len(ranges)} gaps in database")
+
+        blocks_needed = list(gap_index.iter_blocks(ranges, limit=100000))
                 
         print(f"Number of blocks to process: {len(blocks_needed)}")
         time.sleep(1)
@@ -227,6 +207,10 @@ def main():
                     print(f"Error processing block: {e}")
                     error_count += 1
         
+        # 等写线程把尾巴提交掉; 提交失败的块从成功数里挪到失败数
+        writer.close()
+        success_count -= writer.failed_blocks
+        error_count += writer.failed_blocks
         print(f"\nProcessing complete! Success: {success_count}, Failed: {error_count}")
         if len(blocks_needed) < 10000:
             time.sleep(60)
@@ -234,6 +218,7 @@ def main():
     except Exception as e:
         print(f"Program error: {e}")
     finally:
+        writer.close()
         conn.close()
         
     print("\nProgram finished")
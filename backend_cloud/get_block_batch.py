@@ -10,10 +10,16 @@ from collections import Counter
 from hexbytes import HexBytes
 import random
 import argparse
-from concurrent.futures import ThreadPoolExecutor
 import requests
 import os
+import asyncio
+from collections import deque
 import watermark
+import gap_index
+import backfill_planner
+import block_decoder
+from block_writer import BlockWriter
+from endpoint_scheduler import EndpointScheduler
 
 # Add command line argument parsing
 parser = argparse.ArgumentParser(description='Process blockchain transaction data')
@@ -24,7 +30,26 @@ parser.add_argument('--start_block', type=int, help='Starting block number')
 parser.add_argument('--num_threads', type=int, default=4, help='Number of parallel threads')
 parser.add_argument('--block_db_path', type=str, default='', help='block_db_path')
 parser.add_argument('--batch_size', type=int, default=None,
-                    help='Number of blocks per batch request (default: per-chain value from rpc_manager)')
+                    help='Initial blocks per batch request for endpoints without learned limits '
+                         '(default: per-chain value from rpc_manager)')
+parser.add_argument('--max_batch_size', type=int, default=None,
+                    help='Upper bound for adaptive per-endpoint batch size (default: 4x initial)')
+parser.add_argument('--async_fetch', action='store_true',
+                    help='Fetch with asyncio + keep-alive connection pools instead of OS threads (requires aiohttp)')
+parser.add_argument('--max_inflight', type=int, default=8,
+                    help='Upper bound for adaptive in-flight batch requests per endpoint in --async_fetch mode')
+parser.add_argument('--commit_interval', type=float, default=2.0,
+                    help='Seconds the single writer groups fetched batches into one transaction')
+parser.add_argument('--compact_type4', action='store_true',
+                    help='Store type4 txs as typed columns + zlib blob (see type4_codec) and migrate old rows when idle')
+parser.add_argument('--follow', action='store_true',
+                    help='Run as a long-lived follower: keep endpoints and gap state in memory and poll for new heads')
+parser.add_argument('--poll_interval', type=float, default=2.0,
+                    help='Seconds between eth_blockNumber polls once caught up in --follow mode')
+parser.add_argument('--rescan_interval', type=int, default=600,
+                    help='Seconds between full gap rescans of the db in --follow mode')
+parser.add_argument('--reprobe_interval', type=int, default=1800,
+                    help='Seconds between endpoint re-discovery in --follow mode (auto-discovered endpoints only)')
 parser.add_argument('--stats_url', type=str, default='http://127.0.0.1:5000',
                     help='syncer_server URL for reporting in-memory stats (empty string to disable)')
 
@@ -36,6 +61,16 @@ START_BLOCK = args.start_block
 NUM_THREADS = args.num_threads
 BLOCK_DB_PATH = args.block_db_path
 BATCH_SIZE = args.batch_size
+MAX_BATCH_SIZE = args.max_batch_size
+ASYNC_FETCH = args.async_fetch
+MAX_INFLIGHT = args.max_inflight
+COMMIT_INTERVAL = args.commit_interval
+COMPACT_TYPE4 = args.compact_type4
+FOLLOW = args.follow
+POLL_INTERVAL = args.poll_interval
+RESCAN_INTERVAL = args.rescan_interval
+REPROBE_INTERVAL = args.reprobe_interval
+AUTO_DISCOVER = not WEB3_ENPOINTS
 
 import rpc_manager
 
@@ -43,6 +78,11 @@ if BATCH_SIZE is None:
     BATCH_SIZE = rpc_manager.get_batch_size(NAME)
     print(f"Using per-chain default batch size: {BATCH_SIZE}")
 
+# 每端点的批大小/并发度从这里起步, 运行中按 AIMD 调整并落盘供下次使用
+limits = rpc_manager.EndpointLimits(NAME, initial_batch_size=BATCH_SIZE,
+                                    max_batch_size=MAX_BATCH_SIZE,
+                                    max_concurrency=MAX_INFLIGHT if ASYNC_FETCH else NUM_THREADS)
+
 if not WEB3_ENPOINTS:
     # 自动发现存活且支持批量请求的端点
     WEB3_ENPOINTS = rpc_manager.get_alive_endpoints(NAME, require_batch=True)
@@ -83,8 +123,10 @@ def flush_stats():
             STATS[key] = 0
     if not any(snapshot.values()):
         return
+    # 端点指标是当前值而非增量, 随每次上报整体带上
+    payload = {**snapshot, 'endpoints': scheduler.snapshot()}
     try:
-        requests.post(f'{STATS_URL}/{NAME}/report_stats', json=snapshot,
+        requests.post(f'{STATS_URL}/{NAME}/report_stats', json=payload,
                       headers={**STATS_HEADERS, 'Content-Type': 'application/json'},
                       timeout=5)
     except Exception:
@@ -103,17 +145,36 @@ block_db_path = f'{NAME}_block.db'
 if BLOCK_DB_PATH != '':
     block_db_path = f'{BLOCK_DB_PATH}/{NAME}_block.db'
 
-web3s = [
-    Web3(Web3.HTTPProvider(endpoint, request_kwargs={'timeout': 10})) for endpoint in WEB3_ENPOINTS
-]
+def make_web3(endpoint):
+    web3 = Web3(Web3.HTTPProvider(endpoint, request_kwargs={'timeout': 10}))
+    if NAME == 'bsc' or NAME == 'scroll':
+        from web3.middleware import ExtraDataToPOAMiddleware
+        web3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+    return web3
+
+web3s = [make_web3(endpoint) for endpoint in WEB3_ENPOINTS]
+web3_by_url = dict(zip(WEB3_ENPOINTS, web3s))
+
+# 按延迟/成功率/在途数给每个请求挑端点, 连续失败的端点暂时罚站
+scheduler = EndpointScheduler(WEB3_ENPOINTS)
+
+# 当前的 ShardQueue, 写者提交后据此推进分片进度和水位线
+current_work = None
+
+# 本进程最近一次读到/推进的水位线, 用来发现 wrong_block 在运行中回退了水位线
+last_watermark = None
 
-# Create thread-local storage
-thread_local = threading.local()
+def on_block_commit(block_rows):
+    stats_add(blocks=len(block_rows))
+    if current_work is not None:
+        current_work.committed([row[0] for row in block_rows])
 
-if NAME == 'bsc' or NAME == 'scroll':
-    from web3.middleware import ExtraDataToPOAMiddleware
-    for i in range(len(web3s)):
-        web3s[i].middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+def open_writer():
+    # 所有抓取线程/协程共用的唯一写者, 提交成功后才计入 blocks_added
+    return BlockWriter(block_db_path, commit_interval=COMMIT_INTERVAL,
+                       on_commit=on_block_commit, compact=COMPACT_TYPE4)
+
+writer = open_writer()
 
 # Helper function: handle JSON serialization of HexBytes objects
 def serialize_web3_tx(tx_dict):
@@ -132,12 +193,6 @@ def serialize_web3_tx(tx_dict):
             result[key] = value
     return result
 
-# Get thread-local database connection
-def get_db_connection():
-    if not hasattr(thread_local, "db_connection"):
-        thread_local.db_connection = sqlite3.connect(block_db_path)
-    return thread_local.db_connection
-
 # Initialize database
 def init_db():
     conn = sqlite3.connect(block_db_path)
@@ -185,165 +240,451 @@ def init_db():
     return conn
 
 
-# Get all existing block numbers from database
-def get_existing_blocks(conn, from_block):
-    cursor = conn.cursor()
-    cursor.execute("SELECT block_number FROM blocks WHERE block_number >= ?", (from_block,))
-    existing_blocks = set(row[0] for row in cursor.fetchall())
-    return existing_blocks
+def build_batch_payload(block_numbers):
+    """eth_getBlockByNumber 批量请求体, id 直接用块号方便对账"""
+    return [{
+        'jsonrpc': '2.0',
+        'method': 'eth_getBlockByNumber',
+        'params': [hex(block_number), True],  # True for full transactions
+        'id': block_number
+    } for block_number in block_numbers]
 
-# Process and store block information in batch
-def process_block_batch(block_numbers):
+def parse_batch_response(response_data, endpoint_url):
     """
-    Batch process multiple blocks using JSON-RPC batch requests
-    :param block_numbers: List of block numbers to process
-    :return: True if all blocks processed successfully, False otherwise
+    Parse a JSON-RPC batch response into rows ready for insertion
+    :param response_data: Decoded JSON response (list or single object); blocks decoded by
+                          block_decoder carry only type4 txs plus the total count
+    :param endpoint_url: Endpoint the response came from (for logging)
+    :return: (all_block_data, all_type4_txs), or None if the batch must be rejected
+    """
+    # Handle case where response might be a single object or a list
+    if isinstance(response_data, dict):
+        response_data = [response_data]
+
+    all_block_data = []
+    all_type4_txs = []
+
+    for block_resp in response_data:
+        if not isinstance(block_resp, dict):
+            print(f"Unexpected response format: {type(block_resp)}")
+            continue
+
+        if 'result' not in block_resp or block_resp['result'] is None:
+            block_number = block_resp.get('id', 'unknown')
+            print(f"Block #{block_number} not found in response")
+            continue
+
+        block_data = block_resp['result']
+        block_number = int(block_data['number'], 16)
+        timestamp = int(block_data['timestamp'], 16)
+        transactions = block_data.get('transactions', [])
+        tx_count = block_data.get(block_decoder.TX_COUNT_KEY, len(transactions))
+
+        # Calculate number of type=4 transactions
+        type4_count = 0
+        for tx in transactions:
+            tx_type = int(tx.get('type', '0x0'), 16)
+            if tx_type == 4:
+                # 部分公共节点返回的 type4 交易缺 authorizationList (脏数据),
+                # 整批拒收, 让重试机制换节点再抓
+                if 'authorizationList' not in tx:
+                    print(f"Dirty type4 tx without authorizationList in block "
+                          f"#{block_number} from {endpoint_url}, rejecting batch")
+                    return None
+                type4_count += 1
+                tx_hash = tx['hash']
+                # Store transaction data as JSON
+                tx_data = json.dumps(tx)
+                all_type4_txs.append((tx_hash, block_number, tx_data))
+
+        # Collect block information
+        all_block_data.append((block_number, tx_count, type4_count, timestamp))
+        print(f"Block #{block_number}: {tx_count} txs, {type4_count} type4")
+
+    return all_block_data, all_type4_txs
+
+def acquire_endpoint():
+    """由调度器挑还有并发余量的最优端点并占住槽位, 都满了返回 None"""
+    return scheduler.acquire(accept=limits.acquire)
+
+def fetch_block_batch(endpoint_url, block_numbers):
+    """
+    Fetch and parse one batch with a JSON-RPC batch request
+    :param endpoint_url: Endpoint to query
+    :param block_numbers: List of block numbers to fetch
+    :return: (parsed, error_kind); error_kind is None on success, otherwise one of
+             rate_limited / server_error / timeout / dirty / error
     """
-    if not block_numbers:
-        return True
-    
-    conn = get_db_connection()
     try:
-        # Select a web3 instance and get its endpoint URL
-        web3_instance = random.choice(web3s)
-        endpoint_url = web3_instance.provider.endpoint_uri
-        
-        # Prepare batch requests
-        batch_requests = []
-        for block_number in block_numbers:
-            batch_requests.append({
-                'jsonrpc': '2.0',
-                'method': 'eth_getBlockByNumber',
-                'params': [hex(block_number), True],  # True for full transactions
-                'id': block_number
-            })
-        
-        # Send batch request using requests library
         response = requests.post(
             endpoint_url,
-            json=batch_requests,
+            json=build_batch_payload(block_numbers),
             headers={'Content-Type': 'application/json'},
             timeout=30
         )
+        if response.status_code == 429:
+            print(f"Rate limited by {endpoint_url}")
+            return None, 'rate_limited'
+        if response.status_code >= 500:
+            print(f"HTTP {response.status_code} from {endpoint_url} for blocks {block_numbers[0]}-{block_numbers[-1]}")
+            return None, 'server_error'
         response.raise_for_status()
-        
-        # Parse response
-        response_data = response.json()
-        
-        # Handle case where response might be a single object or a list
-        if isinstance(response_data, dict):
-            response_data = [response_data]
-        
-        # Process each block response
-        all_block_data = []
-        all_type4_txs = []
-        
-        for block_resp in response_data:
-            if not isinstance(block_resp, dict):
-                print(f"Unexpected response format: {type(block_resp)}")
-                continue
-                
-            if 'result' not in block_resp or block_resp['result'] is None:
-                block_number = block_resp.get('id', 'unknown')
-                print(f"Block #{block_number} not found in response")
-                continue
-            
-            block_data = block_resp['result']
-            block_number = int(block_data['number'], 16)
-            timestamp = int(block_data['timestamp'], 16)
-            transactions = block_data.get('transactions', [])
-            
-            # Calculate number of type=4 transactions
-            type4_count = 0
-            for tx in transactions:
-                tx_type = int(tx.get('type', '0x0'), 16)
-                if tx_type == 4:
-                    # 部分公共节点返回的 type4 交易缺 authorizationList (脏数据),
-                    # 整批拒收, 让重试机制换节点再抓
-                    if 'authorizationList' not in tx:
-                        print(f"Dirty type4 tx without authorizationList in block "
-                              f"#{block_number} from {endpoint_url}, rejecting batch")
-                        stats_add(fail=1)
-                        return False
-                    type4_count += 1
-                    tx_hash = tx['hash']
-                    # Store transaction data as JSON
-                    tx_data = json.dumps(tx)
-                    all_type4_txs.append((tx_hash, block_number, tx_data))
-            
-            # Collect block information
-            all_block_data.append((block_number, len(transactions), type4_count, timestamp))
-            print(f"Block #{block_number}: {len(transactions)} txs, {type4_count} type4")
-        
-        # Batch insert into database - single commit
-        cursor = conn.cursor()
-        if all_block_data:
-            cursor.executemany(
-                "INSERT INTO blocks (block_number, tx_count, type4_tx_count, timestamp) VALUES (?, ?, ?, ?)",
-                all_block_data
-            )
-        
-        if all_type4_txs:
-            cursor.executemany(
-                "INSERT INTO type4_transactions (tx_hash, block_number, tx_data) VALUES (?, ?, ?)",
-                all_type4_txs
-            )
-        
-        conn.commit()
-        print(f"Batch committed: {len(all_block_data)} blocks")
-        stats_add(blocks=len(all_block_data), ok=1)
-        return True
-
-    except requests.exceptions.RequestException as e:
+        # 只解出 type4 交易, 其余交易只计数
+        response_data = block_decoder.decode_batch(response.content)
+    except requests.exceptions.Timeout:
+        print(f"Timeout for blocks {block_numbers[0]}-{block_numbers[-1]} from {endpoint_url}")
+        return None, 'timeout'
+    except (requests.exceptions.RequestException, ValueError) as e:
         print(f"Network error for blocks {block_numbers[0]}-{block_numbers[-1]}: {str(e)}")
-        conn.rollback()
-        stats_add(fail=1)
-        return False
+        return None, 'error'
+    return parse_fetched(response_data, endpoint_url, block_numbers)
+
+def parse_fetched(response_data, endpoint_url, block_numbers):
+    """fetch_block_batch 的解析部分, 同步/异步共用"""
+    try:
+        parsed = parse_batch_response(response_data, endpoint_url)
     except Exception as e:
         print(f"Batch processing error for blocks {block_numbers[0]}-{block_numbers[-1]}: {str(e)}")
-        conn.rollback()
+        return None, 'error'
+    if parsed is None:
+        return None, 'dirty'
+    return parsed, None
+
+# 各端点返回过的最高块: 高于它且在链头附近的 null 是该端点还没同步到, 不是过载
+ENDPOINT_HEADS = {}
+TIP_NULL_WINDOW = 64
+TIP_RETRY_DELAY = 1.0
+
+def split_tip_nulls(work, endpoint_url, returned, missing):
+    """
+    null 的块分成两类
+    :return: (not_yet, nulls); not_yet 是高于该端点已知最高块、且离本轮链头不到 TIP_NULL_WINDOW 的块
+    """
+    head = max(returned, default=0)
+    if head > ENDPOINT_HEADS.get(endpoint_url, 0):
+        ENDPOINT_HEADS[endpoint_url] = head
+    head = ENDPOINT_HEADS.get(endpoint_url, 0)
+    if work.end is None:
+        return [], missing
+    tip_floor = work.end - TIP_NULL_WINDOW
+    not_yet = [item for item in missing if item[0] > head and item[0] >= tip_floor]
+    nulls = [item for item in missing if not (item[0] > head and item[0] >= tip_floor)]
+    return not_yet, nulls
+
+def handle_fetch_result(work, endpoint_url, items, parsed, error_kind, latency):
+    """
+    一次抓取的结果记账: 反馈给调度器和 limits, 成功的块标记完成, 其余放回队列
+    :return: 需要交给写者的 (all_block_data, all_type4_txs), 没有则 None
+    """
+    if parsed is None:
+        scheduler.release(endpoint_url, ok=False, kind=error_kind)
         stats_add(fail=1)
+        # 脏数据是节点数据质量问题, 跟批大小/并发度无关
+        if error_kind != 'dirty':
+            limits.on_failure(endpoint_url, error_kind)
+        work.retry(items)
+        return None
+
+    all_block_data, all_type4_txs = parsed
+    stats_add(ok=1)
+    returned = {row[0] for row in all_block_data}
+    missing = [item for item in items if item[0] not in returned]
+    # follow 模式追上链头时, 节点还没出到的块返回 null 是常态: 等一会儿放回队列再取,
+    # 不让 limits 砍批大小
+    not_yet, nulls = split_tip_nulls(work, endpoint_url, returned, missing)
+    if not_yet:
+        work.retry(not_yet, delay=TIP_RETRY_DELAY)
+    if nulls:
+        # 部分或整批 null: 常见于批太大被节点截断, 或者节点落后
+        scheduler.release(endpoint_url, ok=False, latency=latency, kind='null')
+        limits.on_failure(endpoint_url, 'null')
+        work.retry(nulls)
+    else:
+        scheduler.release(endpoint_url, ok=True, latency=latency)
+        if returned:
+            limits.on_success(endpoint_url, latency)
+    work.done([item for item in items if item[0] in returned], endpoint_url)
+    return all_block_data, all_type4_txs
+
+def block_fetch_worker(work):
+    """抓取线程: 挑端点 -> 按该端点批大小取块 -> 抓取 -> 结果交给写者"""
+    while not work.finished():
+        endpoint_url = acquire_endpoint()
+        if endpoint_url is None:
+            time.sleep(0.05)
+            continue
+        rows = None
+        try:
+            items = work.take(limits.batch_size(endpoint_url), endpoint_url)
+            if not items:
+                # 队列暂时空了, 但别的线程还有在途批次, 失败的会被放回来
+                scheduler.cancel(endpoint_url)
+                time.sleep(0.2)
+                continue
+            started = time.monotonic()
+            parsed, error_kind = fetch_block_batch(endpoint_url, [block_number for block_number, _ in items])
+            rows = handle_fetch_result(work, endpoint_url, items, parsed, error_kind,
+                                       time.monotonic() - started)
+        finally:
+            limits.release(endpoint_url)
+        if rows:
+            # 交给写线程攒批提交, 本线程马上去抓下一批
+            writer.submit(*rows)
+        limits.maybe_save()
+
+# ---- asyncio 抓取模式 (--async_fetch) ----
+# 开 端点数 x MAX_INFLIGHT 个协程, 共用一个 keep-alive 连接池, 每批由调度器挑端点,
+# 实际在途数由各端点学到的并发度限制, 不再受 OS 线程数限制; 解析好的结果统一交给唯一的写库协程,
+# 由它转交 BlockWriter 攒批提交, 抓取协程不碰 SQLite。
+
+async def fetch_block_batch_async(session, endpoint_url, block_numbers):
+    """异步版 fetch_block_batch, 返回值相同"""
+    try:
+        async with session.post(endpoint_url, json=build_batch_payload(block_numbers),
+                                headers={'Content-Type': 'application/json'}) as response:
+            if response.status == 429:
+                print(f"Rate limited by {endpoint_url}")
+                return None, 'rate_limited'
+            if response.status >= 500:
+                print(f"HTTP {response.status} from {endpoint_url} for blocks {block_numbers[0]}-{block_numbers[-1]}")
+                return None, 'server_error'
+            response.raise_for_status()
+            body = await response.read()
+        response_data = block_decoder.decode_batch(body)
+    except asyncio.TimeoutError:
+        print(f"Async timeout for blocks {block_numbers[0]}-{block_numbers[-1]} from {endpoint_url}")
+        return None, 'timeout'
+    except Exception as e:
+        print(f"Async fetch error for blocks {block_numbers[0]}-{block_numbers[-1]} "
+              f"from {endpoint_url}: {e}")
+        return None, 'error'
+    return parse_fetched(response_data, endpoint_url, block_numbers)
+
+async def async_fetch_worker(session, work, write_queue):
+    """一个在途槽位: 每批都由调度器挑端点, 端点并发度满了就原地等待"""
+    while not work.finished():
+        endpoint_url = acquire_endpoint()
+        if endpoint_url is None:
+            await asyncio.sleep(0.05)
+            continue
+        rows = None
+        try:
+            items = work.take(limits.batch_size(endpoint_url), endpoint_url)
+            if not items:
+                scheduler.cancel(endpoint_url)
+                await asyncio.sleep(0.2)
+                continue
+            started = time.monotonic()
+            parsed, error_kind = await fetch_block_batch_async(
+                session, endpoint_url, [block_number for block_number, _ in items])
+            rows = handle_fetch_result(work, endpoint_url, items, parsed, error_kind,
+                                       time.monotonic() - started)
+        finally:
+            limits.release(endpoint_url)
+        if rows:
+            await write_queue.put(rows)
+        limits.maybe_save()
+
+async def async_block_writer(write_queue, work, total_blocks):
+    """唯一的写库协程: 把解析结果转交 BlockWriter (队列满时阻塞放到线程里, 不卡事件循环)"""
+    loop = asyncio.get_running_loop()
+    batches_written = 0
+    while True:
+        item = await write_queue.get()
+        if item is None:
+            break
+        all_block_data, all_type4_txs = item
+        await loop.run_in_executor(None, writer.submit, all_block_data, all_type4_txs)
+        batches_written += 1
+        if batches_written % 10 == 0:
+            print(f"Processed {work.success + work.error}/{total_blocks} blocks "
+                  f"({batches_written} batches queued)...")
+
+async def process_blocks_async(work, total_blocks):
+    """--async_fetch 入口, 跑完时 work 里的块要么完成要么放弃"""
+    try:
+        import aiohttp
+    except ImportError:
+        print("--async_fetch requires aiohttp (pip install aiohttp)")
+        work.error += total_blocks
+        return
+
+    # 写库跟不上时给抓取侧施加背压, 避免解析结果在内存里无限堆积
+    write_queue = asyncio.Queue(maxsize=len(WEB3_ENPOINTS) * MAX_INFLIGHT)
+
+    connector = aiohttp.TCPConnector(limit=0, limit_per_host=MAX_INFLIGHT,
+                                     keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=30)
+    write_task = asyncio.create_task(async_block_writer(write_queue, work, total_blocks))
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        workers = [
+            asyncio.create_task(async_fetch_worker(session, work, write_queue))
+            for _ in range(len(WEB3_ENPOINTS) * MAX_INFLIGHT)
+        ]
+        await asyncio.gather(*workers)
+    await write_queue.put(None)
+    await write_task
+
+def advance_watermark(db_dir, block):
+    """靠前分片全部落库后由 ShardQueue 回调 (写线程里), 发现水位线被外部回退时返回 False 停止推进"""
+    global last_watermark
+    current = watermark.read_watermark(db_dir, NAME)
+    if last_watermark is not None and (current is None or current < last_watermark):
+        print(f"Watermark rolled back to {current} during backfill, stop advancing until rescan")
         return False
+    watermark.write_watermark(db_dir, NAME, block)
+    last_watermark = block
+    return True
 
-def process_block_batch_with_retry(block_numbers):
+def plan_blocks(conn, latest_block, db_dir):
     """
-    Retry mechanism for batch processing with binary split on failure
-    :param block_numbers: List of block numbers to process
-    :return: True if successful, False otherwise
+    从水位线起扫库找缺口, 顺带推进水位线, 整个缺口交给分片队列 (不再设单轮上限)
+    :return: ShardQueue
     """
-    if not block_numbers:
-        return True
-    
-    # Try processing the batch with retries
-    max_retries = 3
-    for retry in range(max_retries):
-        if process_block_batch(block_numbers):
-            return True
-        else:
-            if retry < max_retries - 1:
-                print(f"Retrying batch {block_numbers[0]}-{block_numbers[-1]}, attempt {retry+1}/{max_retries}")
-    
-    # If all retries failed, use binary split
-    print(f"All retries failed for batch {block_numbers[0]}-{block_numbers[-1]}")
-    
-    # If only one block, cannot split further - fail
-    if len(block_numbers) == 1:
-        print(f"Failed to process single block #{block_numbers[0]}, skipping...")
-        return False
-    
-    # Binary split: divide the batch into two halves
-    mid = len(block_numbers) // 2
-    left_half = block_numbers[:mid]
-    right_half = block_numbers[mid:]
-    
-    print(f"Binary splitting batch into {len(left_half)} + {len(right_half)} blocks")
-    
-    # Process both halves sequentially (recursive)
-    result_left = process_block_batch_with_retry(left_half)
-    result_right = process_block_batch_with_retry(right_half)
-    
-    # Return True only if both halves succeed
-    return result_left and result_right
+    global current_work, last_watermark
+    # 水位线: 之前某次遍历已确认连续无缺口的最高块, 直接从它后面开始扫
+    wm = watermark.read_watermark(db_dir, NAME)
+    effective_start = START_BLOCK
+    if wm is not None and wm + 1 > effective_start:
+        effective_start = wm + 1
+        print(f"Watermark found: contiguous until {wm}, scanning from {effective_start}")
+
+    # 缺口区间直接由 SQL 算出, 不再把已有块号全读进内存
+    ranges = gap_index.missing_ranges(conn, 'blocks', effective_start, latest_block)
+    missing_count = gap_index.count_blocks(ranges)
+    print(f"Found {len(ranges)} gaps, {missing_count} missing blocks in [{effective_start}, {latest_block})")
+
+    # 顺便推进水位线: 从 effective_start 起连续存在的最高块
+    contiguous = gap_index.contiguous_until(ranges, effective_start, latest_block)
+    if contiguous >= effective_start:
+        watermark.write_watermark(db_dir, NAME, contiguous)
+    last_watermark = watermark.read_watermark(db_dir, NAME)
+
+    # 分片完成后水位线从 effective_start-1 起接着往后推, 重启时从推到的位置续跑
+    current_work = backfill_planner.ShardQueue(
+        ranges, end=latest_block, contiguous_base=effective_start - 1,
+        on_contiguous=lambda block: advance_watermark(db_dir, block))
+    return current_work
+
+def fetch_blocks(work):
+    """跑到 work 里的块全部完成或放弃为止, 结果交给写者"""
+    # 不预先切批: 各端点按自己学到的批大小从自己的分片里取
+    if ASYNC_FETCH:
+        print(f"Starting async fetch: {len(WEB3_ENPOINTS)} endpoints x up to {MAX_INFLIGHT} in-flight batches...")
+        asyncio.run(process_blocks_async(work, work.total))
+    else:
+        print(f"Starting to process blocks in parallel using {NUM_THREADS} threads...")
+        threads = [threading.Thread(target=block_fetch_worker, args=(work,), daemon=True)
+                   for _ in range(NUM_THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=10)
+                if thread.is_alive():
+                    print(f"Processed {work.success + work.error}/{work.total} blocks "
+                          f"({len(work.shards)} shards, contiguous until {work.contiguous})...")
+    return work
+
+def get_latest_block():
+    with scheduler.request() as req:
+        return web3_by_url[req.url].eth.block_number
+
+def reprobe_endpoints():
+    """follow 模式定期重新发现端点, 新端点并入调度器 (掉线的由调度器罚站)"""
+    try:
+        endpoints = rpc_manager.get_alive_endpoints(NAME, require_batch=True)
+    except Exception as e:
+        print(f"Endpoint re-probe failed: {e}")
+        return
+    added = [endpoint for endpoint in endpoints if endpoint not in web3_by_url]
+    for endpoint in added:
+        web3_by_url[endpoint] = make_web3(endpoint)
+        WEB3_ENPOINTS.append(endpoint)
+    if added:
+        scheduler.add_endpoints(added)
+        print(f"Re-probe added {len(added)} endpoints, {len(WEB3_ENPOINTS)} total")
+
+def db_inode():
+    try:
+        return os.stat(block_db_path).st_ino
+    except OSError:
+        return None
+
+def follow():
+    """
+    --follow 常驻模式: 端点池、调度器统计、学到的批大小和缺口状态都留在内存里,
+    追上链头后每 POLL_INTERVAL 秒轮询一次 eth_blockNumber, 新块几秒内入库。
+
+    每 RESCAN_INTERVAL 秒或出现以下情况时才从水位线起重新扫库:
+      - clean_block 轮换了库文件 (inode 变了): 关掉旧写者/连接, 对新文件重开
+      - 水位线被回退 (wrong_block 删块)
+      - 写者有事务提交失败
+    """
+    global writer
+    db_dir = os.path.dirname(os.path.abspath(block_db_path))
+    conn = init_db()
+    inode = db_inode()
+    last_failed = writer.failed_blocks
+    work = None            # 跨轮沿用的分片队列, 新块追加进去, 水位线接着推
+    next_block = None      # 内存里的追块进度, None 表示需要扫库
+    last_rescan = 0
+    last_reprobe = time.time()
+
+    try:
+        while True:
+            try:
+                if db_inode() != inode:
+                    print("Block db was rotated, reopening writer and rescanning")
+                    writer.close()
+                    conn.close()
+                    conn = init_db()
+                    writer = open_writer()
+                    inode = db_inode()
+                    last_failed = 0
+                    next_block = None
+                wm = watermark.read_watermark(db_dir, NAME)
+                if wm is not None and last_watermark is not None and wm < last_watermark:
+                    print(f"Watermark rolled back {last_watermark} -> {wm}, rescanning")
+                    next_block = None
+                if writer.failed_blocks != last_failed:
+                    print("Writer dropped a transaction, rescanning")
+                    last_failed = writer.failed_blocks
+                    next_block = None
+
+                latest_block = get_latest_block()
+                if next_block is None or time.time() - last_rescan >= RESCAN_INTERVAL:
+                    work = plan_blocks(conn, latest_block, db_dir)
+                    last_rescan = time.time()
+                    next_block = latest_block
+                else:
+                    # 上一轮放弃的块重新排队, 链头新出的块追加到队尾
+                    work.requeue_failed()
+                    if latest_block > next_block:
+                        work.extend([(next_block, latest_block - 1)], latest_block)
+                        next_block = latest_block
+
+                idle = work.finished()
+                if not idle:
+                    success, error = work.success, work.error
+                    fetch_blocks(work)
+                    print(f"[follow] head {latest_block}: {work.success - success} fetched, "
+                          f"{work.error - error} failed, contiguous until {work.contiguous}")
+
+                if AUTO_DISCOVER and time.time() - last_reprobe >= REPROBE_INTERVAL:
+                    reprobe_endpoints()
+                    last_reprobe = time.time()
+                limits.maybe_save()
+                if idle:
+                    time.sleep(POLL_INTERVAL)
+            except Exception as e:
+                print(f"Follow loop error: {e}")
+                time.sleep(POLL_INTERVAL)
+    finally:
+        writer.close()
+        limits.save()
+        conn.close()
+        flush_stats()
 
 def main():
     # Initialize database
@@ -351,90 +692,38 @@ def main():
     
     try:
         # Get latest block number
-        latest_block = random.choice(web3s).eth.block_number
+        latest_block = get_latest_block()
         print(f"Current latest block: {latest_block}")
 
-        # 水位线: 之前某次遍历已确认连续无缺口的最高块, 直接从它后面开始扫
         db_dir = os.path.dirname(os.path.abspath(block_db_path))
-        wm = watermark.read_watermark(db_dir, NAME)
-        effective_start = START_BLOCK
-        if wm is not None and wm + 1 > effective_start:
-            effective_start = wm + 1
-            print(f"Watermark found: contiguous until {wm}, scanning from {effective_start}")
-
-        # Get all existing block numbers at once
-        existing_blocks = get_existing_blocks(conn, effective_start)
-        print(f"Found {len(existing_blocks)} existing blocks in database (>= {effective_start})")
-
-        # 顺便推进水位线: 从 effective_start 起连续存在的最高块
-        contiguous = effective_start - 1
-        while contiguous + 1 in existing_blocks:
-            contiguous += 1
-        if contiguous >= effective_start:
-            watermark.write_watermark(db_dir, NAME, contiguous)
-
-        blocks_needed = []
-        for block_number in range(effective_start, latest_block):
-            if block_number not in existing_blocks:
-                blocks_needed.append(block_number)
-                if len(blocks_needed) > 100000:
-                    break
-
-        del existing_blocks
-                
-        print(f"Number of blocks to process: {len(blocks_needed)}")
+        work = plan_blocks(conn, latest_block, db_dir)
+
+        print(f"Number of blocks to process: {work.total}")
         time.sleep(1)
 
-        # Split blocks into batches
-        batches = []
-        for i in range(0, len(blocks_needed), BATCH_SIZE):
-            batch = blocks_needed[i:i + BATCH_SIZE]
-            batches.append(batch)
-        
-        print(f"Split into {len(batches)} batches (batch size: {BATCH_SIZE})")
+        fetch_blocks(work)
+        success_count, error_count = work.success, work.error
 
-        # Use thread pool to process batches in parallel
-        print(f"Starting to process batches in parallel using {NUM_THREADS} threads...")
-        success_count = 0
-        error_count = 0
-        processed_blocks = 0
-        
-        with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
-            futures = []
-            for batch in batches:
-                futures.append(
-                    executor.submit(process_block_batch_with_retry, batch)
-                )
-            
-            # Wait for all tasks to complete
-            for idx, future in enumerate(futures):
-                try:
-                    result = future.result()
-                    batch = batches[idx]
-                    if result:
-                        success_count += len(batch)
-                    else:
-                        error_count += len(batch)
-                    
-                    processed_blocks += len(batch)
-                    if processed_blocks % 100 == 0 or idx % 10 == 0:
-                        print(f"Processed {processed_blocks}/{len(blocks_needed)} blocks ({idx+1}/{len(batches)} batches)...")
-                except Exception as e:
-                    batch = batches[idx]
-                    print(f"Error processing batch: {e}")
-                    error_count += len(batch)
-        
+        # 等写线程把尾巴提交掉; 提交失败的块从成功数里挪到失败数
+        writer.close()
+        success_count -= writer.failed_blocks
+        error_count += writer.failed_blocks
         print(f"\nProcessing complete! Success: {success_count}, Failed: {error_count}")
-        if len(blocks_needed) < 10000:
+        if work.total < 10000:
             time.sleep(60)
         
     except Exception as e:
         print(f"Program error: {e}")
     finally:
+        writer.close()
+        limits.save()
         conn.close()
         flush_stats()
 
     print("\nProgram finished")
 
 if __name__ == "__main__":
-    main() 
+    if FOLLOW:
+        follow()
+    else:
+        main() 
@@ -21,6 +21,7 @@ import rlp
 from eth_utils import keccak
 import argparse
 import os
+import requests
 
 # Add command line argument parsing
 parser = argparse.ArgumentParser(description='Process blockchain transaction data')
@@ -31,6 +32,7 @@ parser.add_argument('--endpoints', nargs='+', default=None,
 parser.add_argument('--num_threads', type=int, default=4, help='Number of parallel threads')
 parser.add_argument('--data_expiry', type=int, default=86400000, help='Data expiry time (seconds)')
 parser.add_argument('--block_db_path', type=str, default='', help='block_db_path')
+parser.add_argument('--batch_size', type=int, default=200, help='Addresses per eth_getCode JSON-RPC batch')
 parser.add_argument('--stats_url', type=str, default='http://127.0.0.1:5000',
                     help='syncer_server base URL for stats reporting (empty to disable)')
 
@@ -43,11 +45,11 @@ WEB3_ENPOINTS = args.endpoints
 NUM_THREADS = args.num_threads
 # Data expiry time (seconds)
 DATA_EXPIRY = args.data_expiry
+# Addresses per JSON-RPC batch (and per db transaction)
+BATCH_SIZE = args.batch_size
 
 BLOCK_DB_PATH = args.block_db_path
 
-from stats_reporter import StatsReporter
-stats = StatsReporter(NAME, 'code', args.stats_url)
 
 if not WEB3_ENPOINTS:
     import rpc_manager
@@ -61,6 +63,14 @@ if not WEB3_ENPOINTS:
 web3s = [
     Web3(Web3.HTTPProvider(endpoint)) for endpoint in WEB3_ENPOINTS
 ]
+web3_by_url = dict(zip(WEB3_ENPOINTS, web3s))
+
+from endpoint_scheduler import EndpointScheduler
+from stats_reporter import StatsReporter
+import code_store
+# 按延迟/成功率/在途数给每个请求挑端点, 连续失败的端点暂时罚站; 端点指标随 stats 上报
+scheduler = EndpointScheduler(WEB3_ENPOINTS)
+stats = StatsReporter(NAME, 'code', args.stats_url, scheduler=scheduler)
 
 block_db_path = f'{NAME}_block.db'
 if BLOCK_DB_PATH != '':
@@ -93,22 +103,63 @@ def get_db_connection():
             last_update_timestamp INTEGER
         )
         ''')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_codes_last_update_timestamp ON codes(last_update_timestamp ASC)')
+        # 增量下载的游标 (last_update_timestamp, 地址) 走这个索引; 它覆盖了原来的单列索引
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_codes_update_cursor ON codes(last_update_timestamp, code_address)')
+        cursor.execute('DROP INDEX IF EXISTS idx_codes_last_update_timestamp')
+        # 字节码按哈希存进 code_blobs, codes 只记 code_hash (旧库在这里迁移)
+        code_store.ensure_schema(thread_local.db_connection)
+        # 每批 code 的暂存表 (TEMP 表按连接隔离, 各线程互不干扰)
+        cursor.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS code_updates (
+            code_address TEXT PRIMARY KEY,
+            code_hash TEXT,
+            code TEXT
+        )
+        ''')
         thread_local.db_connection.commit()
     return thread_local.db_connection
 
-def get_code(code_address):
-    """Get code for specified address"""
+def get_codes(code_addresses):
+    """
+    Get code for a batch of addresses with one JSON-RPC batch of eth_getCode
+    :return: {address: code}; addresses whose call failed are left out and retried next run
+    """
+    payload = [{
+        'jsonrpc': '2.0',
+        'method': 'eth_getCode',
+        'params': [Web3.to_checksum_address(code_address), 'latest'],
+        'id': i
+    } for i, code_address in enumerate(code_addresses)]
     try:
-        # Randomly select a Web3 node
-        web3 = random.choice(web3s)
-        code = web3.eth.get_code(Web3.to_checksum_address(code_address))
-        stats.add(ok=1)
-        return HexBytes(code).hex()
+        # Let the scheduler pick the best endpoint
+        with scheduler.request() as req:
+            response = requests.post(req.url, json=payload,
+                                     headers={'Content-Type': 'application/json'}, timeout=30)
+            if response.status_code == 429:
+                req.fail('rate_limited')
+            response.raise_for_status()
+            response_data = response.json()
     except Exception as e:
-        print(f"Error getting code for address {code_address}: {e}")
+        print(f"Error getting code for {len(code_addresses)} addresses: {e}")
         stats.add(fail=1)
-        return None
+        return {}
+
+    if isinstance(response_data, dict):
+        response_data = [response_data]
+    codes = {}
+    for item in response_data:
+        if not isinstance(item, dict) or not isinstance(item.get('id'), int):
+            continue
+        if 0 <= item['id'] < len(code_addresses) and isinstance(item.get('result'), str):
+            # 和原来 web3.eth.get_code 的结果走同样的转换, 库里的格式保持不变
+            codes[code_addresses[item['id']]] = HexBytes(item['result']).hex()
+    if len(codes) < len(code_addresses):
+        print(f"Missing code for {len(code_addresses) - len(codes)}/{len(code_addresses)} addresses in batch response")
+    if codes:
+        stats.add(ok=1)
+    else:
+        stats.add(fail=1)
+    return codes
 
 def is_data_fresh(code_address):
     """Check if data is within expiry time"""
@@ -127,64 +178,53 @@ def is_data_fresh(code_address):
     
     return False
 
-def update_code(code_address):
-    """Update author address code information"""
+def update_codes(code_addresses):
+    """Update code information for a batch of addresses in one transaction"""
+    conn = None
     try:
-        # Get code
-        code = get_code(code_address)
-        print(f"Got code for address {code_address}: {code[:10]}...")
-        
-        if code is not None:
+        codes = get_codes(code_addresses)
+        print(f"Got code for {len(codes)}/{len(code_addresses)} addresses")
+
+        if codes:
             # Update database
             conn = get_db_connection()
             cursor = conn.cursor()
             current_timestamp = int(time.time())
-            
-            # First, get existing code data from database
-            cursor.execute(
-                """
-                SELECT code, last_update_timestamp 
-                FROM codes WHERE code_address = ?
-                """,
-                (code_address,)
-            )
-            existing_data = cursor.fetchone()
-            
-            # Check if code has changed
-            code_changed = False
-            if existing_data:
-                existing_code, existing_last_update = existing_data
-                
-                # Compare code
-                if existing_code != code:
-                    code_changed = True
-            else:
-                # New address, consider as changed
-                code_changed = True
-            
-            # Determine last_update_timestamp value
-            if code_changed:
-                last_update_timestamp = current_timestamp
-            else:
-                # Keep existing last_update_timestamp if no change
-                last_update_timestamp = existing_data[1] if existing_data else current_timestamp
-            
-            # Insert or update the record
-            cursor.execute(
-                """
-                INSERT INTO codes (code_address, code, timestamp, last_update_timestamp) 
-                VALUES (?, ?, ?, ?) 
-                ON CONFLICT(code_address) 
-                DO UPDATE SET code = ?, timestamp = ?, last_update_timestamp = ?
-                """,
-                (code_address, code, current_timestamp, last_update_timestamp, 
-                 code, current_timestamp, last_update_timestamp)
-            )
+
+            # 整批先进临时表, 再一条语句合并; code 变了 (或新地址) 才刷新 last_update_timestamp
+            # 先拿写锁: 读过主库再升级成写事务时, WAL 下别的写者刚提交过会直接报 database is locked
+            cursor.execute("BEGIN IMMEDIATE")
+            # 字节码先进 code_blobs (同一份只存一次), 暂存表里只剩哈希
+            staged = code_store.stage(conn, codes.items())
+            cursor.execute("DELETE FROM temp.code_updates")
+            cursor.executemany("INSERT OR REPLACE INTO temp.code_updates VALUES (?, ?, ?)", staged)
+            cursor.execute("""
+                SELECT COUNT(*) FROM temp.code_updates AS u
+                JOIN codes AS c ON c.code_address = u.code_address
+                WHERE c.code_hash IS NOT u.code_hash OR c.code IS NOT u.code
+            """)
+            code_changed_count = cursor.fetchone()[0]
+            # (WHERE true: 让 SQLite 把 ON CONFLICT 解析成 upsert 子句而不是 JOIN 约束)
+            cursor.execute("""
+                INSERT INTO codes (code_address, code_hash, code, timestamp, last_update_timestamp)
+                SELECT code_address, code_hash, code, ?, ? FROM temp.code_updates WHERE true
+                ON CONFLICT(code_address) DO UPDATE SET
+                    code_hash = excluded.code_hash,
+                    code = excluded.code,
+                    timestamp = excluded.timestamp,
+                    last_update_timestamp = CASE WHEN codes.code_hash IS NOT excluded.code_hash
+                                                      OR codes.code IS NOT excluded.code
+                                                 THEN excluded.last_update_timestamp
+                                                 ELSE codes.last_update_timestamp END
+            """, (current_timestamp, current_timestamp))
             conn.commit()
-            stats.add(updated=1)
-            print(f"Updated code for address {code_address}: {code[:10]}... (changed: {code_changed})")
+            stats.add(updated=len(codes))
+            print(f"Updated code for {len(codes)} addresses, code changed count: {code_changed_count}")
     except Exception as e:
-        print(f"Error updating address {code_address} information: {e}")
+        # 线程连接是复用的: 不回滚的话写事务一直开着, 这个线程之后每批都会卡在 BEGIN IMMEDIATE
+        if conn is not None and conn.in_transaction:
+            conn.rollback()
+        print(f"Error updating code for {len(code_addresses)} addresses: {e}")
 
 def get_unfresh_code_addresses():
     """Get all code addresses that are not fresh"""
@@ -214,9 +254,10 @@ def main():
     
     with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
         futures = []
-        for address in unfresh_code_addresses:
+        for i in range(0, len(unfresh_code_addresses), BATCH_SIZE):
+            batch = unfresh_code_addresses[i:i+BATCH_SIZE]
             futures.append(
-                executor.submit(update_code, address)
+                executor.submit(update_codes, batch)
             )
         
         # Wait for all tasks to complete
@@ -225,13 +266,18 @@ def main():
                 future.result()
                 success_count += 1
                 if success_count % 100 == 0:
-                    print(f"Processed {success_count} addresses...")
+                    print(f"Processed {success_count} address groups...")
             except Exception as e:
-                print(f"Error processing address: {e}")
+                print(f"Error processing addresses: {e}")
                 error_count += 1
     
     print(f"\nProcessing complete! Success: {success_count}, Failed: {error_count}")
 
+    # 委托目标换了代码后, 旧字节码没人指向了
+    pruned = code_store.prune(get_db_connection())
+    if pruned:
+        print(f"Pruned {pruned} unreferenced code blobs")
+
     stats.flush()
     print("\nProgram finished")
 
@@ -1,8 +1,14 @@
 #!/bin/bash
 # endpoints 省略时由 rpc_manager 自动从 chainlist 缓存中探测存活端点
 # batch_size 省略时使用 rpc_manager.CHAIN_CONFIG 里该链的默认批大小
+# SKIP_BLOCKS=1 时跳过抓块 (follow.sh 模式下由常驻的 --follow 进程负责),
+# 改为 sleep SKIP_SLEEP 秒 (默认 60), 保持 loop.sh 原来的轮询节奏
 
-python3 get_block_batch.py --name gnosis --num_threads 5 --start_block 45140000
+if [ -n "$SKIP_BLOCKS" ]; then
+    sleep "${SKIP_SLEEP:-60}"
+else
+    python3 get_block_batch.py --name gnosis --num_threads 5 --start_block 45140000
+fi
 
 python3 get_tvl.py --name gnosis --contract 0xc86bDf9661c62646194ef29b1b8f5Fe226E8C97E --num_threads 5
 
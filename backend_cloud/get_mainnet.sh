@@ -1,8 +1,14 @@
 #!/bin/bash
 # endpoints 省略时由 rpc_manager 自动从 chainlist 缓存中探测存活端点
 # batch_size 省略时使用 rpc_manager.CHAIN_CONFIG 里该链的默认批大小
+# SKIP_BLOCKS=1 时跳过抓块 (follow.sh 模式下由常驻的 --follow 进程负责),
+# 改为 sleep SKIP_SLEEP 秒 (默认 60), 保持 loop.sh 原来的轮询节奏
 
-python3 get_block_batch.py --name mainnet --num_threads 4 --start_block 24650000
+if [ -n "$SKIP_BLOCKS" ]; then
+    sleep "${SKIP_SLEEP:-60}"
+else
+    python3 get_block_batch.py --name mainnet --num_threads 4 --start_block 24650000
+fi
 
 python3 get_tvl.py --name mainnet --contract 0x042A73966C7C5e8F16107abf1E9bD0448e1476ED --num_threads 4
 
@@ -29,8 +29,25 @@ parser.add_argument('--endpoints', nargs='+', default=None,
                     help='List of Web3 endpoints (omit to auto-discover alive endpoints via rpc_manager)')
 parser.add_argument('--contract', required=True, help='Contract address')
 parser.add_argument('--num_threads', type=int, default=4, help='Number of parallel threads')
-parser.add_argument('--data_expiry', type=int, default=86400, help='Data expiry time (seconds)')
+parser.add_argument('--data_expiry', type=int, default=86400,
+                    help='Refresh interval for cold addresses (seconds)')
+parser.add_argument('--hot_interval', type=int, default=300,
+                    help='Refresh interval for recently active or high-value addresses (seconds)')
+parser.add_argument('--warm_interval', type=int, default=3600,
+                    help='Refresh interval for addresses active or changed within a day (seconds)')
+parser.add_argument('--calls_per_hour', type=int, default=2000,
+                    help='eth_call budget per hour across runs (0 for unlimited)')
 parser.add_argument('--limit', type=int, default=500000, help='Processing limit')
+parser.add_argument('--snapshot', action='store_true',
+                    help='Sweep all addresses with every call pinned to one block; resumes an unfinished snapshot')
+parser.add_argument('--snapshot_block', type=int, default=None,
+                    help='Block to pin the snapshot to (implies --snapshot; default: the unfinished snapshot, '
+                         'else head minus --snapshot_lag)')
+parser.add_argument('--snapshot_lag', type=int, default=5,
+                    help='Blocks behind the head for a new snapshot, so slightly lagging endpoints can serve it')
+parser.add_argument('--snapshot_max_stalled', type=int, default=3,
+                    help='Abandon an unfinished snapshot after this many runs without progress '
+                         '(e.g. its block fell out of the non-archive state window)')
 parser.add_argument('--block_db_path', type=str, default='', help='block_db_path')
 parser.add_argument('--stats_url', type=str, default='http://127.0.0.1:5000',
                     help='syncer_server base URL for stats reporting (empty to disable)')
@@ -47,11 +64,17 @@ NUM_THREADS = args.num_threads
 DATA_EXPIRY = args.data_expiry
 # Processing limit
 LIMIT = args.limit
+HOT_INTERVAL = args.hot_interval
+WARM_INTERVAL = args.warm_interval
+CALLS_PER_HOUR = args.calls_per_hour
+# 快照模式: 一次扫描的所有批次都钉在同一个块上, 每行记下 balance_block
+SNAPSHOT_BLOCK = args.snapshot_block
+SNAPSHOT = args.snapshot or SNAPSHOT_BLOCK is not None
+SNAPSHOT_LAG = args.snapshot_lag
+SNAPSHOT_MAX_STALLED = args.snapshot_max_stalled
 
 BLOCK_DB_PATH = args.block_db_path
 
-from stats_reporter import StatsReporter
-stats = StatsReporter(NAME, 'tvl', args.stats_url)
 
 if not WEB3_ENPOINTS:
     import rpc_manager
@@ -67,6 +90,15 @@ if not WEB3_ENPOINTS:
 web3s = [
     Web3(Web3.HTTPProvider(endpoint)) for endpoint in WEB3_ENPOINTS
 ]
+web3_by_url = dict(zip(WEB3_ENPOINTS, web3s))
+
+from endpoint_scheduler import EndpointScheduler
+from stats_reporter import StatsReporter
+import tvl_scheduler
+import balance_units
+# 按延迟/成功率/在途数给每个请求挑端点, 连续失败的端点暂时罚站; 端点指标随 stats 上报
+scheduler = EndpointScheduler(WEB3_ENPOINTS)
+stats = StatsReporter(NAME, 'tvl', args.stats_url, scheduler=scheduler)
 
 block_db_path = f'{NAME}_block.db'
 if BLOCK_DB_PATH != '':
@@ -166,6 +198,10 @@ def ecrecover(auth):
     
     return recovered_address
 
+# 任一余额与库里不同即算变化 (IS NOT: NULL 也能正确比较)
+BALANCE_CHANGED_SQL = ' OR '.join(
+    f'{{old}}.{column} IS NOT {{new}}.{column}' for column in balance_units.BALANCE_COLUMNS)
+
 def get_db_connection():
     """Get thread-local database connection"""
     if not hasattr(thread_local, "db_connection"):
@@ -181,47 +217,78 @@ def get_db_connection():
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS author_balances (
             author_address TEXT PRIMARY KEY,
-            eth_balance TEXT,
-            weth_balance TEXT,
-            wbtc_balance TEXT,
-            usdt_balance TEXT,
-            usdc_balance TEXT,
-            dai_balance TEXT,
+            eth_balance INTEGER,
+            weth_balance INTEGER,
+            wbtc_balance INTEGER,
+            usdt_balance INTEGER,
+            usdc_balance INTEGER,
+            dai_balance INTEGER,
             timestamp INTEGER,
             last_update_timestamp INTEGER
         )
         ''')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_author_balances_last_update_timestamp ON author_balances(last_update_timestamp ASC)')
+        # 旧库的文本余额列一次性转成定点整数列
+        balance_units.ensure_schema(thread_local.db_connection, NAME)
+        # 增量下载的游标 (last_update_timestamp, 地址) 走这个索引; 它覆盖了原来的单列索引
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_author_balances_update_cursor ON author_balances(last_update_timestamp, author_address)')
+        cursor.execute('DROP INDEX IF EXISTS idx_author_balances_last_update_timestamp')
+        # 每批余额的暂存表 (TEMP 表按连接隔离, 各线程互不干扰)
+        cursor.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS balance_updates (
+            author_address TEXT PRIMARY KEY,
+            eth_balance INTEGER,
+            weth_balance INTEGER,
+            wbtc_balance INTEGER,
+            usdt_balance INTEGER,
+            usdc_balance INTEGER,
+            dai_balance INTEGER
+        )
+        ''')
+        # 余额对应的块号: 快照模式下是钉住的块, 平时按 latest 查询, 留空
+        cursor.execute("PRAGMA table_info(author_balances)")
+        if 'balance_block' not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE author_balances ADD COLUMN balance_block INTEGER")
+        # 快照记录: 未完成 (finished_at 为空) 的快照下次 --snapshot 时在同一块上续跑
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tvl_snapshots (
+            block_number INTEGER PRIMARY KEY,
+            started_at INTEGER,
+            finished_at INTEGER,
+            refreshed INTEGER
+        )
+        ''')
+        # 续跑保护: 连续无进展的次数 / 放弃时间 (块已超出非归档节点的状态窗口时放弃, 换新块重来)
+        cursor.execute("PRAGMA table_info(tvl_snapshots)")
+        snapshot_columns = [row[1] for row in cursor.fetchall()]
+        if 'stalled_runs' not in snapshot_columns:
+            cursor.execute("ALTER TABLE tvl_snapshots ADD COLUMN stalled_runs INTEGER DEFAULT 0")
+        if 'abandoned_at' not in snapshot_columns:
+            cursor.execute("ALTER TABLE tvl_snapshots ADD COLUMN abandoned_at INTEGER")
         thread_local.db_connection.commit()
+        tvl_scheduler.ensure_schema(thread_local.db_connection)
     return thread_local.db_connection
 
-def get_address_balances(author_addresses):
-    """Query token balances for specified address list"""
+def get_address_balances(author_addresses, block_identifier='latest'):
+    """Query token balances for specified address list at the given block"""
     try:
-        # Randomly select a Web3 node
-        web3 = random.choice(web3s)
-        
-        # Create contract instance
-        contract = web3.eth.contract(address=CONTRACT_ADDRESS, abi=CONTRACT_ABI)
-        
         # Convert addresses to checksum format
         checksum_addresses = [Web3.to_checksum_address(addr) for addr in author_addresses]
-        
-        # Call contract to get all token balances
-        result = contract.functions.get(checksum_addresses).call()
+
+        # Let the scheduler pick the best Web3 node
+        with scheduler.request() as req:
+            # Create contract instance
+            contract = web3_by_url[req.url].eth.contract(address=CONTRACT_ADDRESS, abi=CONTRACT_ABI)
+
+            # Call contract to get all token balances
+            result = contract.functions.get(checksum_addresses).call(block_identifier=block_identifier)
         
         # Parse results
         balances = []
         for i, balance_data in enumerate(result):
-            balances.append({
-                'address': author_addresses[i],
-                'eth_balance': str(balance_data[0] / (10 ** 18)),
-                'weth_balance': str(balance_data[1] / (10 ** 18)),
-                'wbtc_balance': str(balance_data[2] / (10 ** 8)),  # WBTC uses 8 decimals
-                'usdt_balance': str(balance_data[3] / (10 ** 6)),
-                'usdc_balance': str(balance_data[4] / (10 ** 6)),
-                'dai_balance': str(balance_data[5] / (10 ** 18)),
-            })
+            # 定点整数 (见 balance_units), 不再经过浮点
+            balance = dict(zip(balance_units.BALANCE_COLUMNS, balance_units.to_fixed_row(NAME, balance_data)))
+            balance['address'] = author_addresses[i]
+            balances.append(balance)
 
         stats.add(ok=1)
         return balances
@@ -230,24 +297,125 @@ def get_address_balances(author_addresses):
         stats.add(fail=1)
         return []
 
+def recover_authorizer(authorization):
+    """授权人地址 (小写, 与 info 库一致), 签名坏的返回 None"""
+    try:
+        return ecrecover(dict(authorization)).lower()
+    except Exception:
+        return None
+
 def get_unfresh_author_addresses():
-    """Get all author addresses that are not fresh"""
+    """Get the addresses due for a refresh, most urgent first, within this hour's eth_call budget"""
+    conn = get_db_connection()
+    now = int(time.time())
+    tvl_scheduler.scan_activity(conn, block_db_path, recover_authorizer, now)
+    limit = LIMIT
+    remaining = tvl_scheduler.remaining_calls(conn, now, CALLS_PER_HOUR)
+    if remaining is not None:
+        limit = min(limit, remaining * tvl_scheduler.ADDRESSES_PER_CALL)
+        print(f"eth_call budget: {remaining}/{CALLS_PER_HOUR} calls left this hour")
+    return tvl_scheduler.due_addresses(conn, NAME, now, limit, HOT_INTERVAL, WARM_INTERVAL, DATA_EXPIRY)
+
+def snapshot_state_available(snapshot_block):
+    """端点是否还能按该块查询状态 (非归档节点只保留最近一百多块的状态); 换端点试 3 次, 偶发失败不算"""
+    for attempt in range(3):
+        try:
+            with scheduler.request() as req:
+                web3_by_url[req.url].eth.get_balance(Web3.to_checksum_address(CONTRACT_ADDRESS),
+                                                     block_identifier=snapshot_block)
+            return True
+        except Exception as e:
+            print(f"State at block {snapshot_block} not available: {e}")
+    return False
+
+def abandon_snapshot(conn, snapshot_block, reason):
+    conn.execute("UPDATE tvl_snapshots SET abandoned_at = ? WHERE block_number = ?",
+                 (int(time.time()), snapshot_block))
+    conn.commit()
+    print(f"WARNING: abandoning snapshot at block {snapshot_block} ({reason}), starting a new one")
+
+def start_snapshot():
+    """确定本次快照钉住的块: 指定的块 > 未完成的快照 > 链头往回 SNAPSHOT_LAG 块"""
+    conn = get_db_connection()
+    if SNAPSHOT_BLOCK is not None:
+        snapshot_block = SNAPSHOT_BLOCK
+        # 显式指定的块查不到状态就直接失败, 不要空跑一遍
+        if not snapshot_state_available(snapshot_block):
+            raise SystemExit(f"Endpoints cannot serve state at block {snapshot_block}; "
+                             f"use an archive endpoint or a more recent --snapshot_block")
+    else:
+        row = conn.execute("SELECT block_number, stalled_runs FROM tvl_snapshots "
+                           "WHERE finished_at IS NULL AND abandoned_at IS NULL "
+                           "ORDER BY started_at DESC LIMIT 1").fetchone()
+        snapshot_block = None
+        if row:
+            # 续跑前确认这个块的状态还查得到; 查不到或连续多次没进展就放弃, 从新的块重来
+            if (row[1] or 0) >= SNAPSHOT_MAX_STALLED:
+                abandon_snapshot(conn, row[0], f"no progress in {row[1]} runs")
+            elif not snapshot_state_available(row[0]):
+                abandon_snapshot(conn, row[0], "state no longer served")
+            else:
+                snapshot_block = row[0]
+                print(f"Resuming unfinished snapshot at block {snapshot_block}")
+        if snapshot_block is None:
+            with scheduler.request() as req:
+                snapshot_block = web3_by_url[req.url].eth.block_number - SNAPSHOT_LAG
+    conn.execute("INSERT OR IGNORE INTO tvl_snapshots (block_number, started_at, refreshed) VALUES (?, ?, 0)",
+                 (snapshot_block, int(time.time())))
+    conn.commit()
+    return snapshot_block
+
+def get_snapshot_addresses(snapshot_block):
+    """快照里还没按该块 (或更新的块) 刷过的地址 (续跑时跳过已完成的)"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    # 过滤脏行: ecrecover 失败的哨兵值 'error' 曾一路漏进库里, 编进批次会
-    # 让整批 500 个地址的合约调用陪葬, 且该行永远刷不新、每轮必炸
     cursor.execute(
         "SELECT author_address FROM author_balances "
-        "WHERE timestamp < ? AND author_address LIKE '0x%' AND LENGTH(author_address) = 42 "
+        "WHERE (balance_block IS NULL OR balance_block < ?) "
+        "AND author_address LIKE '0x%' AND LENGTH(author_address) = 42 "
         "LIMIT ?",
-        (int(time.time()) - DATA_EXPIRY, LIMIT))
+        (snapshot_block, LIMIT))
     return [row[0] for row in cursor.fetchall()]
 
-def update_author_balance(author_addresses):
-    """Update author address balance information"""
+def finish_snapshot(snapshot_block):
+    """记录快照进度, 全部地址都按该块刷过才标记完成; 这一轮没有进展时累加 stalled_runs"""
+    conn = get_db_connection()
+    previous = conn.execute("SELECT refreshed FROM tvl_snapshots WHERE block_number = ?",
+                            (snapshot_block,)).fetchone()[0] or 0
+    # 已经是更新块上的余额 (更新的快照) 的地址也算完成, upsert 不会拿本快照的块覆盖它们
+    refreshed = conn.execute("SELECT COUNT(*) FROM author_balances WHERE balance_block >= ?",
+                             (snapshot_block,)).fetchone()[0]
+    remaining = conn.execute(
+        "SELECT COUNT(*) FROM author_balances "
+        "WHERE (balance_block IS NULL OR balance_block < ?) "
+        "AND author_address LIKE '0x%' AND LENGTH(author_address) = 42",
+        (snapshot_block,)).fetchone()[0]
+    conn.execute("UPDATE tvl_snapshots SET refreshed = ?, finished_at = ?, "
+                 "stalled_runs = CASE WHEN ? > refreshed THEN 0 ELSE COALESCE(stalled_runs, 0) + 1 END "
+                 "WHERE block_number = ?",
+                 (refreshed, int(time.time()) if remaining == 0 else None, refreshed, snapshot_block))
+    conn.commit()
+    if remaining == 0:
+        print(f"Snapshot at block {snapshot_block} complete: {refreshed} addresses")
+    elif refreshed <= previous:
+        print(f"WARNING: snapshot at block {snapshot_block} made no progress this run "
+              f"({remaining} left); it is abandoned after {SNAPSHOT_MAX_STALLED} such runs")
+    else:
+        print(f"Snapshot at block {snapshot_block}: {refreshed} done, {remaining} left, rerun --snapshot to resume")
+
+def update_author_balance(author_addresses, balance_block=None):
+    """Update author address balance information, pinned to balance_block if given"""
+    conn = None
     try:
         # Get all token balances
-        balances = get_address_balances(author_addresses)
+        if balance_block is None:
+            balances = get_address_balances(author_addresses)
+        else:
+            # 钉住块号后换哪个端点结果都一样, 失败了直接换端点重试
+            for attempt in range(3):
+                balances = get_address_balances(author_addresses, balance_block)
+                if balances:
+                    break
         print(f"Got balances for {len(balances)} addresses")
         
         if balances:
@@ -255,69 +423,74 @@ def update_author_balance(author_addresses):
             conn = get_db_connection()
             cursor = conn.cursor()
             current_timestamp = int(time.time())
-            balance_changed_count = 0
-            
-            for balance in balances:
-                # First, get existing balance data from database
-                cursor.execute(
-                    """
-                    SELECT eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance, last_update_timestamp 
-                    FROM author_balances WHERE author_address = ?
-                    """,
-                    (balance['address'],)
-                )
-                existing_data = cursor.fetchone()
-                
-                # Check if any balance has changed
-                balance_changed = False
-                if existing_data:
-                    existing_eth, existing_weth, existing_wbtc, existing_usdt, existing_usdc, existing_dai, existing_last_update = existing_data
-                    
-                    # Compare each balance field
-                    if (existing_eth != balance['eth_balance'] or
-                        existing_weth != balance['weth_balance'] or
-                        existing_wbtc != balance['wbtc_balance'] or
-                        existing_usdt != balance['usdt_balance'] or
-                        existing_usdc != balance['usdc_balance'] or
-                        existing_dai != balance['dai_balance']):
-                        balance_changed = True
-                        balance_changed_count += 1
-                else:
-                    # New address, consider as changed
-                    balance_changed = True
-                
-                # Determine last_update_timestamp value
-                if balance_changed:
-                    last_update_timestamp = current_timestamp
-                else:
-                    # Keep existing last_update_timestamp if no change
-                    last_update_timestamp = existing_data[6] if existing_data else current_timestamp
-                
-                # Insert or update the record
-                cursor.execute(
-                    """
-                    INSERT INTO author_balances (author_address, eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance, timestamp, last_update_timestamp) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) 
-                    ON CONFLICT(author_address) 
-                    DO UPDATE SET eth_balance = ?, weth_balance = ?, wbtc_balance = ?, usdt_balance = ?, usdc_balance = ?, dai_balance = ?, timestamp = ?, last_update_timestamp = ?
-                    """,
-                    (balance['address'], balance['eth_balance'], balance['weth_balance'], balance['wbtc_balance'], 
-                     balance['usdt_balance'], balance['usdc_balance'], balance['dai_balance'], current_timestamp, last_update_timestamp,
-                     balance['eth_balance'], balance['weth_balance'], balance['wbtc_balance'], 
-                     balance['usdt_balance'], balance['usdc_balance'], balance['dai_balance'], current_timestamp, last_update_timestamp)
-                )
+
+            # 整批先进临时表, 再一条语句合并; 比对余额、决定 last_update_timestamp 都在 SQL 里做
+            # 先拿写锁: 读过主库再升级成写事务时, WAL 下别的写者刚提交过会直接报 database is locked
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("DELETE FROM temp.balance_updates")
+            cursor.executemany(
+                "INSERT OR REPLACE INTO temp.balance_updates VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(balance['address'], balance['eth_balance'], balance['weth_balance'], balance['wbtc_balance'],
+                  balance['usdt_balance'], balance['usdc_balance'], balance['dai_balance'])
+                 for balance in balances])
+            cursor.execute(f"""
+                SELECT COUNT(*) FROM temp.balance_updates AS u
+                JOIN author_balances AS a ON a.author_address = u.author_address
+                WHERE {BALANCE_CHANGED_SQL.format(old='a', new='u')}
+            """)
+            balance_changed_count = cursor.fetchone()[0]
+            # 已存的余额来自更新的块 (更新的快照) 时不覆盖; 实时刷新按 latest 查询,
+            # balance_block 为空, 总是覆盖也总能被覆盖
+            skipped_count = 0
+            if balance_block is not None:
+                cursor.execute("""
+                    SELECT COUNT(*) FROM temp.balance_updates AS u
+                    JOIN author_balances AS a ON a.author_address = u.author_address
+                    WHERE a.balance_block > ?
+                """, (balance_block,))
+                skipped_count = cursor.fetchone()[0]
+            # 余额有变化 (或新地址) 才刷新 last_update_timestamp, timestamp 每次都刷新
+            # (WHERE true: 让 SQLite 把 ON CONFLICT 解析成 upsert 子句而不是 JOIN 约束)
+            cursor.execute(f"""
+                INSERT INTO author_balances (author_address, eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance, timestamp, last_update_timestamp, balance_block)
+                SELECT author_address, eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance, ?, ?, ?
+                FROM temp.balance_updates WHERE true
+                ON CONFLICT(author_address) DO UPDATE SET
+                    eth_balance = excluded.eth_balance, weth_balance = excluded.weth_balance,
+                    wbtc_balance = excluded.wbtc_balance, usdt_balance = excluded.usdt_balance,
+                    usdc_balance = excluded.usdc_balance, dai_balance = excluded.dai_balance,
+                    timestamp = excluded.timestamp,
+                    balance_block = excluded.balance_block,
+                    last_update_timestamp = CASE WHEN {BALANCE_CHANGED_SQL.format(old='author_balances', new='excluded')}
+                                                 THEN excluded.last_update_timestamp
+                                                 ELSE author_balances.last_update_timestamp END
+                WHERE excluded.balance_block IS NULL OR author_balances.balance_block IS NULL
+                      OR excluded.balance_block >= author_balances.balance_block
+            """, (current_timestamp, current_timestamp, balance_block))
             conn.commit()
-            stats.add(updated=len(balances))
-            print(f"Updated balances for {len(balances)} addresses, balance changed count: {balance_changed_count}")
+            stats.add(updated=len(balances) - skipped_count)
+            print(f"Updated balances for {len(balances) - skipped_count} addresses, "
+                  f"balance changed count: {balance_changed_count}, "
+                  f"skipped (newer block already stored): {skipped_count}")
     except Exception as e:
+        # 线程连接是复用的: 不回滚的话写事务一直开着, 这个线程之后每批都会卡在 BEGIN IMMEDIATE,
+        # 其他写者也一直拿不到锁
+        if conn is not None and conn.in_transaction:
+            conn.rollback()
         print(f"Error updating author {author_addresses} information: {e}")
 
 def main():
     # Initialize database connection (main thread)
     get_db_connection()
     
-    unfresh_author_addresses = get_unfresh_author_addresses()
-    print(f"Got {len(unfresh_author_addresses)} unfresh author addresses")
+    snapshot_block = None
+    if SNAPSHOT:
+        snapshot_block = start_snapshot()
+        unfresh_author_addresses = get_snapshot_addresses(snapshot_block)
+        print(f"Got {len(unfresh_author_addresses)} author addresses to snapshot at block {snapshot_block}")
+    else:
+        unfresh_author_addresses = get_unfresh_author_addresses()
+        print(f"Got {len(unfresh_author_addresses)} unfresh author addresses")
     
     # Use thread pool to get balances in parallel
     print(f"Starting to update balance data for {len(unfresh_author_addresses)} addresses...")
@@ -326,10 +499,10 @@ def main():
     
     with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
         futures = []
-        for i in range(0, len(unfresh_author_addresses), 500):
-            batch = unfresh_author_addresses[i:i+500]
+        for i in range(0, len(unfresh_author_addresses), tvl_scheduler.ADDRESSES_PER_CALL):
+            batch = unfresh_author_addresses[i:i+tvl_scheduler.ADDRESSES_PER_CALL]
             futures.append(
-                executor.submit(update_author_balance, batch)
+                executor.submit(update_author_balance, batch, snapshot_block)
             )
         
         # Wait for all tasks to complete
@@ -344,6 +517,10 @@ def main():
                 error_count += 1
     
     print(f"\nProcessing complete! Success: {success_count}, Failed: {error_count}")
+    # 计入每小时 eth_call 预算 (失败的调用也花了节点配额)
+    tvl_scheduler.record_calls(get_db_connection(), int(time.time()), len(futures))
+    if SNAPSHOT:
+        finish_snapshot(snapshot_block)
 
     stats.flush()
     print("\nProgram finished")
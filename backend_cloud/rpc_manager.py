@@ -12,6 +12,11 @@ rpc_<YYYYmmdd_HHMMSS>.json (一周内的缓存直接复用, 多进程安全),
 
 用法 (命令行, stdout 每行一个可用端点, 诊断信息走 stderr):
     python3 rpc_manager.py --name arb --require_batch
+
+探测结果缓存在本目录 health_<name>.json, 有效期内只复核上次可用的端点。
+
+EndpointLimits 按端点自适应批大小和并发度 (AIMD), 学到的值存在本目录
+limits_<name>.json, 下次启动直接从上次的水平起步。
 """
 
 import os
@@ -22,6 +27,7 @@ import glob
 import time
 import random
 import argparse
+import threading
 import requests
 from concurrent.futures import ThreadPoolExecutor
 
@@ -166,20 +172,68 @@ def get_candidate_urls(name):
     return urls
 
 
+HEALTH_PREFIX = 'health_'
+HEALTH_TTL = 6 * 3600   # 健康缓存有效期, 过期整表重探
+FULL_PROBE_KEY = '__full_probe__'   # 健康缓存里的保留键: 上次全量探测的时间 {checked}
+DEAD_TTL = 86400        # 连续失败 DEAD_AFTER 次的端点, 一天内不再参与全量探测
+DEAD_AFTER = 3
+
+
+def _health_path(name):
+    return os.path.join(SCRIPT_DIR, f'{HEALTH_PREFIX}{name}.json')
+
+
+def load_health(name):
+    """读端点健康缓存 health_<name>.json: url -> {ok, height, latency, checked, batch_verified, failures},
+    另有 FULL_PROBE_KEY -> {checked} 记录上次全量探测的时间"""
+    try:
+        with open(_health_path(name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_health(name, updates):
+    """合并写回健康缓存 (临时文件 + os.replace, 多进程安全)"""
+    path = _health_path(name)
+    merged = load_health(name)
+    merged.update(updates)
+    tmp_path = path + f'.tmp{os.getpid()}'
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(merged, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log(f"WARNING: failed to save health cache: {e}")
+
+
+def _parse_probe_batch(data, payload, chain_id):
+    """校验探测批量请求的返回, 返回 (ok, height)"""
+    results = {item.get('id'): item.get('result') for item in data
+               if isinstance(item, dict)}
+    if any(results.get(item['id']) is None for item in payload):
+        return False, 0
+    if int(results[1], 16) != chain_id:
+        return False, 0
+    return True, int(results[2], 16)
+
+
 def probe_endpoint(url, chain_id, require_batch=False, timeout=8, batch_test_size=2):
     """探测单个端点。
 
-    返回 (ok, height)。require_batch=True 时按 batch_test_size 发一次真实
-    大小的 JSON-RPC 批量请求试压: 部分公共节点小批量能过、大批量直接 500,
-    这里用该链实际会用的批大小提前把它们过滤掉。
+    返回 (ok, height)。eth_chainId + eth_blockNumber 合成一个批量请求发出,
+    一个来回完成探测; 不支持批量的节点在非 require_batch 模式下退回两次串行请求。
+    require_batch=True 时按 batch_test_size 把批量撑到真实大小试压: 部分
+    公共节点小批量能过、大批量直接 500, 这里用该链实际会用的批大小提前把
+    它们过滤掉。
     """
     headers = {'Content-Type': 'application/json'}
+    payload = [
+        {'jsonrpc': '2.0', 'method': 'eth_chainId', 'params': [], 'id': 1},
+        {'jsonrpc': '2.0', 'method': 'eth_blockNumber', 'params': [], 'id': 2},
+    ]
     try:
         if require_batch:
-            payload = [
-                {'jsonrpc': '2.0', 'method': 'eth_chainId', 'params': [], 'id': 1},
-                {'jsonrpc': '2.0', 'method': 'eth_blockNumber', 'params': [], 'id': 2},
-            ]
             # 用轻量的 getBlockByNumber 把批量撑到实际大小
             for i in range(max(0, batch_test_size - 2)):
                 payload.append({'jsonrpc': '2.0', 'method': 'eth_getBlockByNumber',
@@ -189,39 +243,60 @@ def probe_endpoint(url, chain_id, require_batch=False, timeout=8, batch_test_siz
             data = resp.json()
             if not isinstance(data, list) or len(data) != len(payload):
                 return False, 0  # 不支持批量
-            results = {item.get('id'): item.get('result') for item in data
-                       if isinstance(item, dict)}
-            if any(results.get(item['id']) is None for item in payload):
-                return False, 0
-            if int(results[1], 16) != chain_id:
-                return False, 0
-            return True, int(results[2], 16)
-        else:
-            resp = requests.post(url, json={'jsonrpc': '2.0', 'method': 'eth_chainId',
-                                            'params': [], 'id': 1},
-                                 headers=headers, timeout=timeout)
-            resp.raise_for_status()
-            result = resp.json().get('result')
-            if result is None or int(result, 16) != chain_id:
-                return False, 0
-            resp = requests.post(url, json={'jsonrpc': '2.0', 'method': 'eth_blockNumber',
-                                            'params': [], 'id': 1},
-                                 headers=headers, timeout=timeout)
+            return _parse_probe_batch(data, payload, chain_id)
+
+        try:
+            resp = requests.post(url, json=payload, headers=headers, timeout=timeout)
             resp.raise_for_status()
-            result = resp.json().get('result')
-            if result is None:
-                return False, 0
-            return True, int(result, 16)
+            data = resp.json()
+        except requests.exceptions.Timeout:
+            return False, 0  # 超时就不再串行重试, 省掉第二个 timeout
+        except (requests.exceptions.RequestException, ValueError):
+            data = None
+        if isinstance(data, list) and len(data) == len(payload):
+            return _parse_probe_batch(data, payload, chain_id)
+
+        # 不支持批量: 退回串行
+        resp = requests.post(url, json=payload[0], headers=headers, timeout=timeout)
+        resp.raise_for_status()
+        result = resp.json().get('result')
+        if result is None or int(result, 16) != chain_id:
+            return False, 0
+        resp = requests.post(url, json=payload[1], headers=headers, timeout=timeout)
+        resp.raise_for_status()
+        result = resp.json().get('result')
+        if result is None:
+            return False, 0
+        return True, int(result, 16)
     except Exception:
         return False, 0
 
 
+def _probe_all(urls, chain_id, require_batch, timeout, batch_test_size, num_threads):
+    """并发探测, 返回 url -> (ok, height, latency)"""
+    def probe(url):
+        started = time.monotonic()
+        ok, height = probe_endpoint(url, chain_id, require_batch, timeout, batch_test_size)
+        return ok, height, time.monotonic() - started
+
+    if not urls:
+        return {}
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        return dict(zip(urls, executor.map(probe, urls)))
+
+
 def get_alive_endpoints(name, require_batch=False, max_endpoints=None,
-                        num_threads=32, timeout=8, for_eth_call=False):
+                        num_threads=32, timeout=8, for_eth_call=False, use_cache=True):
     """返回指定链当前存活 (且不严重落后) 的端点列表。
 
     for_eth_call=True 时额外剔除 ETH_CALL_BLOCKLIST (抓块可用但扛不住
     重合约调用的端点), 供 get_tvl 使用。
+
+    探测结果缓存在 health_<name>.json: 缓存有效期内先只复核上次可用的端点,
+    过半仍可用就直接返回, 不再对整个 chainlist 候选表逐个吃 timeout;
+    缓存缺失、距上次全量探测超过 HEALTH_TTL 或复核大面积失败时才全量探测
+    (新增的候选、恢复的端点在这时补探), 且跳过近期连续失败的端点。
+    复核会刷新各端点的 checked, 所以有效期按单独记录的全量探测时间算。
     """
     config = CHAIN_CONFIG[name]
     chain_id = config['chain_id']
@@ -235,12 +310,55 @@ def get_alive_endpoints(name, require_batch=False, max_endpoints=None,
         return []
 
     batch_test_size = config['batch_size'] if require_batch else 2
-    with ThreadPoolExecutor(max_workers=num_threads) as executor:
-        results = list(executor.map(
-            lambda u: probe_endpoint(u, chain_id, require_batch, timeout,
-                                     batch_test_size), candidates))
+    need_verified = batch_test_size if require_batch else 0
+    health = load_health(name) if use_cache else {}
+    now = time.time()
 
-    alive = [(url, height) for url, (ok, height) in zip(candidates, results) if ok]
+    probed = {}
+    known_good = [u for u in candidates
+                  if health.get(u, {}).get('ok')
+                  and health[u].get('batch_verified', 0) >= need_verified
+                  and now - health[u].get('checked', 0) <= HEALTH_TTL]
+    full_probe = True
+    last_full_probe = health.get(FULL_PROBE_KEY, {}).get('checked', 0)
+    if now - last_full_probe > HEALTH_TTL:
+        if known_good:
+            log(f"{name}: last full probe is older than {HEALTH_TTL // 3600}h, re-probing all candidates")
+    elif known_good:
+        probed = _probe_all(known_good, chain_id, require_batch, timeout,
+                            batch_test_size, num_threads)
+        still_alive = sum(1 for ok, _, _ in probed.values() if ok)
+        if still_alive * 2 >= len(known_good):
+            full_probe = False
+            log(f"{name}: {still_alive}/{len(known_good)} cached endpoints re-validated, "
+                f"skipping full probe")
+        else:
+            log(f"{name}: only {still_alive}/{len(known_good)} cached endpoints alive, "
+                f"falling back to full probe")
+
+    if full_probe:
+        rest = [u for u in candidates if u not in probed
+                and not (health.get(u, {}).get('failures', 0) >= DEAD_AFTER
+                         and now - health[u].get('checked', 0) <= DEAD_TTL)]
+        skipped = len(candidates) - len(probed) - len(rest)
+        if skipped:
+            log(f"{name}: skipping {skipped} recently dead endpoints")
+        probed.update(_probe_all(rest, chain_id, require_batch, timeout,
+                                 batch_test_size, num_threads))
+
+    updates = {FULL_PROBE_KEY: {'checked': now}} if full_probe else {}
+    for url, (ok, height, latency) in probed.items():
+        prev = health.get(url, {})
+        if ok:
+            verified = max(need_verified, prev.get('batch_verified', 0) if prev.get('ok') else 0)
+            updates[url] = {'ok': True, 'height': height, 'latency': round(latency, 3),
+                            'checked': now, 'batch_verified': verified, 'failures': 0}
+        else:
+            updates[url] = {'ok': False, 'height': 0, 'latency': None, 'checked': now,
+                            'batch_verified': 0, 'failures': prev.get('failures', 0) + 1}
+    save_health(name, updates)
+
+    alive = [(url, height) for url, (ok, height, _) in probed.items() if ok]
     if not alive:
         log(f"{name}: WARNING no alive endpoints out of {len(candidates)} candidates")
         return []
@@ -248,7 +366,7 @@ def get_alive_endpoints(name, require_batch=False, max_endpoints=None,
     best_height = max(h for _, h in alive)
     fresh = [url for url, h in alive if best_height - h <= lag_tolerance]
     lagging = len(alive) - len(fresh)
-    log(f"{name}: {len(alive)} alive / {len(candidates)} candidates, "
+    log(f"{name}: {len(alive)} alive / {len(probed)} probed / {len(candidates)} candidates, "
         f"{lagging} lagging dropped, best height {best_height}"
         f"{' (batch verified)' if require_batch else ''}")
 
@@ -263,6 +381,144 @@ def get_batch_size(name):
     return CHAIN_CONFIG[name]['batch_size']
 
 
+LIMITS_PREFIX = 'limits_'
+LIMITS_MAX_AGE = 7 * 86400  # 超过一周没更新的端点记录作废, 重新从默认值学
+
+
+class EndpointLimits:
+    """每个端点各自的批大小 / 并发度控制器 (AIMD)。
+
+    连续 grow_after 次健康成功 (延迟低于 target_latency) 批大小 +1, 每长
+    4 次批大小并发度 +1; 429 并发度减半, 5xx / 超时 / 整批或部分 null
+    批大小减半。上下限之间各端点独立收敛到自己的最优值, 而不是全链共用
+    最保守的 CHAIN_CONFIG 批大小。线程安全, asyncio 里同样可用 (锁内无阻塞)。
+    """
+
+    GROW_AFTER = 5
+
+    def __init__(self, name, initial_batch_size=None, max_batch_size=None,
+                 initial_concurrency=2, max_concurrency=8, target_latency=5.0):
+        self.name = name
+        self.initial_batch_size = initial_batch_size or get_batch_size(name)
+        self.max_batch_size = max_batch_size or self.initial_batch_size * 4
+        self.max_concurrency = max_concurrency
+        self.initial_concurrency = min(initial_concurrency, max_concurrency)
+        self.target_latency = target_latency
+        self.path = os.path.join(SCRIPT_DIR, f'{LIMITS_PREFIX}{name}.json')
+        self.lock = threading.Lock()
+        self.limits = {}    # url -> {'batch_size', 'concurrency', 'updated'}
+        self.streak = {}    # url -> 连续健康成功次数
+        self.grown = {}     # url -> 批大小累计增长次数 (决定何时加并发)
+        self.inflight = {}  # url -> 在途请求数
+        self.last_save = time.time()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for url, item in saved.items():
+            if now - item.get('updated', 0) > LIMITS_MAX_AGE:
+                continue
+            self.limits[url] = {
+                'batch_size': max(1, min(int(item['batch_size']), self.max_batch_size)),
+                'concurrency': max(1, min(int(item['concurrency']), self.max_concurrency)),
+                'updated': item['updated'],
+            }
+        if self.limits:
+            log(f"{self.name}: loaded learned limits for {len(self.limits)} endpoints")
+
+    def _get(self, url):
+        if url not in self.limits:
+            self.limits[url] = {'batch_size': self.initial_batch_size,
+                                'concurrency': self.initial_concurrency,
+                                'updated': time.time()}
+        return self.limits[url]
+
+    def batch_size(self, url):
+        with self.lock:
+            return self._get(url)['batch_size']
+
+    def concurrency(self, url):
+        with self.lock:
+            return self._get(url)['concurrency']
+
+    def acquire(self, url):
+        """占一个在途槽位, 已达该端点当前并发度时返回 False"""
+        with self.lock:
+            if self.inflight.get(url, 0) >= self._get(url)['concurrency']:
+                return False
+            self.inflight[url] = self.inflight.get(url, 0) + 1
+            return True
+
+    def release(self, url):
+        with self.lock:
+            self.inflight[url] = max(0, self.inflight.get(url, 0) - 1)
+
+    def on_success(self, url, latency):
+        with self.lock:
+            item = self._get(url)
+            item['updated'] = time.time()
+            if latency > self.target_latency * 2:
+                # 能成功但太慢: 温和收一点, 不算失败
+                item['batch_size'] = max(1, item['batch_size'] - 1)
+                self.streak[url] = 0
+                return
+            if latency > self.target_latency:
+                self.streak[url] = 0
+                return
+            self.streak[url] = self.streak.get(url, 0) + 1
+            if self.streak[url] < self.GROW_AFTER:
+                return
+            self.streak[url] = 0
+            if item['batch_size'] < self.max_batch_size:
+                item['batch_size'] += 1
+                self.grown[url] = self.grown.get(url, 0) + 1
+            if (self.grown.get(url, 0) % 4 == 0 or item['batch_size'] >= self.max_batch_size) \
+                    and item['concurrency'] < self.max_concurrency:
+                item['concurrency'] += 1
+
+    def on_failure(self, url, kind):
+        """kind: rate_limited (429) / server_error (5xx) / timeout / null / error"""
+        with self.lock:
+            item = self._get(url)
+            item['updated'] = time.time()
+            self.streak[url] = 0
+            if kind == 'rate_limited':
+                item['concurrency'] = max(1, item['concurrency'] // 2)
+            else:
+                item['batch_size'] = max(1, item['batch_size'] // 2)
+            log(f"{self.name}: {url} {kind}, limits now batch={item['batch_size']} "
+                f"concurrency={item['concurrency']}")
+
+    def maybe_save(self, interval=60):
+        """长时间运行时定期落盘"""
+        if time.time() - self.last_save >= interval:
+            self.save()
+
+    def save(self):
+        """合并写回 limits_<name>.json (临时文件 + os.replace, 多进程安全)"""
+        with self.lock:
+            self.last_save = time.time()
+            snapshot = {url: dict(item) for url, item in self.limits.items()}
+        try:
+            with open(self.path) as f:
+                merged = json.load(f)
+        except (OSError, ValueError):
+            merged = {}
+        merged.update(snapshot)
+        tmp_path = self.path + f'.tmp{os.getpid()}'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(merged, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log(f"WARNING: failed to save limits: {e}")
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Probe alive RPC endpoints for a chain')
     parser.add_argument('--name', required=True, choices=sorted(CHAIN_CONFIG.keys()))
@@ -270,10 +526,13 @@ if __name__ == '__main__':
                         help='Only keep endpoints that support JSON-RPC batch requests')
     parser.add_argument('--max', type=int, default=None, help='Max endpoints to output')
     parser.add_argument('--timeout', type=int, default=8, help='Probe timeout seconds')
+    parser.add_argument('--no_cache', action='store_true',
+                        help='Ignore the endpoint health cache and probe every candidate (cache is still refreshed)')
     args = parser.parse_args()
 
     endpoints = get_alive_endpoints(args.name, require_batch=args.require_batch,
-                                    max_endpoints=args.max, timeout=args.timeout)
+                                    max_endpoints=args.max, timeout=args.timeout,
+                                    use_cache=not args.no_cache)
     for url in endpoints:
         print(url)
     if not endpoints:
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""整库快照: 新的本地节点一次性初始化用 (syncer_server 的 /<name>/snapshot)。
+
+新节点 syncer_client --download 原来只能一页页拉 get_block_txs / get_tvl / get_code
+(每页 10000 行, 一次 JSON 往返 + 逐行插入)。这里把 {name}_block.db / _tvl.db /
+_code.db 导出成本地库的表结构, gzip 压缩后整个文件下发, 客户端解压即用,
+之后照常增量同步 (缺口 / 最大 last_update_timestamp 都从快照里接着算)。
+
+导出而不是直接拷贝库文件, 因为服务端库和本地库结构不同:
+  - block: 服务端 type4_transactions 可能是紧凑格式 (type4_codec), 导出时还原成 tx_data
+  - tvl:   只导出 author_balances 的本地列, 不带调度表 / 快照记录等服务端专用表
+  - code:  codes + code_blobs (code_store 格式, 与本地一致)
+做法同 clean_block: 新建空库, ATTACH 源库, INSERT ... SELECT 复制, 原子替换。
+同一个事务里读源库, WAL 下看到的是同一时刻的一致快照; block 只导出到导出开始时
+的最高块 (height), 之后写入的块留给增量同步。
+
+快照文件缓存在 SNAPSHOT_DIR, 超过 max_age 才重建; 也可以定时预先生成:
+    python3 snapshot_export.py --name arb --kind block --source arb_block.db
+"""
+
+import os
+import json
+import gzip
+import time
+import shutil
+import sqlite3
+import argparse
+
+import type4_codec
+
+SNAPSHOT_DIR = 'snapshots'
+KINDS = ('block', 'tvl', 'code')
+
+SCHEMAS = {
+    'block': [
+        '''CREATE TABLE blocks (
+            block_number INTEGER PRIMARY KEY,
+            tx_count INTEGER,
+            type4_tx_count INTEGER,
+            timestamp INTEGER
+        )''',
+        'CREATE INDEX idx_blocks_block_number ON blocks(block_number ASC)',
+        '''CREATE TABLE type4_transactions (
+            tx_hash TEXT PRIMARY KEY,
+            block_number INTEGER,
+            tx_data TEXT,
+            FOREIGN KEY (block_number) REFERENCES blocks(block_number)
+        )''',
+        'CREATE INDEX idx_type4_transactions_block_number ON type4_transactions(block_number ASC)',
+    ],
+    'tvl': [
+        '''CREATE TABLE author_balances (
+            author_address TEXT PRIMARY KEY,
+            eth_balance INTEGER,
+            weth_balance INTEGER,
+            wbtc_balance INTEGER,
+            usdt_balance INTEGER,
+            usdc_balance INTEGER,
+            dai_balance INTEGER,
+            timestamp INTEGER,
+            last_update_timestamp INTEGER
+        )''',
+        'CREATE INDEX idx_author_balances_update_cursor ON author_balances(last_update_timestamp, author_address)',
+    ],
+    'code': [
+        '''CREATE TABLE codes (
+            code_address TEXT PRIMARY KEY,
+            code TEXT,
+            timestamp INTEGER,
+            last_update_timestamp INTEGER,
+            code_hash TEXT
+        )''',
+        'CREATE INDEX idx_codes_update_cursor ON codes(last_update_timestamp, code_address)',
+        'CREATE TABLE code_blobs (code_hash TEXT PRIMARY KEY, code TEXT)',
+        'CREATE INDEX idx_codes_code_hash ON codes(code_hash)',
+    ],
+}
+
+
+def snapshot_path(name, kind):
+    return os.path.join(SNAPSHOT_DIR, f'{name}_{kind}.db.gz')
+
+
+def info_path(name, kind):
+    return os.path.join(SNAPSHOT_DIR, f'{name}_{kind}.json')
+
+
+def read_info(name, kind):
+    """已生成快照的元信息 (height / created_at / rows), 没有时返回 None"""
+    try:
+        with open(info_path(name, kind)) as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(snapshot_path(name, kind)):
+        return None
+    return info
+
+
+def _copy_rows(conn, kind, source_path):
+    """在 conn (已 ATTACH 源库为 src) 的同一个事务里复制数据, 返回 (height, rows)"""
+    if kind == 'block':
+        # 紧凑格式的行还原成 JSON 文本, 和 get_block_txs 下发的内容一致
+        source_conn = sqlite3.connect(source_path)
+        tx_data_sql = type4_codec.tx_data_sql(source_conn)
+        source_conn.close()
+        conn.create_function('type4_decode', 6, type4_codec.decode, deterministic=True)
+        height = conn.execute("SELECT MAX(block_number) FROM src.blocks").fetchone()[0] or 0
+        rows = conn.execute(
+            "INSERT INTO blocks (block_number, tx_count, type4_tx_count, timestamp) "
+            "SELECT block_number, tx_count, type4_tx_count, timestamp "
+            "FROM src.blocks WHERE block_number <= ?", (height,)).rowcount
+        conn.execute(
+            "INSERT INTO type4_transactions (tx_hash, block_number, tx_data) "
+            f"SELECT tx_hash, block_number, type4_decode(block_number, tx_hash, {tx_data_sql}) "
+            "FROM src.type4_transactions WHERE block_number <= ?", (height,))
+        return height, rows
+    if kind == 'tvl':
+        rows = conn.execute(
+            "INSERT INTO author_balances (author_address, eth_balance, weth_balance, wbtc_balance, "
+            "usdt_balance, usdc_balance, dai_balance, timestamp, last_update_timestamp) "
+            "SELECT author_address, eth_balance, weth_balance, wbtc_balance, "
+            "usdt_balance, usdc_balance, dai_balance, timestamp, last_update_timestamp "
+            "FROM src.author_balances").rowcount
+    else:
+        rows = conn.execute(
+            "INSERT INTO codes (code_address, code, timestamp, last_update_timestamp, code_hash) "
+            "SELECT code_address, code, timestamp, last_update_timestamp, code_hash FROM src.codes").rowcount
+        conn.execute("INSERT INTO code_blobs (code_hash, code) SELECT code_hash, code FROM src.code_blobs")
+    # tvl / code 增量同步按 last_update_timestamp 续传, height 记录快照里的最大值
+    table = 'author_balances' if kind == 'tvl' else 'codes'
+    height = conn.execute(f"SELECT MAX(last_update_timestamp) FROM {table}").fetchone()[0] or 0
+    return height, rows
+
+
+def build(name, kind, source_path):
+    """
+    从 source_path 导出快照并 gzip, 原子替换 SNAPSHOT_DIR 里的旧快照
+    :return: 元信息 dict
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    db_path = os.path.join(SNAPSHOT_DIR, f'{name}_{kind}.db.building.{os.getpid()}')
+    gz_path = db_path + '.gz'
+    start_time = time.time()
+    try:
+        conn = sqlite3.connect(db_path)
+        # 半成品失败就删, 不需要崩溃安全, 换复制速度
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        for statement in SCHEMAS[kind]:
+            conn.execute(statement)
+        conn.commit()
+        conn.execute("ATTACH DATABASE ? AS src", (source_path,))
+        height, rows = _copy_rows(conn, kind, source_path)
+        conn.commit()
+        conn.execute("DETACH DATABASE src")
+        conn.close()
+
+        with open(db_path, 'rb') as src, gzip.open(gz_path, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        info = {
+            'name': name,
+            'kind': kind,
+            'height': height,
+            'rows': rows,
+            'created_at': int(time.time()),
+            'size': os.path.getsize(gz_path),
+        }
+        os.replace(gz_path, snapshot_path(name, kind))
+        with open(info_path(name, kind), 'w') as f:
+            json.dump(info, f)
+    finally:
+        for path in (db_path, gz_path):
+            if os.path.exists(path):
+                os.remove(path)
+    print(f"[snapshot] {name} {kind}: {rows} rows up to {height}, "
+          f"{info['size'] / 1e6:.1f} MB in {time.time() - start_time:.1f}s")
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a bootstrap snapshot for syncer_client')
+    parser.add_argument('--name', required=True, help='Blockchain network name')
+    parser.add_argument('--kind', choices=KINDS, required=True, help='Which db to export')
+    parser.add_argument('--source', required=True, help='Source db path, e.g. arb_block.db')
+    args = parser.parse_args()
+    build(args.name, args.kind, args.source)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,8 @@ get_block_batch.py 内置了同样的上报逻辑 (kind='block'); get_tvl.py /
 get_code.py 用本模块, 以 kind='tvl' / 'code' 上报, 面板按 kind 分列展示。
 
 纯内存累计, 后台线程每 30 秒增量上报一次; 上报失败把数字加回去下轮重试。
-进程结束前调用 flush() 把尾巴报出去。
+进程结束前调用 flush() 把尾巴报出去。传入 scheduler 时顺带上报各端点的
+当前指标 (EndpointScheduler.snapshot)。
 """
 
 import os
@@ -16,9 +17,11 @@ import requests
 
 
 class StatsReporter:
-    def __init__(self, name, kind, stats_url='http://127.0.0.1:5000', interval=30):
+    def __init__(self, name, kind, stats_url='http://127.0.0.1:5000', interval=30,
+                 scheduler=None):
         self.name = name
         self.kind = kind
+        self.scheduler = scheduler
         self.url = stats_url.rstrip('/') if stats_url else ''
         self.interval = interval
         self.lock = threading.Lock()
@@ -58,6 +61,8 @@ class StatsReporter:
                    'blocks_added': snapshot['updated'],
                    'success_requests': snapshot['success_requests'],
                    'failed_requests': snapshot['failed_requests']}
+        if self.scheduler is not None:
+            payload['endpoints'] = self.scheduler.snapshot()
         try:
             requests.post(f'{self.url}/{self.name}/report_stats', json=payload,
                           headers={**self.headers, 'Content-Type': 'application/json'},
@@ -3,11 +3,17 @@
 
 import os
 import json
+import base64
 import sqlite3
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, send_file
 import argparse
 from functools import wraps
 import watermark
+import type4_codec
+import balance_units
+import code_store
+import ndjson_stream
+import snapshot_export
 import time
 import threading
 from collections import deque, defaultdict
@@ -16,10 +22,13 @@ from collections import deque, defaultdict
 parser = argparse.ArgumentParser(description='Syncer server for blockchain data')
 parser.add_argument('--port', type=int, default=5000, help='Server port')
 parser.add_argument('--block_db_path', type=str, default='', help='block_db_path')
+parser.add_argument('--snapshot_max_age', type=int, default=21600,
+                    help='Rebuild bootstrap snapshots older than this many seconds')
 args = parser.parse_args()
 
 PORT = args.port
 BLOCK_DB_PATH = args.block_db_path
+SNAPSHOT_MAX_AGE = args.snapshot_max_age
 
 # 从环境变量读取允许的链名称列表
 ALLOWED_NAMES_STR = os.environ.get("ALLOWED_NAMES", "mainnet")
@@ -47,19 +56,19 @@ AUTH_TOKEN = load_token()
 
 app = Flask(__name__)
 
-def parse_blocks_string(blocks_str):
-    """解析块字符串，如 '3,5,7,9,12-20,23-55' 返回块号列表
+def parse_block_ranges(blocks_str):
+    """解析块字符串，如 '3,5,7,9,12-20,23-55' 返回合并后的块号区间
     
     Args:
         blocks_str: 块字符串，支持单个块号和范围
         
     Returns:
-        list: 排序后的块号列表
+        list: 按起点排序、互不重叠的 (start, end) 闭区间列表, 相邻区间已合并
     """
     if not blocks_str or blocks_str.strip() == '':
         return []
     
-    block_numbers = set()
+    ranges = []
     parts = blocks_str.split(',')
     
     for part in parts:
@@ -74,17 +83,25 @@ def parse_blocks_string(blocks_str):
                 start_num = int(start.strip())
                 end_num = int(end.strip())
                 if start_num <= end_num:
-                    block_numbers.update(range(start_num, end_num + 1))
+                    ranges.append((start_num, end_num))
             except ValueError:
                 continue
         else:
             # 处理单个块号
             try:
-                block_numbers.add(int(part))
+                block_number = int(part)
+                ranges.append((block_number, block_number))
             except ValueError:
                 continue
     
-    return sorted(list(block_numbers))
+    # 重叠或相邻的区间合并, 每个区间在 blocks 上对应一段索引范围扫描
+    merged = []
+    for start_num, end_num in sorted(ranges):
+        if merged and start_num <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end_num))
+        else:
+            merged.append((start_num, end_num))
+    return merged
 
 def require_token(f):
     """Decorator to require authentication token"""
@@ -141,18 +158,37 @@ def get_block_db_connection(name):
     conn.row_factory = sqlite3.Row
     return conn
 
+# 每个进程每条链只检查一次 code_blobs 结构 (get_code 没跑过的旧库由这里迁移)
+_code_schema_checked = set()
+
 def get_code_db_connection(name):
     """Get code database connection"""
     _, code_db_path, _ = get_db_paths(name)
-    conn = sqlite3.connect(code_db_path)
+    conn = sqlite3.connect(code_db_path, timeout=60)
     conn.row_factory = sqlite3.Row
+    if name not in _code_schema_checked:
+        if code_store.ensure_schema(conn):
+            # get_code 的游标分页索引 (get_code.py 里也会建)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_codes_update_cursor ON codes(last_update_timestamp, code_address)")
+            conn.commit()
+        _code_schema_checked.add(name)
     return conn
 
+# 每个进程每条链只检查一次余额列是否已是定点整数 (get_tvl 没跑过的旧库由这里迁移)
+_tvl_schema_checked = set()
+
 def get_tvl_db_connection(name):
     """Get tvl database connection"""
     _, _, tvl_db_path = get_db_paths(name)
-    conn = sqlite3.connect(tvl_db_path)
+    conn = sqlite3.connect(tvl_db_path, timeout=60)
     conn.row_factory = sqlite3.Row
+    if name not in _tvl_schema_checked:
+        if balance_units.ensure_schema(conn, name):
+            # get_tvl 的游标分页索引 (get_tvl.py 里也会建)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_author_balances_update_cursor "
+                         "ON author_balances(last_update_timestamp, author_address)")
+            conn.commit()
+        _tvl_schema_checked.add(name)
     return conn
 
 @app.route('/health', methods=['GET'])
@@ -192,6 +228,54 @@ def get_highest_block(name):
             'error': str(e)
         }), 500
 
+def _iter_blocks(cursor):
+    """get_block_txs 的 join 结果 (按块号有序) 逐块归并成块 dict"""
+    block = None
+    for row in cursor:
+        if block is None or block['block_number'] != row[0]:
+            if block is not None:
+                yield block
+            block = {
+                'block_number': row[0],
+                'tx_count': row[1],
+                'type4_tx_count': row[2],
+                'timestamp': row[3],
+                'type4_txs': []
+            }
+        
+        # 紧凑格式的行在这里还原成 JSON 文本, 客户端看到的格式不变
+        if row[4] is not None:
+            block['type4_txs'].append({
+                'tx_hash': row[4],
+                'tx_data': type4_codec.decode(row[0], row[4], *row[5:])
+            })
+    if block is not None:
+        yield block
+
+def _wants_stream():
+    """客户端在 Accept 里声明支持 NDJSON 时才流式返回, 旧客户端仍拿整块 JSON"""
+    return ndjson_stream.CONTENT_TYPE in request.headers.get('Accept', '')
+
+def _stream_response(conn, header, rows, name=None, stats_kind=None, trailer_fields=None):
+    """边读游标边输出 NDJSON (客户端接受 gzip 时压缩), 流结束后关连接并记统计"""
+    def generate():
+        count = 0
+        try:
+            for row in rows:
+                count += 1
+                yield row
+            if stats_kind:
+                _record_stats(name, stats_kind, updated=count, ok=1)
+        finally:
+            conn.close()
+    
+    compress = 'gzip' in request.headers.get('Accept-Encoding', '')
+    response = Response(ndjson_stream.encode(header, generate(), compress, trailer_fields),
+                        mimetype=ndjson_stream.CONTENT_TYPE)
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
 @app.route('/<name>/get_block_txs', methods=['POST'])
 @require_token
 def get_block_txs(name):
@@ -225,52 +309,46 @@ def get_block_txs(name):
                 'error': 'blocks parameter cannot be empty'
             }), 400
         
-        # 解析块字符串
-        block_numbers = parse_blocks_string(blocks_str)
+        # 解析块字符串, 区间不展开成逐个块号
+        block_ranges = parse_block_ranges(blocks_str)
         
-        if not block_numbers:
+        if not block_ranges:
             return jsonify({
                 'success': False,
                 'error': 'No valid block numbers found in blocks parameter'
             }), 400
         
         conn = get_block_db_connection(name)
-        cursor = conn.cursor()
+        tx_data_sql = type4_codec.tx_data_sql(conn)
         
-        # 为了性能，使用 IN 查询
-        placeholders = ','.join(['?'] * len(block_numbers))
-        cursor.execute(f"""
-            SELECT block_number, tx_count, type4_tx_count, timestamp
-            FROM blocks
-            WHERE block_number IN ({placeholders})
-            ORDER BY block_number ASC
-        """, block_numbers)
-        
-        blocks = []
-        for row in cursor.fetchall():
-            block = {
-                'block_number': row['block_number'],
-                'tx_count': row['tx_count'],
-                'type4_tx_count': row['type4_tx_count'],
-                'timestamp': row['timestamp'],
-                'type4_txs': []
-            }
-            
-            # Get type4 transactions for this block
-            cursor.execute("""
-                SELECT tx_hash, tx_data
-                FROM type4_transactions
-                WHERE block_number = ?
-            """, (row['block_number'],))
-            
-            for tx_row in cursor.fetchall():
-                block['type4_txs'].append({
-                    'tx_hash': tx_row['tx_hash'],
-                    'tx_data': tx_row['tx_data']
-                })
-            
-            blocks.append(block)
+        # 区间放进临时表 (start_block 即 rowid, 按起点有序), 每个区间在 blocks 上走一段
+        # 主键范围扫描 (BETWEEN), 再一次 LEFT JOIN 带出 type4 交易 (没有 type4 交易的块也返回);
+        # CROSS JOIN 固定区间表在外层, 区间互不重叠所以输出已按块号有序, 不用再排序。
+        # 关掉自动索引, 否则没有统计信息时 SQLite 宁可每次现建覆盖索引也不用块号索引
+        conn.execute("PRAGMA automatic_index = OFF")
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS requested_ranges (start_block INTEGER PRIMARY KEY, end_block INTEGER)")
+        conn.execute("DELETE FROM temp.requested_ranges")
+        conn.executemany("INSERT INTO temp.requested_ranges (start_block, end_block) VALUES (?, ?)", block_ranges)
+        conn.commit()
+        cursor = conn.execute(f"""
+            SELECT blocks.block_number, blocks.tx_count, blocks.type4_tx_count, blocks.timestamp,
+                   type4_transactions.tx_hash, {tx_data_sql}
+            FROM temp.requested_ranges
+            CROSS JOIN blocks ON blocks.block_number BETWEEN requested_ranges.start_block AND requested_ranges.end_block
+            LEFT JOIN type4_transactions ON type4_transactions.block_number = blocks.block_number
+            ORDER BY requested_ranges.start_block, blocks.block_number
+        """)
         
+        requested_count = sum(end_num - start_num + 1 for start_num, end_num in block_ranges)
+        if _wants_stream():
+            return _stream_response(conn, {
+                'success': True,
+                'chain': name,
+                'records': 'blocks',
+                'requested_count': requested_count
+            }, _iter_blocks(cursor))
+        
+        blocks = list(_iter_blocks(cursor))
         conn.close()
         
         return jsonify({
@@ -278,7 +356,7 @@ def get_block_txs(name):
             'chain': name,
             'blocks': blocks,
             'count': len(blocks),
-            'requested_count': len(block_numbers)
+            'requested_count': requested_count
         })
     except Exception as e:
         return jsonify({
@@ -286,16 +364,125 @@ def get_block_txs(name):
             'error': str(e)
         }), 500
 
+# get_tvl / get_code 每页最多行数
+PAGE_SIZE = 10000
+
+def _encode_cursor(last_update_timestamp, address):
+    return base64.urlsafe_b64encode(json.dumps([last_update_timestamp, address]).encode()).decode()
+
+def _decode_cursor(cursor):
+    last_update_timestamp, address = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return int(last_update_timestamp), str(address)
+
+def _page_start():
+    """
+    本页起点: 有 cursor 参数时按 (last_update_timestamp, 地址) 游标翻页, 返回起点键;
+    cursor 为空串表示从 last_update_timestamp (含) 开始; 没有 cursor 参数 (旧客户端) 返回 None
+    """
+    cursor = request.args.get('cursor')
+    if cursor is None:
+        return None
+    if cursor == '':
+        return request.args.get('last_update_timestamp', type=int, default=0), ''
+    return _decode_cursor(cursor)
+
+def _requested_balance_scale(value):
+    """
+    客户端声明的余额格式: 新客户端带 balance_scale=BALANCE_SCALE, 收定点整数;
+    旧客户端不带 (None), 收旧格式的代币数量
+    :raises ValueError: 不支持的 balance_scale
+    """
+    if value is None:
+        return None
+    if int(value) != balance_units.BALANCE_SCALE:
+        raise ValueError(f'unsupported balance_scale {value}, server uses {balance_units.BALANCE_SCALE}')
+    return balance_units.BALANCE_SCALE
+
+def _balance_output(name, balance_scale):
+    """
+    余额记录的下发格式
+    :return: (逐条转换函数, 响应里附带的字段); 定点整数原样下发并回带 balance_scale
+    """
+    if balance_scale is not None:
+        return None, {'balance_scale': balance_scale}
+    
+    def to_legacy(record):
+        values = [record[column] for column in balance_units.BALANCE_COLUMNS]
+        record.update(zip(balance_units.BALANCE_COLUMNS, balance_units.to_legacy_row(name, values)))
+        return record
+    return to_legacy, {}
+
+def _update_page(name, conn, start_key, table, key_column, columns_sql, join_sql, legacy_op,
+                 records_key, stats_kind, transform=None, extra_fields=None):
+    """
+    get_tvl / get_code 的一页: 按 (last_update_timestamp, 地址) 排序, 游标严格大于起点,
+    同一时间戳的大批更新也能逐页推进; 下一页游标放在响应 (或 NDJSON 尾行) 的 next_cursor。
+    旧客户端只带 last_update_timestamp 时保持原来的比较方式 (legacy_op) 和返回格式。
+    transform 逐条改写记录; extra_fields 并进 NDJSON 头行 / JSON 响应。
+    """
+    extra_fields = extra_fields or {}
+    if start_key is None:
+        last_update_timestamp = request.args.get('last_update_timestamp', type=int, default=0)
+        where_sql = f"{table}.last_update_timestamp {legacy_op} ?"
+        order_sql = f"{table}.last_update_timestamp ASC"
+        params = (last_update_timestamp,)
+    else:
+        # 行值比较, 与 ORDER BY 一起走 (last_update_timestamp, 地址) 复合索引
+        where_sql = f"({table}.last_update_timestamp, {table}.{key_column}) > (?, ?)"
+        order_sql = f"{table}.last_update_timestamp ASC, {table}.{key_column} ASC"
+        params = start_key
+    cursor = conn.execute(f"""
+        SELECT {columns_sql}
+        FROM {table} {join_sql}
+        WHERE {where_sql}
+        ORDER BY {order_sql}
+        LIMIT {PAGE_SIZE}
+    """, params)
+    
+    last_key = [start_key]
+    def page_rows():
+        for row in cursor:
+            record = dict(row)
+            last_key[0] = (record['last_update_timestamp'], record[key_column])
+            yield transform(record) if transform else record
+    
+    def next_cursor():
+        # 空页时游标停在原地, 下次从同一位置继续
+        if start_key is None:
+            return {}
+        return {'next_cursor': _encode_cursor(*last_key[0])}
+    
+    if _wants_stream():
+        return _stream_response(conn, {'success': True, 'chain': name, 'records': records_key, **extra_fields},
+                                page_rows(), name, stats_kind, next_cursor)
+    
+    records = list(page_rows())
+    conn.close()
+
+    _record_stats(name, stats_kind, updated=len(records), ok=1)
+    return jsonify({
+        'success': True,
+        'chain': name,
+        records_key: records,
+        'count': len(records),
+        **extra_fields,
+        **next_cursor()
+    })
+
 @app.route('/<name>/get_tvl', methods=['GET'])
 @require_token
 def get_tvl(name):
-    """Get TVL data updated after the specified timestamp
+    """Get TVL data updated after the specified cursor
     
     Parameters:
+        cursor: string - 上一页返回的 next_cursor; 空串表示从 last_update_timestamp 开始
         last_update_timestamp: int - last update timestamp (Unix timestamp)
+                               (不带 cursor 时为旧的翻页方式: 严格大于该时间戳)
+        balance_scale: int - 客户端能接收的定点倍数 (balance_units.BALANCE_SCALE);
+                       不带时余额按旧格式 (代币数量) 下发
     
     Returns:
-        List of author balances (max 10000 rows)
+        List of author balances (max 10000 rows), next_cursor and balance_scale
     """
     # 验证链名称
     error_response = validate_chain_name(name)
@@ -303,43 +490,29 @@ def get_tvl(name):
         return error_response
     
     try:
-        last_update_timestamp = request.args.get('last_update_timestamp', type=int, default=0)
-        
-        conn = get_tvl_db_connection(name)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT author_address, eth_balance, weth_balance, wbtc_balance,
-                   usdt_balance, usdc_balance, dai_balance, timestamp, last_update_timestamp
-            FROM author_balances
-            WHERE last_update_timestamp > ?
-            ORDER BY last_update_timestamp ASC
-            LIMIT 10000
-        """, (last_update_timestamp,))
-        
-        tvl_data = []
-        for row in cursor.fetchall():
-            tvl_data.append({
-                'author_address': row['author_address'],
-                'eth_balance': row['eth_balance'],
-                'weth_balance': row['weth_balance'],
-                'wbtc_balance': row['wbtc_balance'],
-                'usdt_balance': row['usdt_balance'],
-                'usdc_balance': row['usdc_balance'],
-                'dai_balance': row['dai_balance'],
-                'timestamp': row['timestamp'],
-                'last_update_timestamp': row['last_update_timestamp']
-            })
-        
-        conn.close()
-
-        _record_stats(name, 'tvl_down', updated=len(tvl_data), ok=1)
+        start_key = _page_start()
+    except (ValueError, TypeError):
         return jsonify({
-            'success': True,
-            'chain': name,
-            'tvl_data': tvl_data,
-            'count': len(tvl_data)
-        })
+            'success': False,
+            'error': 'invalid cursor'
+        }), 400
+    
+    try:
+        balance_scale = _requested_balance_scale(request.args.get('balance_scale'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    try:
+        conn = get_tvl_db_connection(name)
+        transform, extra_fields = _balance_output(name, balance_scale)
+        return _update_page(
+            name, conn, start_key, 'author_balances', 'author_address',
+            """author_address, eth_balance, weth_balance, wbtc_balance,
+               usdt_balance, usdc_balance, dai_balance, timestamp, last_update_timestamp""",
+            '', '>', 'tvl_data', 'tvl_down', transform, extra_fields)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -349,13 +522,15 @@ def get_tvl(name):
 @app.route('/<name>/get_code', methods=['GET'])
 @require_token
 def get_code(name):
-    """Get code data updated after the specified timestamp
+    """Get code data updated after the specified cursor
     
     Parameters:
+        cursor: string - 上一页返回的 next_cursor; 空串表示从 last_update_timestamp 开始
         last_update_timestamp: int - last update timestamp (Unix timestamp)
+                               (不带 cursor 时为旧的翻页方式: 大于等于该时间戳)
     
     Returns:
-        List of code data (max 10000 rows)
+        List of code data (max 10000 rows) and next_cursor
     """
     # 验证链名称
     error_response = validate_chain_name(name)
@@ -363,43 +538,33 @@ def get_code(name):
         return error_response
     
     try:
-        last_update_timestamp = request.args.get('last_update_timestamp', type=int, default=0)
-        
-        conn = get_code_db_connection(name)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT code_address, code, timestamp, last_update_timestamp
-            FROM codes
-            WHERE last_update_timestamp >= ?
-            ORDER BY last_update_timestamp ASC
-            LIMIT 10000
-        """, (last_update_timestamp,))
-        
-        code_data = []
-        for row in cursor.fetchall():
-            code_data.append({
-                'code_address': row['code_address'],
-                'code': row['code'],
-                'timestamp': row['timestamp'],
-                'last_update_timestamp': row['last_update_timestamp']
-            })
-        
-        conn.close()
-
-        _record_stats(name, 'code_down', updated=len(code_data), ok=1)
+        start_key = _page_start()
+    except (ValueError, TypeError):
         return jsonify({
-            'success': True,
-            'chain': name,
-            'code_data': code_data,
-            'count': len(code_data)
-        })
+            'success': False,
+            'error': 'invalid cursor'
+        }), 400
+    
+    try:
+        conn = get_code_db_connection(name)
+        return _update_page(
+            name, conn, start_key, 'codes', 'code_address',
+            f"""codes.code_address, codes.code_hash, {code_store.CODE_COLUMN} AS code,
+               codes.timestamp, codes.last_update_timestamp""",
+            code_store.JOIN_BLOBS, '>=', 'code_data', 'code_down')
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+def _stage_addresses(conn, addresses):
+    """本次上传的地址 (去重) 写进连接私有的临时表 staged_addresses"""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS staged_addresses (address TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.staged_addresses")
+    conn.executemany("INSERT OR IGNORE INTO temp.staged_addresses (address) VALUES (?)",
+                     ((address,) for address in addresses))
+
 @app.route('/<name>/add_tvl_addresses', methods=['POST'])
 @require_token
 def add_tvl_addresses(name):
@@ -407,6 +572,7 @@ def add_tvl_addresses(name):
     
     Request body:
         addresses: list of address strings
+        balance_scale: int - 同 get_tvl, 决定 existed 里余额的格式
     
     Returns:
         Success status and count of added addresses
@@ -444,56 +610,37 @@ def add_tvl_addresses(name):
                 'message': 'No addresses provided'
             })
         
+        try:
+            balance_scale = _requested_balance_scale(data.get('balance_scale'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        transform, extra_fields = _balance_output(name, balance_scale)
+        
         # Get TVL database connection
         conn = get_tvl_db_connection(name)
-        cursor = conn.cursor()
-        
-        # Check table structure
-        cursor.execute("PRAGMA table_info(author_balances)")
-        columns = [col[1] for col in cursor.fetchall()]
-        
-        # Batch insert addresses
-        import time as time_module
-        current_timestamp = int(time_module.time())
-        added_count = 0
-        existed_data = []
-        
-        for address in addresses:
-            try:
-                # Try to insert with default values
-                cursor.execute("""
-                    INSERT OR IGNORE INTO author_balances 
-                    (author_address, eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance, timestamp, last_update_timestamp)
-                    VALUES (?, 0, 0, 0, 0, 0, 0, ?, ?)
-                """, (address, 0, current_timestamp))
-                if cursor.rowcount > 0:
-                    added_count += 1
-                else:
-                    # Address already exists, read its data
-                    cursor.execute("""
-                        SELECT author_address, eth_balance, weth_balance, wbtc_balance,
-                               usdt_balance, usdc_balance, dai_balance, timestamp, last_update_timestamp
-                        FROM author_balances
-                        WHERE author_address = ?
-                    """, (address,))
-                    row = cursor.fetchone()
-                    if row:
-                        existed_data.append({
-                            'author_address': row['author_address'],
-                            'eth_balance': row['eth_balance'],
-                            'weth_balance': row['weth_balance'],
-                            'wbtc_balance': row['wbtc_balance'],
-                            'usdt_balance': row['usdt_balance'],
-                            'usdc_balance': row['usdc_balance'],
-                            'dai_balance': row['dai_balance'],
-                            'timestamp': row['timestamp'],
-                            'last_update_timestamp': row['last_update_timestamp']
-                        })
-            except Exception as e:
-                print(f"Error adding TVL address {address}: {e}")
+        current_timestamp = int(time.time())
         
+        # 整批一次入临时表: 已存在的行一次 join 取回, 新地址一条语句插入
+        conn.execute("BEGIN IMMEDIATE")
+        _stage_addresses(conn, addresses)
+        existed_data = [dict(row) for row in conn.execute("""
+            SELECT author_balances.author_address, eth_balance, weth_balance, wbtc_balance,
+                   usdt_balance, usdc_balance, dai_balance, timestamp, last_update_timestamp
+            FROM temp.staged_addresses
+            JOIN author_balances ON author_balances.author_address = staged_addresses.address
+        """)]
+        added_count = conn.execute("""
+            INSERT OR IGNORE INTO author_balances 
+            (author_address, eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance, timestamp, last_update_timestamp)
+            SELECT address, 0, 0, 0, 0, 0, 0, 0, ? FROM temp.staged_addresses
+        """, (current_timestamp,)).rowcount
         conn.commit()
         conn.close()
+        if transform:
+            existed_data = [transform(record) for record in existed_data]
         
         return jsonify({
             'success': True,
@@ -501,7 +648,8 @@ def add_tvl_addresses(name):
             'added_count': added_count,
             'total_addresses': len(addresses),
             'existed': existed_data,
-            'existed_count': len(existed_data)
+            'existed_count': len(existed_data),
+            **extra_fields
         })
     except Exception as e:
         return jsonify({
@@ -555,42 +703,23 @@ def add_code_addresses(name):
         
         # Get code database connection
         conn = get_code_db_connection(name)
-        cursor = conn.cursor()
-        
-        # Batch insert addresses
-        import time as time_module
-        current_timestamp = int(time_module.time())
-        added_count = 0
-        existed_data = []
-        
-        for address in addresses:
-            try:
-                # Try to insert with empty code
-                cursor.execute("""
-                    INSERT OR IGNORE INTO codes 
-                    (code_address, code, timestamp, last_update_timestamp)
-                    VALUES (?, '', ?, ?)
-                """, (address, 0, current_timestamp))
-                if cursor.rowcount > 0:
-                    added_count += 1
-                else:
-                    # Address already exists, read its data
-                    cursor.execute("""
-                        SELECT code_address, code, timestamp, last_update_timestamp
-                        FROM codes
-                        WHERE code_address = ?
-                    """, (address,))
-                    row = cursor.fetchone()
-                    if row:
-                        existed_data.append({
-                            'code_address': row['code_address'],
-                            'code': row['code'],
-                            'timestamp': row['timestamp'],
-                            'last_update_timestamp': row['last_update_timestamp']
-                        })
-            except Exception as e:
-                print(f"Error adding code address {address}: {e}")
+        current_timestamp = int(time.time())
         
+        # 整批一次入临时表: 已存在的行一次 join 取回, 新地址一条语句插入
+        conn.execute("BEGIN IMMEDIATE")
+        _stage_addresses(conn, addresses)
+        existed_data = [dict(row) for row in conn.execute(f"""
+            SELECT codes.code_address, {code_store.CODE_COLUMN} AS code, codes.code_hash,
+                   codes.timestamp, codes.last_update_timestamp
+            FROM temp.staged_addresses
+            JOIN codes ON codes.code_address = staged_addresses.address
+            {code_store.JOIN_BLOBS}
+        """)]
+        added_count = conn.execute("""
+            INSERT OR IGNORE INTO codes 
+            (code_address, code, timestamp, last_update_timestamp)
+            SELECT address, '', 0, ? FROM temp.staged_addresses
+        """, (current_timestamp,)).rowcount
         conn.commit()
         conn.close()
         
@@ -608,6 +737,68 @@ def add_code_addresses(name):
             'error': str(e)
         }), 500
 
+# 快照导出很重 (整库复制 + 压缩): 同一条链串行构建, 不同链互不阻塞
+# (链名已经过 validate_chain_name, 锁按 ALLOWED_NAMES 预先建好)
+_snapshot_locks = {name: threading.Lock() for name in ALLOWED_NAMES}
+
+@app.route('/<name>/snapshot', methods=['GET'])
+@require_token
+def snapshot(name):
+    """Download a compressed bootstrap snapshot of one database
+    
+    Parameters:
+        db: block / tvl / code
+    
+    Returns:
+        gzip 压缩的 SQLite 库 (本地库表结构), 解压后直接作为 {name}_{db}.db 使用;
+        快照覆盖到的块号 / 最大 last_update_timestamp 在响应头 X-Snapshot-Height
+    """
+    # 验证链名称
+    error_response = validate_chain_name(name)
+    if error_response:
+        return error_response
+    
+    kind = request.args.get('db', '')
+    if kind not in snapshot_export.KINDS:
+        return jsonify({
+            'success': False,
+            'error': f"db must be one of {', '.join(snapshot_export.KINDS)}"
+        }), 400
+    
+    try:
+        with _snapshot_locks[name]:
+            # 快照缓存 SNAPSHOT_MAX_AGE 秒, 多个新节点同时初始化只导出一次
+            info = snapshot_export.read_info(name, kind)
+            if info is None or time.time() - info['created_at'] > SNAPSHOT_MAX_AGE:
+                block_db_path, code_db_path, tvl_db_path = get_db_paths(name)
+                source_path = {'block': block_db_path, 'tvl': tvl_db_path, 'code': code_db_path}[kind]
+                if not os.path.exists(source_path):
+                    return jsonify({
+                        'success': False,
+                        'error': f'{kind} db not found'
+                    }), 404
+                # 先走一遍下载接口的连接: 旧库在这里补齐结构 (code_blobs / 定点余额列) 再导出
+                if kind == 'tvl':
+                    get_tvl_db_connection(name).close()
+                elif kind == 'code':
+                    get_code_db_connection(name).close()
+                info = snapshot_export.build(name, kind, source_path)
+            # 在锁内打开文件: 之后即使被重建替换, 已打开的文件照常发完
+            response = send_file(os.path.abspath(snapshot_export.snapshot_path(name, kind)),
+                                 mimetype='application/gzip', as_attachment=True,
+                                 download_name=f'{name}_{kind}.db.gz')
+        response.headers['X-Snapshot-Height'] = str(info['height'])
+        response.headers['X-Snapshot-Rows'] = str(info['rows'])
+        response.headers['X-Snapshot-Created'] = str(info['created_at'])
+        if kind == 'tvl':
+            response.headers['X-Balance-Scale'] = str(balance_units.BALANCE_SCALE)
+        return response
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/<name>/confirm_height', methods=['POST'])
 @require_token
 def confirm_height(name):
@@ -735,6 +926,8 @@ STATS_WINDOW = 3600  # 看板统计最近 1 小时
 STATS_KINDS = ('block', 'tvl', 'code', 'tvl_down', 'code_down')
 STATS_LOCK = threading.Lock()
 STATS_EVENTS = defaultdict(deque)  # (name, kind) -> deque[(ts, updated, success, failed)]
+# 抓取脚本随统计带上来的各端点当前指标 (EndpointScheduler.snapshot), 只留最新一份
+ENDPOINT_METRICS = {}  # (name, kind) -> (ts, {url: metrics})
 
 
 def _record_stats(name, kind, updated=0, ok=0, fail=0):
@@ -758,7 +951,7 @@ def report_stats(name):
 
     kind 区分来源: block (get_block_batch, 不传时的默认值, 兼容旧脚本) /
     tvl (get_tvl) / code (get_code)。blocks_added 在 tvl/code 语义下是
-    成功更新的记录数。
+    成功更新的记录数。可选的 endpoints 是各端点当前的延迟/成功率等指标。
     """
     error_response = validate_chain_name(name)
     if error_response:
@@ -772,11 +965,14 @@ def report_stats(name):
         updated = int(data.get('blocks_added', 0))
         success = int(data.get('success_requests', 0))
         failed = int(data.get('failed_requests', 0))
+        endpoints = data.get('endpoints')
         now = time.time()
         with STATS_LOCK:
             events = STATS_EVENTS[(name, kind)]
             events.append((now, updated, success, failed))
             _prune_stats(events, now)
+            if isinstance(endpoints, dict):
+                ENDPOINT_METRICS[(name, kind)] = (now, endpoints)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -812,6 +1008,18 @@ def _stats_1h(name):
     return result
 
 
+def _endpoint_metrics(name):
+    """各 kind 最近一次上报的端点指标, 超过统计窗口的视为过期不展示"""
+    now = time.time()
+    result = {}
+    with STATS_LOCK:
+        for kind in ('block', 'tvl', 'code'):
+            item = ENDPOINT_METRICS.get((name, kind))
+            if item and now - item[0] <= STATS_WINDOW:
+                result[kind] = {'reported_at': int(item[0]), 'endpoints': item[1]}
+    return result
+
+
 def _chain_status(name):
     """收集单条链的同步状态 (只用走索引的查询, 保证看板秒开)"""
     status = {'chain': name}
@@ -863,6 +1071,7 @@ def _chain_status(name):
             status[key] = {'error': str(e)}
 
     status['stats_1h'] = _stats_1h(name)
+    status['endpoints'] = _endpoint_metrics(name)
     return status
 
 
@@ -916,6 +1125,7 @@ DASHBOARD_HTML = """<!DOCTYPE html>
   <thead><tr>
     <th>chain</th><th>start block</th><th>highest block</th><th>latest block time</th>
     <th>behind</th><th>blocks +1h</th><th>req ok 1h</th><th>req fail 1h</th>
+    <th>endpoints</th>
     <th>tvl req 1h</th><th>code req 1h</th>
     <th>tvl dl 1h</th><th>code dl 1h</th>
     <th>block db</th><th>tvl db</th><th>code db</th>
@@ -963,6 +1173,22 @@ async function refresh() {
       return '<td class="' + cls + '" title="updated: ' + (k.updated || 0).toLocaleString() + '">' +
         k.success_requests.toLocaleString() + ' / ' + k.failed_requests.toLocaleString() + '</td>';
     };
+    const fmtEndpoints = e => {
+      // 各 kind 的端点合并展示: 正常数 / 罚站数, 悬停看每个端点的延迟和成功率
+      const lines = [];
+      let ok = 0, pen = 0;
+      for (const kind of Object.keys(e || {})) {
+        for (const [url, m] of Object.entries(e[kind].endpoints || {})) {
+          if (m.penalized) pen++; else ok++;
+          lines.push(kind + ' ' + url + ': ' + (m.latency_ms != null ? m.latency_ms + 'ms' : '-') +
+            ', ok ' + Math.round((m.success_rate || 0) * 100) + '%, inflight ' + (m.inflight || 0) +
+            (m.penalized ? ', penalized' : ''));
+        }
+      }
+      if (!lines.length) return '<td class="dim">-</td>';
+      return '<td class="' + (pen > 0 ? 'warn' : 'ok') + '" title="' + lines.join('&#10;') + '">' +
+        ok + ' / ' + pen + '</td>';
+    };
     const fmtDown = k => {
       if (!k || !k.success_requests) return '<td class="dim">-</td>';
       return '<td class="ok" title="requests: ' + k.success_requests.toLocaleString() + '">' +
@@ -976,6 +1202,7 @@ async function refresh() {
       '<td class="' + addCls + '">' + (s.blocks_added || 0).toLocaleString() + '</td>' +
       '<td>' + (s.success_requests || 0).toLocaleString() + '</td>' +
       '<td class="' + failCls + '">' + (s.failed_requests || 0).toLocaleString() + '</td>' +
+      fmtEndpoints(c.endpoints) +
       fmtKind(s.tvl) + fmtKind(s.code) +
       fmtDown(s.tvl_down) + fmtDown(s.code_down) +
       '<td>' + fmtSize(b.db_size) + '</td>' +
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""TVL 刷新的优先级调度, 取代 get_tvl 里 "timestamp 过期就刷" 的固定周期扫描。
+
+每个地址按下面的规则分档, 决定多久刷新一次:
+    立即  块库里出现了它在上次刷新之后签的 type4 授权 (余额大概率变了)
+    hot   最近 1 小时有 type4 活动, 或 TVL >= HOT_VALUE           -> hot_interval (默认 5 分钟)
+    warm  最近 1 天有 type4 活动, 或 TVL >= WARM_VALUE,
+          或最近 1 天内余额变过 (last_update_timestamp 较新)       -> warm_interval (默认 1 小时)
+    cold  其余                                                     -> cold_interval (默认 1 天, 即 --data_expiry)
+到期的地址按 "已过期时长 / 刷新周期" 从大到小排, 每轮取多少由每小时 eth_call 预算决定
+(一次合约调用查 ADDRESSES_PER_CALL 个地址), 预算用完的轮次只刷最急的那部分。
+
+type4 活动从块库增量扫描: tvl 库里记着扫到的块号, 每轮只看新块里的 type4 交易,
+ecrecover 出授权人后累计到 author_activity。首次运行只回看最近 1 天。
+
+TVL 只用来分档, 按 REFERENCE_PRICES 粗略折成美元, 不追求精确。
+"""
+
+import json
+import sqlite3
+from collections import defaultdict
+
+import type4_codec
+import balance_units
+
+ADDRESSES_PER_CALL = 500
+
+HOT_WINDOW = 3600
+WARM_WINDOW = 86400
+HOT_VALUE = 100000
+WARM_VALUE = 1000
+
+# 分档用的粗略参考价 (美元)
+REFERENCE_PRICES = {'eth': 3000, 'btc': 60000, 'bnb': 600, 'bera': 5}
+
+# 每次从块库读多少个块的 type4 交易
+SCAN_BLOCKS = 20000
+
+
+def ensure_schema(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS author_activity (
+        author_address TEXT PRIMARY KEY,
+        last_seen_block INTEGER,
+        last_seen_timestamp INTEGER,
+        tx_count INTEGER
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS tvl_call_log (
+        timestamp INTEGER,
+        calls INTEGER
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tvl_call_log_timestamp ON tvl_call_log(timestamp)')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS tvl_scheduler_state (
+        key TEXT PRIMARY KEY,
+        value INTEGER
+    )
+    ''')
+    conn.commit()
+
+
+def value_sql(name):
+    """author_balances 一行折成美元的 SQL 表达式 (定点整数列, 见 balance_units)"""
+    native = {'bsc': REFERENCE_PRICES['bnb'], 'bera': REFERENCE_PRICES['bera'], 'gnosis': 1}.get(
+        name, REFERENCE_PRICES['eth'])
+    return balance_units.tvl_value_sql((native, REFERENCE_PRICES['eth'], REFERENCE_PRICES['btc']), table='b')
+
+
+def _state(conn, key):
+    row = conn.execute("SELECT value FROM tvl_scheduler_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_state(conn, key, value):
+    conn.execute("INSERT INTO tvl_scheduler_state (key, value) VALUES (?, ?) "
+                 "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, value))
+
+
+def _first_block_since(block_conn, timestamp):
+    """块时间戳单调递增, 按块号二分找第一个 timestamp >= 给定值的块 (块号可能有缺口)"""
+    lo, hi = block_conn.execute("SELECT MIN(block_number), MAX(block_number) FROM blocks").fetchone()
+    if lo is None:
+        return None
+    while lo < hi:
+        mid = (lo + hi) // 2
+        row = block_conn.execute("SELECT block_number, timestamp FROM blocks WHERE block_number >= ? "
+                                 "ORDER BY block_number LIMIT 1", (mid,)).fetchone()
+        if row[1] >= timestamp:
+            hi = mid
+        else:
+            lo = row[0] + 1
+    return lo
+
+
+def scan_activity(conn, block_db_path, recover, now):
+    """
+    把块库里上次扫描之后的 type4 授权计入 author_activity
+    :param recover: recover(authorization) -> 小写授权人地址, 失败返回 None
+    :return: 本轮扫到的授权数
+    """
+    try:
+        block_conn = sqlite3.connect(f'file:{block_db_path}?mode=ro', uri=True, timeout=60)
+        latest = block_conn.execute("SELECT MAX(block_number) FROM blocks").fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"[tvl_scheduler] block db not readable, skipping activity scan: {e}")
+        return 0
+    if latest is None:
+        block_conn.close()
+        return 0
+
+    scanned = _state(conn, 'activity_block')
+    if scanned is None:
+        first = _first_block_since(block_conn, now - WARM_WINDOW)
+        scanned = first - 1 if first is not None else latest
+
+    tx_data_sql = type4_codec.tx_data_sql(block_conn)
+    seen = 0
+    while scanned < latest:
+        end = min(latest, scanned + SCAN_BLOCKS)
+        activity = defaultdict(lambda: [0, 0, 0])  # author -> [last block, last timestamp, count]
+        rows = block_conn.execute(
+            f"SELECT t.block_number, b.timestamp, t.tx_hash, {tx_data_sql} FROM type4_transactions t "
+            f"LEFT JOIN blocks b ON b.block_number = t.block_number "
+            f"WHERE t.block_number > ? AND t.block_number <= ?", (scanned, end))
+        for block_number, timestamp, tx_hash, *stored in rows:
+            try:
+                tx = json.loads(type4_codec.decode(block_number, tx_hash, *stored))
+            except (ValueError, TypeError):
+                continue
+            for authorization in tx.get('authorizationList') or []:
+                author = recover(authorization)
+                if author is None:
+                    continue
+                item = activity[author]
+                item[0] = max(item[0], block_number)
+                item[1] = max(item[1], timestamp or 0)
+                item[2] += 1
+                seen += 1
+        conn.executemany(
+            "INSERT INTO author_activity (author_address, last_seen_block, last_seen_timestamp, tx_count) "
+            "VALUES (?, ?, ?, ?) ON CONFLICT(author_address) DO UPDATE SET "
+            "last_seen_block = MAX(last_seen_block, excluded.last_seen_block), "
+            "last_seen_timestamp = MAX(last_seen_timestamp, excluded.last_seen_timestamp), "
+            "tx_count = tx_count + excluded.tx_count",
+            [(author, *item) for author, item in activity.items()])
+        _set_state(conn, 'activity_block', end)
+        conn.commit()
+        scanned = end
+    block_conn.close()
+    print(f"[tvl_scheduler] activity scanned up to block {scanned}: {seen} authorizations")
+    return seen
+
+
+def remaining_calls(conn, now, calls_per_hour):
+    """最近一小时还剩多少次 eth_call 预算, calls_per_hour <= 0 表示不限 (返回 None)"""
+    if calls_per_hour <= 0:
+        return None
+    used = conn.execute("SELECT COALESCE(SUM(calls), 0) FROM tvl_call_log WHERE timestamp > ?",
+                        (now - 3600,)).fetchone()[0]
+    return max(0, calls_per_hour - used)
+
+
+def record_calls(conn, now, calls):
+    conn.execute("INSERT INTO tvl_call_log (timestamp, calls) VALUES (?, ?)", (now, calls))
+    conn.execute("DELETE FROM tvl_call_log WHERE timestamp < ?", (now - 86400,))
+    conn.commit()
+
+
+def due_addresses(conn, name, now, limit, hot_interval, warm_interval, cold_interval):
+    """到期的地址, 最急的在前"""
+    value = value_sql(name)
+    # 过滤脏行: ecrecover 失败的哨兵值 'error' 曾一路漏进库里, 编进批次会
+    # 让整批 500 个地址的合约调用陪葬, 且该行永远刷不新、每轮必炸
+    cursor = conn.execute(f"""
+        SELECT author_address FROM (
+            SELECT b.author_address, b.timestamp,
+                   CASE WHEN a.last_seen_timestamp > b.timestamp THEN 0
+                        WHEN a.last_seen_timestamp >= :hot_since OR {value} >= :hot_value THEN :hot
+                        WHEN a.last_seen_timestamp >= :warm_since OR {value} >= :warm_value
+                             OR b.last_update_timestamp >= :warm_since THEN :warm
+                        ELSE :cold END AS refresh_interval
+            FROM author_balances b
+            LEFT JOIN author_activity a ON a.author_address = b.author_address
+            WHERE b.author_address LIKE '0x%' AND LENGTH(b.author_address) = 42
+        )
+        WHERE timestamp <= :now - refresh_interval
+        ORDER BY (:now - timestamp) * 1.0 / MAX(refresh_interval, 1) DESC
+        LIMIT :limit
+    """, {'now': now, 'limit': limit, 'hot_since': now - HOT_WINDOW, 'warm_since': now - WARM_WINDOW,
+          'hot_value': HOT_VALUE, 'warm_value': WARM_VALUE,
+          'hot': hot_interval, 'warm': warm_interval, 'cold': cold_interval})
+    return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""块号缺口索引。
+
+原来找缺块的做法是把起始块之后的所有块号读进 Python set, 再对
+range(start, end) 逐个整数查 set: 几百万块就是几百 MB 内存和几百万次查找。
+这里改为在 SQLite 里用窗口函数 LAG 对相邻块号求差, 只把缺口区间
+(lo, hi) 返回给 Python, 内存和后续遍历都只与缺口数成正比。
+
+SQLite >= 3.25 (窗口函数)。表只要求有带索引的 block_number 列
+(blocks / traces 都满足)。
+
+用法:
+    ranges = gap_index.missing_ranges(conn, 'blocks', start, end)  # [(lo, hi), ...] 闭区间, end 不含
+    contiguous = gap_index.contiguous_until(ranges, start, end)     # 推水位线用
+    for block_number in gap_index.iter_blocks(ranges): ...
+"""
+
+import itertools
+
+
+def missing_ranges(conn, table, start, end):
+    """[start, end) 内缺失的块号区间, 返回 [(lo, hi), ...] (闭区间, 升序)"""
+    if end <= start:
+        return []
+    cursor = conn.cursor()
+    # LAG 的默认值取 start-1, 开头的缺口也能被同一个条件识别出来
+    cursor.execute(f"""
+        SELECT prev + 1, block_number - 1 FROM (
+            SELECT block_number,
+                   LAG(block_number, 1, ?) OVER (ORDER BY block_number) AS prev
+            FROM {table}
+            WHERE block_number >= ? AND block_number < ?
+        )
+        WHERE block_number > prev + 1
+    """, (start - 1, start, end))
+    ranges = [(lo, hi) for lo, hi in cursor.fetchall()]
+
+    # 结尾的缺口 (最后一个已有块之后到 end) 窗口里看不到, 单独补
+    cursor.execute(f"SELECT MAX(block_number) FROM {table} WHERE block_number >= ? AND block_number < ?",
+                   (start, end))
+    last = cursor.fetchone()[0]
+    if last is None:
+        return [(start, end - 1)]
+    if last < end - 1:
+        ranges.append((last + 1, end - 1))
+    return ranges
+
+
+def contiguous_until(ranges, start, end):
+    """由缺口区间推出从 start 起连续存在的最高块, start 本身就缺时返回 start-1"""
+    if ranges:
+        return ranges[0][0] - 1
+    return end - 1
+
+
+def count_blocks(ranges):
+    return sum(hi - lo + 1 for lo, hi in ranges)
+
+
+def iter_blocks(ranges, limit=None):
+    """把缺口区间按升序展开成块号, limit 限制最多产出多少个"""
+    blocks = itertools.chain.from_iterable(range(lo, hi + 1) for lo, hi in ranges)
+    if limit is not None:
+        blocks = itertools.islice(blocks, limit)
+    return blocks
@@ -10,6 +10,7 @@ from collections import Counter
 from hexbytes import HexBytes
 import random
 import argparse
+import gap_index
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--openethereumx_url', required=True, help='Openethereumx URL (e.g., http://server:5000)')
@@ -113,13 +114,6 @@ def process_block(block_number):
         conn.rollback()
         return False
 
-# Get all existing block numbers from database
-def get_existing_blocks(conn):
-    cursor = conn.cursor()
-    cursor.execute("SELECT block_number FROM traces WHERE block_number >= ?", (START_BLOCK,))
-    existing_blocks = set(row[0] for row in cursor.fetchall())
-    return existing_blocks
-
 def main():
     # Initialize database
     conn = init_db()
@@ -129,18 +123,11 @@ def main():
         latest_block = random.choice(web3s).eth.block_number
         print(f"Current latest block: {latest_block}")
         
-        # Get all existing block numbers at once
-        existing_blocks = get_existing_blocks(conn)
-        print(f"Found {len(existing_blocks)} existing blocks in database")
-        
-        blocks_needed = []
-        for block_number in range(START_BLOCK, latest_block):
-            if block_number not in existing_blocks:
-                blocks_needed.append(block_number)
-                if len(blocks_needed) > 10000:
-                    break
-        
-        del existing_blocks
+        # 缺口区间直接由 SQL 算出, 不再把已有块号全读进内存
+        ranges = gap_index.missing_ranges(conn, 'traces', START_BLOCK, latest_block)
+        print(f"Found {len(ranges)} gaps in database")
+
+        blocks_needed = list(gap_index.iter_blocks(ranges, limit=10000))
                 
         print(f"Number of blocks to process: {len(blocks_needed)}")
         time.sleep(1)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""syncer_server 下载接口 (get_block_txs / get_tvl / get_code) 的流式响应格式。
+
+原来服务端把最多 10000 行 (整份字节码 / 交易 JSON) 先全部放进一个 list 再一次
+jsonify, 客户端也要等最后一个字节到了才能 response.json()。现在改成换行分隔的 JSON:
+
+    {"success": true, "chain": "mainnet", "records": "tvl_data"}     头, 第一行
+    {...}                                                          每条记录一行
+    {...}
+    {"__end__": true, "success": true, "count": 2}                 尾, 最后一行
+
+  - 服务端边读游标边编码, 每 FLUSH_ROWS 行 flush 一次, 内存占用与结果行数无关
+  - 请求带 Accept-Encoding: gzip 时整条流用 gzip 压缩 (逐块 Z_SYNC_FLUSH, 仍可增量解压)
+  - 读游标中途出错时尾行 success 为 false 并带 error; 客户端没收到尾行 (连接断开)
+    就当作失败, 已经收到的记录照常写入, 下一轮从本地最大时间戳续传
+  - 只有请求头 Accept 含 CONTENT_TYPE 才返回流, 旧客户端仍拿到原来的整块 JSON;
+    iter_records 也兼容旧服务端的整块 JSON 响应
+
+本文件在 backend_cloud / backend_local 各有一份, 保持一致。
+"""
+
+import json
+import zlib
+from itertools import islice
+
+CONTENT_TYPE = 'application/x-ndjson'
+FLUSH_ROWS = 500
+END_KEY = '__end__'
+
+
+class StreamError(Exception):
+    pass
+
+
+def _dump(obj):
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def encode(header, rows, compress=False, trailer_fields=None):
+    """
+    生成器: 头一行, rows 每条一行, 最后尾一行
+    :param header: 头行 dict (success / chain / records 字段名)
+    :param rows: 记录 dict 的迭代器 (通常直接包着数据库游标)
+    :param compress: 是否 gzip
+    :param trailer_fields: rows 读完后调用, 返回要并进尾行的字段 (如下一页的游标)
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    lines = [_dump(header)]
+    count = 0
+    trailer = {END_KEY: True, 'success': True}
+    try:
+        for row in rows:
+            lines.append(_dump(row))
+            count += 1
+            if len(lines) >= FLUSH_ROWS:
+                yield _chunk(compressor, lines, zlib.Z_SYNC_FLUSH)
+                lines = []
+        if trailer_fields is not None:
+            trailer.update(trailer_fields())
+    except Exception as e:
+        trailer = {END_KEY: True, 'success': False, 'error': str(e)}
+    trailer['count'] = count
+    lines.append(_dump(trailer))
+    yield _chunk(compressor, lines, zlib.Z_FINISH)
+
+
+def _chunk(compressor, lines, flush_mode):
+    data = ('\n'.join(lines) + '\n').encode()
+    if compressor is None:
+        return data
+    return compressor.compress(data) + compressor.flush(flush_mode)
+
+
+def iter_records(response, records_key, trailer=None, header=None):
+    """
+    生成器: requests 流式响应 (stream=True) -> 逐条记录 dict
+    服务端报错 / 流没有正常结束时抛 StreamError (之前的记录已经交出去了)
+    :param records_key: 旧的整块 JSON 响应里记录列表的字段名, 如 'tvl_data'
+    :param trailer: 传入 dict 时, 正常结束后填入尾行 (整块 JSON 时为记录以外的字段)
+    :param header: 传入 dict 时, 交出第一条记录之前填入头行 (整块 JSON 时为记录以外的字段)
+    """
+    if not response.headers.get('Content-Type', '').startswith(CONTENT_TYPE):
+        data = response.json()
+        if not data.get('success'):
+            raise StreamError(data.get('error'))
+        if header is not None:
+            header.update((key, value) for key, value in data.items() if key != records_key)
+        yield from data.get(records_key, [])
+        if trailer is not None:
+            trailer.update((key, value) for key, value in data.items() if key != records_key)
+        return
+
+    lines = (line for line in response.iter_lines(chunk_size=65536) if line)
+    first = json.loads(next(lines, b'{}'))
+    if not first.get('success'):
+        raise StreamError(first.get('error', 'empty stream'))
+    if header is not None:
+        header.update(first)
+    for line in lines:
+        record = json.loads(line)
+        if END_KEY in record:
+            if not record.get('success'):
+                raise StreamError(record.get('error'))
+            if trailer is not None:
+                trailer.update(record)
+            return
+        yield record
+    raise StreamError('stream ended without trailer')
+
+
+def batches(records, size):
+    """记录迭代器按 size 条切批, 边收边写库"""
+    records = iter(records)
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""本地缺数据地址 (待上传给服务端去抓 TVL / code) 的持久队列。
+
+原来 updater 每轮把所有缺数据的地址整份重写进 {name}_pending_tvl.txt /
+{name}_pending_code.txt, syncer_client 再 1000 个一批全部重传一遍, 上一轮已经
+传过、服务端已经收下的地址也不例外。现在改成一个 SQLite 表, 每个地址带状态:
+
+    pending_addresses (kind, address, state, first_seen, last_seen, sent_at, acked_at)
+        kind   'tvl' / 'code'
+        state  QUEUED 待上传 -> SENT 已发出 -> ACKED 服务端已确认
+
+  - updater: replace_missing(kind, 本轮缺数据的全部地址)
+        新地址入队; 本地已经有数据的地址出队; 已确认的保持不动
+  - syncer_client: take() 取一批 QUEUED (标成 SENT) -> 上传 -> ack() / release()
+        每轮只上传增量; SENT 超过 SENT_TIMEOUT 没结果 (进程中途退出) 的重新排队
+  - 已确认但本地过了 RESEND_AFTER 仍然缺数据的, 重新排队再传一次 (服务端可能丢了)
+
+库文件 ../info_local/{name}_pending.db, 两边共用; 旧的 txt 文件在 connect() 时导入后删除。
+本文件在 backend_local / info_local 各有一份, 保持一致。
+"""
+
+import os
+import time
+import sqlite3
+
+QUEUED = 0
+SENT = 1
+ACKED = 2
+
+SENT_TIMEOUT = 600
+RESEND_AFTER = 86400
+
+KINDS = ('tvl', 'code')
+
+
+def db_path(name):
+    return f'../info_local/{name}_pending.db'
+
+
+def legacy_path(name, kind):
+    return f'../info_local/{name}_pending_{kind}.txt'
+
+
+def connect(name):
+    conn = sqlite3.connect(db_path(name), timeout=60)
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+    except sqlite3.OperationalError:
+        pass
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS pending_addresses (
+        kind TEXT,
+        address TEXT,
+        state INTEGER,
+        first_seen INTEGER,
+        last_seen INTEGER,
+        sent_at INTEGER,
+        acked_at INTEGER,
+        PRIMARY KEY (kind, address)
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pending_addresses_state ON pending_addresses(kind, state)')
+    conn.commit()
+    for kind in KINDS:
+        _import_legacy(conn, name, kind)
+    return conn
+
+
+def _import_legacy(conn, name, kind):
+    """旧版 updater 留下的 txt 文件并入队列"""
+    path = legacy_path(name, kind)
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        addresses = [line.strip() for line in f if line.strip()]
+    now = int(time.time())
+    conn.executemany(
+        "INSERT OR IGNORE INTO pending_addresses (kind, address, state, first_seen, last_seen) VALUES (?, ?, ?, ?, ?)",
+        [(kind, address, QUEUED, now, now) for address in addresses])
+    conn.commit()
+    os.remove(path)
+    print(f"[pending_queue] imported {len(addresses)} addresses from {path}")
+
+
+def replace_missing(conn, kind, addresses):
+    """
+    用本轮缺数据的全部地址刷新队列
+    :return: (新入队数, 已补齐出队数)
+    """
+    now = int(time.time())
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS missing_addresses (address TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.missing_addresses")
+    conn.executemany("INSERT OR IGNORE INTO temp.missing_addresses VALUES (?)", ((a,) for a in addresses))
+    resolved = conn.execute(
+        "DELETE FROM pending_addresses WHERE kind = ? "
+        "AND address NOT IN (SELECT address FROM temp.missing_addresses)", (kind,)).rowcount
+    added = conn.execute(
+        "INSERT OR IGNORE INTO pending_addresses (kind, address, state, first_seen, last_seen) "
+        "SELECT ?, address, ?, ?, ? FROM temp.missing_addresses", (kind, QUEUED, now, now)).rowcount
+    conn.execute("UPDATE pending_addresses SET last_seen = ? WHERE kind = ?", (now, kind))
+    # 服务端确认过, 但这么久了本地还是没有数据: 再传一次
+    conn.execute("UPDATE pending_addresses SET state = ? WHERE kind = ? AND state = ? AND acked_at < ?",
+                 (QUEUED, kind, ACKED, now - RESEND_AFTER))
+    conn.commit()
+    return added, resolved
+
+
+def take(conn, kind, limit):
+    """取一批待上传的地址并标成 SENT"""
+    now = int(time.time())
+    conn.execute("BEGIN IMMEDIATE")
+    addresses = [row[0] for row in conn.execute(
+        "SELECT address FROM pending_addresses WHERE kind = ? "
+        "AND (state = ? OR (state = ? AND sent_at < ?)) LIMIT ?",
+        (kind, QUEUED, SENT, now - SENT_TIMEOUT, limit))]
+    conn.executemany("UPDATE pending_addresses SET state = ?, sent_at = ? WHERE kind = ? AND address = ?",
+                     [(SENT, now, kind, address) for address in addresses])
+    conn.commit()
+    return addresses
+
+
+def ack(conn, kind, addresses):
+    conn.executemany("UPDATE pending_addresses SET state = ?, acked_at = ? WHERE kind = ? AND address = ?",
+                     [(ACKED, int(time.time()), kind, address) for address in addresses])
+    conn.commit()
+
+
+def release(conn, kind, addresses):
+    """上传失败, 放回队列下轮再传"""
+    conn.executemany("UPDATE pending_addresses SET state = ? WHERE kind = ? AND address = ? AND state = ?",
+                     [(QUEUED, kind, address, SENT) for address in addresses])
+    conn.commit()
+
+
+def counts(conn, kind):
+    """{state: 地址数}"""
+    return dict(conn.execute("SELECT state, COUNT(*) FROM pending_addresses WHERE kind = ? GROUP BY state",
+                             (kind,)).fetchall())
@@ -2,18 +2,11 @@
 echo "Starting sync..."
 echo ""
 
-# Sync mainnet
-python3 syncer_client.py --name mainnet --server_url "$SERVER_URL" --start_block 24710000 --db_path "$DB_PATH" --download
-python3 syncer_client.py --name bsc --server_url "$SERVER_URL" --start_block 88130000 --db_path "$DB_PATH" --download
-python3 syncer_client.py --name op --server_url "$SERVER_URL" --start_block 149300000 --db_path "$DB_PATH" --download
-python3 syncer_client.py --name arb --server_url "$SERVER_URL" --start_block 444500000 --db_path "$DB_PATH" --download
-python3 syncer_client.py --name base --server_url "$SERVER_URL" --start_block 43700000 --db_path "$DB_PATH" --download
-python3 syncer_client.py --name bera --server_url "$SERVER_URL" --start_block 18590000 --db_path "$DB_PATH" --download
-python3 syncer_client.py --name gnosis --server_url "$SERVER_URL" --start_block 45280000 --db_path "$DB_PATH" --download
-python3 syncer_client.py --name ink --server_url "$SERVER_URL" --start_block 40710000 --db_path "$DB_PATH" --download
-python3 syncer_client.py --name uni --server_url "$SERVER_URL" --start_block 41360000 --db_path "$DB_PATH" --download
-python3 syncer_client.py --name scroll --server_url "$SERVER_URL" --start_block 32370000 --db_path "$DB_PATH" --download
+# 所有链在一个进程里并行同步 (共用连接池), 总耗时取决于最慢的那条链
+export ALLOWED_NAMES="mainnet,bsc,op,arb,base,bera,gnosis,ink,uni,scroll"
+START_BLOCKS="mainnet=24710000,bsc=88130000,op=149300000,arb=444500000,base=43700000,bera=18590000,gnosis=45280000,ink=40710000,uni=41360000,scroll=32370000"
+
+python3 syncer_client.py --server_url "$SERVER_URL" --start_blocks "$START_BLOCKS" --db_path "$DB_PATH" --download
 
 echo ""
 echo "Sync download completed!"
-
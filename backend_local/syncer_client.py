@@ -2,19 +2,34 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
 import json
+import zlib
 import sqlite3
 import requests
 import time
 import argparse
+import logging
+import threading
 import watermark
+import gap_index
+import balance_units
+import code_store
+import pending_queue
+import ndjson_stream
 
 # Add command line argument parsing
 parser = argparse.ArgumentParser(description='Syncer client for blockchain data')
-parser.add_argument('--name', required=True, help='Blockchain network name')
+parser.add_argument('--name', default='',
+                    help='Blockchain network name, or comma-separated names (default: $ALLOWED_NAMES)')
 parser.add_argument('--server_url', required=True, help='Syncer server URL (e.g., http://server:5000)')
 parser.add_argument('--start_block', type=int, default=0, help='Starting block number')
+parser.add_argument('--start_blocks', type=str, default='',
+                    help='Per-chain starting blocks, e.g. "mainnet=24710000,bsc=88130000"')
+parser.add_argument('--workers', type=int, default=0, help='Max chains synced concurrently (default: all)')
 parser.add_argument('--db_path', type=str, default='../info_local', help='Local database path')
+parser.add_argument('--no_snapshot', action='store_true',
+                    help='Do not bootstrap missing/empty local dbs from server snapshots')
 
 # Add mutually exclusive required group for download/upload
 mode_group = parser.add_mutually_exclusive_group(required=True)
@@ -23,10 +38,41 @@ mode_group.add_argument('--upload', action='store_true', help='Upload pending ad
 
 args = parser.parse_args()
 
-NAME = args.name
+# 多条链: --name 逗号分隔, 不给时与服务端一样读环境变量 ALLOWED_NAMES
+NAMES = [name.strip() for name in (args.name or os.environ.get('ALLOWED_NAMES', '')).split(',') if name.strip()]
+if not NAMES:
+    parser.error('--name or $ALLOWED_NAMES is required')
 SERVER_URL = args.server_url.rstrip('/')
 START_BLOCK = args.start_block
+START_BLOCKS = {}
+for item in args.start_blocks.split(','):
+    if item.strip():
+        chain, block = item.split('=', 1)
+        START_BLOCKS[chain.strip()] = int(block)
 DB_PATH = args.db_path
+WORKERS = args.workers or len(NAMES)
+
+# 所有链、所有请求共用一个 keep-alive 连接池 (原来每个请求都新建连接);
+# 每条链最多 3 路下载并行 (块 / TVL / code)
+SESSION = requests.Session()
+_adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=WORKERS * 3 + 1)
+SESSION.mount('http://', _adapter)
+SESSION.mount('https://', _adapter)
+
+# 多条链并行时输出交错: 工作线程 (以 "链/流" 命名, 见 _run_named) 的每行日志带上线程名前缀
+class _ThreadFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        if record.threadName == threading.main_thread().name:
+            return text
+        return '\n'.join(f"[{record.threadName}] {line}" if line else line for line in text.split('\n'))
+
+logger = logging.getLogger('syncer_client')
+_handler = logging.StreamHandler(sys.stdout)
+_handler.setFormatter(_ThreadFormatter('%(message)s'))
+logger.addHandler(_handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
 
 # 读取token文件
 def load_token():
@@ -36,14 +82,14 @@ def load_token():
         with open(token_file, 'r') as f:
             token = f.read().strip()
             if not token:
-                print("WARNING: syncer_token.txt is empty!")
+                logger.info("WARNING: syncer_token.txt is empty!")
                 return None
             return token
     except FileNotFoundError:
-        print("WARNING: syncer_token.txt not found! Requests will be sent without authentication.")
+        logger.info("WARNING: syncer_token.txt not found! Requests will be sent without authentication.")
         return None
     except Exception as e:
-        print(f"ERROR reading syncer_token.txt: {e}")
+        logger.info(f"ERROR reading syncer_token.txt: {e}")
         return None
 
 AUTH_TOKEN = load_token()
@@ -112,15 +158,54 @@ def init_block_db(name):
 def init_code_db(name):
     """Initialize code database"""
     _, code_db_path, _ = get_db_paths(name)
-    conn = sqlite3.connect(code_db_path)
+    conn = sqlite3.connect(code_db_path, timeout=60)
+    # 字节码按哈希存进 code_blobs (与服务端一致), 旧库先迁移
+    code_store.ensure_schema(conn)
     return conn
 
+def store_code_records(conn, records, name, meta):
+    """服务端下发的 code 记录写进本地库, 字节码按哈希去重 (签名同 store_tvl_records)"""
+    staged = code_store.stage(conn, [(record['code_address'], record['code']) for record in records])
+    conn.executemany(
+        """INSERT OR REPLACE INTO codes
+        (code_address, code_hash, code, timestamp, last_update_timestamp)
+        VALUES (?, ?, ?, ?, ?)""",
+        [(code_address, digest, inline_code, record['timestamp'], record['last_update_timestamp'])
+         for (code_address, digest, inline_code), record in zip(staged, records)])
+
 def init_tvl_db(name):
     """Initialize tvl database"""
     _, _, tvl_db_path = get_db_paths(name)
-    conn = sqlite3.connect(tvl_db_path)
+    conn = sqlite3.connect(tvl_db_path, timeout=60)
+    # 余额列是定点整数 (与服务端一致), 旧的文本列先迁移
+    balance_units.ensure_schema(conn, name)
     return conn
 
+# 请求 TVL 数据时声明按定点整数接收 (见 balance_units)
+BALANCE_PARAMS = {'balance_scale': balance_units.BALANCE_SCALE}
+
+def store_tvl_records(conn, records, name, meta):
+    """
+    服务端下发的 TVL 记录写进本地库
+    :param meta: 响应里记录以外的字段 (NDJSON 头行 / JSON 响应); 带 balance_scale 时余额
+                 是定点整数, 没有的是旧服务端的旧格式, 换算后入库
+    :raises ValueError: balance_scale 与本地不一致, 整批拒收
+    """
+    balance_scale = meta.get('balance_scale')
+    if balance_scale is not None and balance_scale != balance_units.BALANCE_SCALE:
+        raise ValueError(f"server balance_scale {balance_scale} != local {balance_units.BALANCE_SCALE}")
+    rows = []
+    for record in records:
+        balances = [record[column] for column in balance_units.BALANCE_COLUMNS]
+        if balance_scale is None:
+            balances = balance_units.from_legacy_row(name, balances)
+        rows.append((record['author_address'], *balances, record['timestamp'], record['last_update_timestamp']))
+    conn.executemany(
+        """INSERT OR REPLACE INTO author_balances 
+        (author_address, eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance, timestamp, last_update_timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        rows)
+
 def get_local_highest_block(name):
     """Get the highest block number from local database"""
     try:
@@ -132,13 +217,23 @@ def get_local_highest_block(name):
         conn.close()
         return result[0] if result[0] is not None else 0
     except Exception as e:
-        print(f"Error getting local highest block: {e}")
+        logger.info(f"Error getting local highest block: {e}")
         return 0
 
-def get_existing_blocks(cursor, from_block):
-    """Load all existing block numbers >= from_block into a set (one query)"""
-    cursor.execute("SELECT block_number FROM blocks WHERE block_number >= ?", (from_block,))
-    return set(row[0] for row in cursor.fetchall())
+def open_stream(method, path, records_key, trailer=None, header=None, **kwargs):
+    """请求下载接口, 以 NDJSON 流接收, 返回逐条记录的迭代器 (边收边写库); 头行 / 尾行字段填进 header / trailer"""
+    response = SESSION.request(
+        method,
+        f"{SERVER_URL}/{path}",
+        headers={**get_auth_headers(), 'Accept': ndjson_stream.CONTENT_TYPE},
+        stream=True,
+        timeout=10,
+        **kwargs
+    )
+    if response.status_code != 200:
+        response.close()
+        raise ndjson_stream.StreamError(f"HTTP Error {response.status_code}")
+    return ndjson_stream.iter_records(response, records_key, trailer, header)
 
 def sync_block_batch(conn, name, block_numbers):
     """Request and sync a batch of blocks from server
@@ -155,47 +250,32 @@ def sync_block_batch(conn, name, block_numbers):
         # 生成blocks字符串
         blocks_str = generate_blocks_string(block_numbers)
         
-        response = requests.post(
-            f"{SERVER_URL}/{name}/get_block_txs",
-            json={'blocks': blocks_str},
-            headers={**get_auth_headers(), 'Content-Type': 'application/json'},
-            timeout=10
-        )
-        
-        if response.status_code != 200:
-            print(f"    HTTP Error {response.status_code} for blocks: {blocks_str}")
-            return 0
-        
-        data = response.json()
-        if not data.get('success'):
-            print(f"    Error: {data.get('error')} for blocks: {blocks_str}")
-            return 0
-        
-        blocks = data.get('blocks', [])
-        
-        # Insert blocks and transactions
+        # Insert blocks and transactions as they arrive
         cursor = conn.cursor()
         synced_count = 0
-        for block in blocks:
-            try:
-                cursor.execute(
-                    "INSERT OR REPLACE INTO blocks (block_number, tx_count, type4_tx_count, timestamp) VALUES (?, ?, ?, ?)",
-                    (block['block_number'], block['tx_count'], block['type4_tx_count'], block['timestamp'])
-                )
-                
-                for tx in block.get('type4_txs', []):
+        try:
+            for block in open_stream('POST', f"{name}/get_block_txs", 'blocks', json={'blocks': blocks_str}):
+                try:
                     cursor.execute(
+                        "INSERT OR REPLACE INTO blocks (block_number, tx_count, type4_tx_count, timestamp) VALUES (?, ?, ?, ?)",
+                        (block['block_number'], block['tx_count'], block['type4_tx_count'], block['timestamp'])
+                    )
+                    
+                    cursor.executemany(
                         "INSERT OR REPLACE INTO type4_transactions (tx_hash, block_number, tx_data) VALUES (?, ?, ?)",
-                        (tx['tx_hash'], block['block_number'], tx['tx_data'])
+                        [(tx['tx_hash'], block['block_number'], tx['tx_data']) for tx in block.get('type4_txs', [])]
                     )
-                synced_count += 1
-            except Exception as e:
-                print(f"    Error inserting block {block['block_number']}: {e}")
+                    synced_count += 1
+                except Exception as e:
+                    logger.info(f"    Error inserting block {block['block_number']}: {e}")
+        except ndjson_stream.StreamError as e:
+            # 已经收到的块照常提交, 缺的块下一轮按缺口重新请求
+            logger.info(f"    Error: {e} for blocks: {blocks_str}")
         
         conn.commit()
         return synced_count
     except Exception as e:
-        print(f"    Exception syncing blocks: {e}")
+        logger.info(f"    Exception syncing blocks: {e}")
         return 0
 
 def get_last_update_timestamp(name, table_name):
@@ -213,14 +293,103 @@ def get_last_update_timestamp(name, table_name):
         conn.close()
         return result[0] if result[0] is not None else 0
     except Exception as e:
-        print(f"Error getting last update timestamp: {e}")
+        logger.info(f"Error getting last update timestamp: {e}")
         return 0
 
+def needs_snapshot(db_path, table):
+    """本地库不存在, 或表不存在 / 为空时才用快照初始化, 已有数据的库从不覆盖"""
+    if not os.path.exists(db_path):
+        return True
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None
+    except sqlite3.OperationalError:
+        return True
+    finally:
+        conn.close()
+
+def restore_snapshot(name, kind, db_path):
+    """下载服务端快照 (gzip 的 SQLite 库), 边收边解压到临时文件, 校验后原子替换本地库"""
+    start_time = time.time()
+    response = SESSION.get(
+        f"{SERVER_URL}/{name}/snapshot",
+        params={'db': kind},
+        headers=get_auth_headers(),
+        stream=True,
+        # 服务端快照过期时要先现场导出, 读超时放宽
+        timeout=(10, 3600)
+    )
+    if response.status_code != 200:
+        response.close()
+        logger.info(f"  HTTP Error {response.status_code} for {kind} snapshot")
+        return False
+    # 快照里的余额是服务端的定点整数, 倍数不一致时不能直接当本地库用
+    if kind == 'tvl' and response.headers.get('X-Balance-Scale') != str(balance_units.BALANCE_SCALE):
+        response.close()
+        logger.info(f"  tvl snapshot balance scale {response.headers.get('X-Balance-Scale')} "
+                    f"!= local {balance_units.BALANCE_SCALE}, skip")
+        return False
+    
+    tmp_path = f'{db_path}.snapshot.{os.getpid()}'
+    try:
+        decompressor = zlib.decompressobj(31)
+        with open(tmp_path, 'wb') as f:
+            for chunk in response.iter_content(1 << 20):
+                f.write(decompressor.decompress(chunk))
+            f.write(decompressor.flush())
+        if not decompressor.eof:
+            logger.info(f"  {kind} snapshot truncated, skip")
+            return False
+        
+        conn = sqlite3.connect(tmp_path)
+        check = conn.execute("PRAGMA quick_check").fetchone()[0]
+        conn.close()
+        if check != 'ok':
+            logger.info(f"  {kind} snapshot failed quick_check: {check}")
+            return False
+        
+        # 空的旧库可能留有日志文件, 先清掉, 免得被配到新库上
+        for suffix in ('-journal', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        os.replace(tmp_path, db_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    logger.info(f"  Restored {kind} snapshot: {response.headers.get('X-Snapshot-Rows')} rows "
+          f"up to {response.headers.get('X-Snapshot-Height')} "
+          f"({os.path.getsize(db_path) / 1e6:.1f} MB in {time.time() - start_time:.1f}s)")
+    return True
+
+def sync_snapshot(name):
+    """Bootstrap missing/empty local databases from server snapshots
+    
+    之后的 sync_blocks / sync_tvl / sync_code 从快照的内容接着增量同步。
+    """
+    try:
+        logger.info(f"\nChecking local databases for snapshot bootstrap...")
+        block_db_path, code_db_path, tvl_db_path = get_db_paths(name)
+        for kind, db_path, table in (('block', block_db_path, 'blocks'),
+                                     ('tvl', tvl_db_path, 'author_balances'),
+                                     ('code', code_db_path, 'codes')):
+            if not needs_snapshot(db_path, table):
+                logger.info(f"  {kind}: local data present, incremental sync only")
+                continue
+            try:
+                restore_snapshot(name, kind, db_path)
+            except Exception as e:
+                logger.info(f"  Exception restoring {kind} snapshot: {e}")
+        return True
+    except Exception as e:
+        logger.info(f"  Exception: {e}")
+        return False
+
 def sync_highest_block(name):
     """Sync highest block information"""
     try:
-        print(f"\n[{name}] Syncing highest block...")
-        response = requests.get(
+        logger.info(f"\nSyncing highest block...")
+        response = SESSION.get(
             f"{SERVER_URL}/{name}/get_highest_block",
             headers=get_auth_headers(),
             timeout=10
@@ -231,43 +400,43 @@ def sync_highest_block(name):
             if data.get('success'):
                 remote_highest = data.get('highest_block', 0)
                 local_highest = get_local_highest_block(name)
-                print(f"  Remote highest block: {remote_highest}")
-                print(f"  Local highest block: {local_highest}")
-                print(f"  Blocks behind: {remote_highest - local_highest}")
+                logger.info(f"  Remote highest block: {remote_highest}")
+                logger.info(f"  Local highest block: {local_highest}")
+                logger.info(f"  Blocks behind: {remote_highest - local_highest}")
                 return True
             else:
-                print(f"  Error: {data.get('error')}")
+                logger.info(f"  Error: {data.get('error')}")
                 return False
         else:
-            print(f"  HTTP Error: {response.status_code}")
+            logger.info(f"  HTTP Error: {response.status_code}")
             return False
     except Exception as e:
-        print(f"  Exception: {e}")
+        logger.info(f"  Exception: {e}")
         return False
 
 def sync_blocks(name, start_block):
     """Sync block and transaction data - fills in missing blocks"""
     try:
-        print(f"\n[{name}] Syncing blocks...")
+        logger.info(f"\nSyncing blocks...")
         
         # Initialize database
         conn = init_block_db(name)
         cursor = conn.cursor()
         
         # Get remote highest block
-        response = requests.get(
+        response = SESSION.get(
             f"{SERVER_URL}/{name}/get_highest_block",
             headers=get_auth_headers(),
             timeout=10
         )
         if response.status_code != 200:
-            print(f"  Failed to get remote highest block")
+            logger.info(f"  Failed to get remote highest block")
             conn.close()
             return False
         
         remote_data = response.json()
         if not remote_data.get('success'):
-            print(f"  Error: {remote_data.get('error')}")
+            logger.info(f"  Error: {remote_data.get('error')}")
             conn.close()
             return False
         
@@ -281,25 +450,24 @@ def sync_blocks(name, start_block):
         wm = watermark.read_watermark(DB_PATH, name)
         if wm is not None and wm + 1 > effective_start:
             effective_start = wm + 1
-            print(f"  Watermark: contiguous until {wm}")
+            logger.info(f"  Watermark: contiguous until {wm}")
 
-        print(f"  Start block: {start_block} (effective: {effective_start})")
-        print(f"  Local highest: {local_highest}")
-        print(f"  Remote highest: {remote_highest}")
+        logger.info(f"  Start block: {start_block} (effective: {effective_start})")
+        logger.info(f"  Local highest: {local_highest}")
+        logger.info(f"  Remote highest: {remote_highest}")
 
         if effective_start > remote_highest:
-            print(f"  No blocks to sync")
+            logger.info(f"  No blocks to sync")
             conn.close()
             return True
 
-        # 一次性载入已有块号 (代替原来逐块一条 SQL 的遍历)
-        existing_blocks = get_existing_blocks(cursor, effective_start)
-        print(f"  Found {len(existing_blocks)} existing blocks (>= {effective_start})")
+        # 缺口区间直接由 SQL 算出 (代替把已有块号全读进 set 再逐个比对)
+        ranges = gap_index.missing_ranges(conn, 'blocks', effective_start, remote_highest + 1)
+        logger.info(f"  Found {len(ranges)} gaps, {gap_index.count_blocks(ranges)} missing blocks "
+              f"(>= {effective_start})")
 
         # 推进水位线: 从 effective_start 起连续存在的最高块
-        contiguous = effective_start - 1
-        while contiguous + 1 in existing_blocks:
-            contiguous += 1
+        contiguous = gap_index.contiguous_until(ranges, effective_start, remote_highest + 1)
         if contiguous >= effective_start:
             watermark.write_watermark(DB_PATH, name, contiguous)
 
@@ -308,166 +476,139 @@ def sync_blocks(name, start_block):
         total_synced = 0
         missing_blocks = []
 
-        print(f"  Scanning blocks from {effective_start} to {remote_highest}...")
+        logger.info(f"  Scanning blocks from {effective_start} to {remote_highest}...")
 
-        for block_num in range(effective_start, remote_highest + 1):
-            if block_num not in existing_blocks:
-                # Block is missing, add to list
-                missing_blocks.append(block_num)
+        for block_num in gap_index.iter_blocks(ranges):
+            # Block is missing, add to list
+            missing_blocks.append(block_num)
 
-                # Check if batch is full
-                if len(missing_blocks) >= batch_size:
-                    # Request this batch
-                    blocks_str = generate_blocks_string(missing_blocks)
-                    print(f"  Syncing {len(missing_blocks)} missing blocks: {blocks_str}")
-                    synced = sync_block_batch(conn, name, missing_blocks)
-                    total_synced += synced
+            # Check if batch is full
+            if len(missing_blocks) >= batch_size:
+                # Request this batch
+                blocks_str = generate_blocks_string(missing_blocks)
+                logger.info(f"  Syncing {len(missing_blocks)} missing blocks: {blocks_str}")
+                synced = sync_block_batch(conn, name, missing_blocks)
+                total_synced += synced
 
-                    # Clear batch
-                    missing_blocks = []
+                # Clear batch
+                missing_blocks = []
         
         # Don't forget the last batch if it exists
         if missing_blocks:
             blocks_str = generate_blocks_string(missing_blocks)
-            print(f"  Syncing {len(missing_blocks)} missing blocks: {blocks_str}")
+            logger.info(f"  Syncing {len(missing_blocks)} missing blocks: {blocks_str}")
             synced = sync_block_batch(conn, name, missing_blocks)
             total_synced += synced
         
         conn.close()
-        print(f"  Total blocks synced: {total_synced}")
+        logger.info(f"  Total blocks synced: {total_synced}")
         return True
     except Exception as e:
-        print(f"  Exception: {e}")
+        logger.info(f"  Exception: {e}")
         return False
 
+# 与服务端 get_tvl / get_code 的每页行数一致
+PAGE_SIZE = 10000
+
+def read_cursor(conn, endpoint):
+    """本地库里保存的下载游标 (服务端给的 next_cursor, 不透明字符串), 没有时返回 None"""
+    conn.execute("CREATE TABLE IF NOT EXISTS sync_cursors (endpoint TEXT PRIMARY KEY, cursor TEXT)")
+    row = conn.execute("SELECT cursor FROM sync_cursors WHERE endpoint = ?", (endpoint,)).fetchone()
+    return row[0] if row else None
+
+def write_cursor(conn, endpoint, cursor):
+    conn.execute("INSERT OR REPLACE INTO sync_cursors (endpoint, cursor) VALUES (?, ?)", (endpoint, cursor))
+
+def download_updates(name, conn, endpoint, records_key, table_name, store_records, label, request_params=None):
+    """按服务端的 (last_update_timestamp, 地址) 游标逐页下载增量记录, 返回同步条数
+    
+    游标和数据存在同一个本地库里, 每页写完才前移; 中途断了就从上一页的游标重拉,
+    重复的记录 INSERT OR REPLACE 幂等覆盖。
+    """
+    cursor = read_cursor(conn, endpoint)
+    if cursor is None:
+        # 还没有游标 (新库 / 快照恢复的库 / 旧版本留下的库): 从本地最大时间戳 (含) 开始
+        last_timestamp = get_last_update_timestamp(name, table_name)
+        params = {'cursor': '', 'last_update_timestamp': last_timestamp}
+        logger.info(f"  Last update timestamp: {last_timestamp}")
+    else:
+        last_timestamp = 0
+        params = {'cursor': cursor}
+        logger.info(f"  Resuming from saved cursor")
+    
+    total_synced = 0
+    while True:
+        page_count = 0
+        header = {}
+        trailer = {}
+        try:
+            records = open_stream('GET', f"{name}/{endpoint}", records_key, trailer=trailer, header=header,
+                                  params={**params, **(request_params or {})})
+            for batch in ndjson_stream.batches(records, 1000):
+                store_records(conn, batch, name, header)
+                conn.commit()
+                page_count += len(batch)
+                last_timestamp = max(last_timestamp, max(record['last_update_timestamp'] for record in batch))
+        except ndjson_stream.StreamError as e:
+            logger.info(f"  Error: {e}")
+            total_synced += page_count
+            break
+        except Exception as e:
+            logger.info(f"  Error inserting {label} records: {e}")
+            total_synced += page_count
+            break
+        
+        total_synced += page_count
+        if 'next_cursor' in trailer:
+            params = {'cursor': trailer['next_cursor']}
+            write_cursor(conn, endpoint, trailer['next_cursor'])
+            conn.commit()
+        else:
+            # 旧服务端不认游标, 退回按时间戳翻页
+            params = {'last_update_timestamp': last_timestamp}
+        
+        if page_count == 0:
+            logger.info(f"  No new {label} data to sync")
+            break
+        
+        logger.info(f"  Synced {page_count} {label} records")
+        
+        # If we got less than a full page, we're done
+        if page_count < PAGE_SIZE:
+            break
+    
+    return total_synced
+
 def sync_tvl(name):
     """Sync TVL data"""
     try:
-        print(f"\n[{name}] Syncing TVL data...")
+        logger.info(f"\nSyncing TVL data...")
         
         # Initialize database
         conn = init_tvl_db(name)
-        
-        # Get last update timestamp
-        last_timestamp = get_last_update_timestamp(name, 'author_balances')
-        print(f"  Last update timestamp: {last_timestamp}")
-        
-        total_synced = 0
-        while True:
-            response = requests.get(
-                f"{SERVER_URL}/{name}/get_tvl",
-                params={'last_update_timestamp': last_timestamp},
-                headers=get_auth_headers(),
-                timeout=10
-            )
-            
-            if response.status_code != 200:
-                print(f"  HTTP Error: {response.status_code}")
-                break
-            
-            data = response.json()
-            if not data.get('success'):
-                print(f"  Error: {data.get('error')}")
-                break
-            
-            tvl_data = data.get('tvl_data', [])
-            if not tvl_data:
-                print(f"  No new TVL data to sync")
-                break
-            
-            # Insert TVL data
-            cursor = conn.cursor()
-            for record in tvl_data:
-                try:
-                    cursor.execute(
-                        """INSERT OR REPLACE INTO author_balances 
-                        (author_address, eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance, timestamp, last_update_timestamp)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                        (record['author_address'], record['eth_balance'], record['weth_balance'],
-                         record['wbtc_balance'], record['usdt_balance'], record['usdc_balance'],
-                         record['dai_balance'], record['timestamp'], record['last_update_timestamp'])
-                    )
-                    last_timestamp = max(last_timestamp, record['last_update_timestamp'])
-                except Exception as e:
-                    print(f"  Error inserting TVL record: {e}")
-            
-            conn.commit()
-            total_synced += len(tvl_data)
-            print(f"  Synced {len(tvl_data)} TVL records")
-            
-            # If we got less than 10000 records, we're done
-            if len(tvl_data) < 10000:
-                break
-        
+        total_synced = download_updates(name, conn, 'get_tvl', 'tvl_data', 'author_balances',
+                                        store_tvl_records, 'TVL', BALANCE_PARAMS)
         conn.close()
-        print(f"  Total TVL records synced: {total_synced}")
+        logger.info(f"  Total TVL records synced: {total_synced}")
         return True
     except Exception as e:
-        print(f"  Exception: {e}")
+        logger.info(f"  Exception: {e}")
         return False
 
 def sync_code(name):
     """Sync code data"""
     try:
-        print(f"\n[{name}] Syncing code data...")
+        logger.info(f"\nSyncing code data...")
         
         # Initialize database
         conn = init_code_db(name)
-        
-        # Get last update timestamp
-        last_timestamp = get_last_update_timestamp(name, 'codes')
-        print(f"  Last update timestamp: {last_timestamp}")
-        
-        total_synced = 0
-        while True:
-            response = requests.get(
-                f"{SERVER_URL}/{name}/get_code",
-                params={'last_update_timestamp': last_timestamp},
-                headers=get_auth_headers(),
-                timeout=10
-            )
-            
-            if response.status_code != 200:
-                print(f"  HTTP Error: {response.status_code}")
-                break
-            
-            data = response.json()
-            if not data.get('success'):
-                print(f"  Error: {data.get('error')}")
-                break
-            
-            code_data = data.get('code_data', [])
-            if not code_data:
-                print(f"  No new code data to sync")
-                break
-            
-            # Insert code data
-            cursor = conn.cursor()
-            for record in code_data:
-                try:
-                    cursor.execute(
-                        """INSERT OR REPLACE INTO codes 
-                        (code_address, code, timestamp, last_update_timestamp)
-                        VALUES (?, ?, ?, ?)""",
-                        (record['code_address'], record['code'], record['timestamp'], record['last_update_timestamp'])
-                    )
-                    last_timestamp = max(last_timestamp, record['last_update_timestamp'])
-                except Exception as e:
-                    print(f"  Error inserting code record: {e}")
-            
-            conn.commit()
-            total_synced += len(code_data)
-            print(f"  Synced {len(code_data)} code records")
-            
-            # If we got less than 10000 records, we're done
-            if len(code_data) < 10000:
-                break
-        
+        total_synced = download_updates(name, conn, 'get_code', 'code_data', 'codes',
+                                        store_code_records, 'code')
         conn.close()
-        print(f"  Total code records synced: {total_synced}")
+        logger.info(f"  Total code records synced: {total_synced}")
         return True
     except Exception as e:
-        print(f"  Exception: {e}")
+        logger.info(f"  Exception: {e}")
         return False
 
 def sync_wrong(name):
@@ -478,12 +619,12 @@ def sync_wrong(name):
     After successful sync, the file is removed.
     """
     try:
-        print(f"\n[{name}] Syncing wrong blocks...")
+        logger.info(f"\nSyncing wrong blocks...")
         
         wrong_block_file_path = f'../info_local/{name}_wrong_block.txt'
         
         if not os.path.exists(wrong_block_file_path):
-            print(f"  No wrong block file found")
+            logger.info(f"  No wrong block file found")
             return True
         
         try:
@@ -496,14 +637,14 @@ def sync_wrong(name):
                         try:
                             block_numbers.append(int(line))
                         except ValueError:
-                            print(f"  Invalid block number: {line}")
+                            logger.info(f"  Invalid block number: {line}")
             
             if not block_numbers:
-                print(f"  No valid block numbers found in file")
+                logger.info(f"  No valid block numbers found in file")
                 os.remove(wrong_block_file_path)
                 return True
             
-            print(f"  Found {len(block_numbers)} wrong blocks to delete: {block_numbers}")
+            logger.info(f"  Found {len(block_numbers)} wrong blocks to delete: {block_numbers}")
             
             # Send to server
             max_retries = 3
@@ -511,7 +652,7 @@ def sync_wrong(name):
             
             for retry in range(max_retries):
                 try:
-                    response = requests.post(
+                    response = SESSION.post(
                         f"{SERVER_URL}/{name}/delete_wrong_block",
                         json={'block_numbers': block_numbers},
                         headers={**get_auth_headers(), 'Content-Type': 'application/json'},
@@ -519,25 +660,25 @@ def sync_wrong(name):
                     )
                     
                     if response.status_code != 200:
-                        print(f"  HTTP Error {response.status_code} for wrong blocks (retry {retry + 1}/{max_retries})")
+                        logger.info(f"  HTTP Error {response.status_code} for wrong blocks (retry {retry + 1}/{max_retries})")
                         if retry < max_retries - 1:
                             time.sleep(2)
                             continue
                     else:
                         data = response.json()
                         if not data.get('success'):
-                            print(f"  Error: {data.get('error')} (retry {retry + 1}/{max_retries})")
+                            logger.info(f"  Error: {data.get('error')} (retry {retry + 1}/{max_retries})")
                             if retry < max_retries - 1:
                                 time.sleep(2)
                                 continue
                         else:
                             deleted_blocks = data.get('deleted_blocks', 0)
                             deleted_transactions = data.get('deleted_transactions', 0)
-                            print(f"  Successfully deleted {deleted_blocks} blocks and {deleted_transactions} transactions")
+                            logger.info(f"  Successfully deleted {deleted_blocks} blocks and {deleted_transactions} transactions")
                             success = True
                             break
                 except Exception as e:
-                    print(f"  Exception syncing wrong blocks: {e} (retry {retry + 1}/{max_retries})")
+                    logger.info(f"  Exception syncing wrong blocks: {e} (retry {retry + 1}/{max_retries})")
                     if retry < max_retries - 1:
                         time.sleep(2)
                         continue
@@ -545,19 +686,19 @@ def sync_wrong(name):
             if success:
                 # Remove file after successful sync
                 os.remove(wrong_block_file_path)
-                print(f"  Wrong block file removed: {wrong_block_file_path}")
+                logger.info(f"  Wrong block file removed: {wrong_block_file_path}")
                 # 回退本地水位线, 否则被删的块在水位线之前, 不会被重新下载
                 watermark.rollback_watermark(DB_PATH, name, min(block_numbers) - 1)
             else:
-                print(f"  Failed to sync wrong blocks after {max_retries} retries")
+                logger.info(f"  Failed to sync wrong blocks after {max_retries} retries")
                 
         except Exception as e:
-            print(f"  Error processing wrong block file: {e}")
+            logger.info(f"  Error processing wrong block file: {e}")
             
         return True
         
     except Exception as e:
-        print(f"  Exception: {e}")
+        logger.info(f"  Exception: {e}")
         return False
 
 def sync_confirm(name):
@@ -570,7 +711,7 @@ def sync_confirm(name):
     try:
         import glob
         import re
-        print(f"\n[{name}] Syncing confirmed height...")
+        logger.info(f"\nSyncing confirmed height...")
 
         confirmed_files = []
         for path in glob.glob(f'{DB_PATH}/{name}_confirmed_*'):
@@ -579,311 +720,230 @@ def sync_confirm(name):
                 confirmed_files.append((path, int(m.group(1))))
 
         if not confirmed_files:
-            print(f"  No confirmed file found")
+            logger.info(f"  No confirmed file found")
             return True
 
         height = max(block for _, block in confirmed_files)
-        print(f"  Confirmed height: {height}")
+        logger.info(f"  Confirmed height: {height}")
 
         max_retries = 3
         for retry in range(max_retries):
             try:
-                response = requests.post(
+                response = SESSION.post(
                     f"{SERVER_URL}/{name}/confirm_height",
                     json={'height': height},
                     headers={**get_auth_headers(), 'Content-Type': 'application/json'},
                     timeout=10
                 )
                 if response.status_code == 200 and response.json().get('success'):
-                    print(f"  Confirmed height {height} uploaded")
+                    logger.info(f"  Confirmed height {height} uploaded")
                     for path, _ in confirmed_files:
                         try:
                             os.remove(path)
                         except OSError:
                             pass
                     return True
-                print(f"  HTTP {response.status_code}: {response.text[:100]} (retry {retry + 1}/{max_retries})")
+                logger.info(f"  HTTP {response.status_code}: {response.text[:100]} (retry {retry + 1}/{max_retries})")
             except Exception as e:
-                print(f"  Exception uploading confirmed height: {e} (retry {retry + 1}/{max_retries})")
+                logger.info(f"  Exception uploading confirmed height: {e} (retry {retry + 1}/{max_retries})")
             if retry < max_retries - 1:
                 time.sleep(2)
 
-        print(f"  Failed to upload confirmed height, will retry next round")
+        logger.info(f"  Failed to upload confirmed height, will retry next round")
         return False
     except Exception as e:
-        print(f"  Exception: {e}")
+        logger.info(f"  Exception: {e}")
         return False
 
 
-def sync_pending(name):
-    """Sync pending addresses to server
-    
-    This function reads pending addresses from local text files
-    and sends them to the server in batches of up to 10000 addresses.
-    After successful sync, the files are cleared.
-    """
-    try:
-        print(f"\n[{name}] Syncing pending addresses...")
+# kind -> (服务端接口, 本地库, 已存在记录的写入函数, 请求体附带的字段)
+PENDING_TARGETS = {
+    'tvl': ('add_tvl_addresses', init_tvl_db, store_tvl_records, BALANCE_PARAMS),
+    'code': ('add_code_addresses', init_code_db, store_code_records, {}),
+}
+
+def upload_pending(name, queue_conn, kind, batch_size=1000, max_retries=3):
+    """把队列里还没确认的地址分批传给服务端, 返回确认的地址数"""
+    endpoint, init_db, store_records, extra_body = PENDING_TARGETS[kind]
+    total_synced = 0
+    while True:
+        addresses = pending_queue.take(queue_conn, kind, batch_size)
+        if not addresses:
+            break
         
-        # Sync pending TVL addresses
-        total_tvl_synced = 0
-        tvl_file_path = f'../info_local/{name}_pending_tvl.txt'
+        logger.info(f"  Syncing {len(addresses)} pending {kind} addresses...")
         
-        if os.path.exists(tvl_file_path):
+        # Try to send to server with retries
+        success = False
+        for retry in range(max_retries):
             try:
-                f = open(tvl_file_path, 'r')
-                batch_size = 1000
-                max_retries = 3
-                
-                while True:
-                    addresses = []
-                    # Read up to 1000 addresses using readline
-                    for _ in range(batch_size):
-                        line = f.readline().strip()
-                        if not line:
-                            break
-                        addresses.append(line)
-                    
-                    if not addresses:
-                        break
-                    
-                    print(f"  Syncing {len(addresses)} pending TVL addresses...")
-                    
-                    # Try to send to server with retries
-                    success = False
-                    for retry in range(max_retries):
-                        try:
-                            response = requests.post(
-                                f"{SERVER_URL}/{name}/add_tvl_addresses",
-                                json={'addresses': addresses},
-                                headers={**get_auth_headers(), 'Content-Type': 'application/json'},
-                                timeout=10
-                            )
-                            
-                            if response.status_code != 200:
-                                print(f"  HTTP Error {response.status_code} for TVL addresses (retry {retry + 1}/{max_retries})")
-                                if retry < max_retries - 1:
-                                    time.sleep(2)
-                                    continue
-                            else:
-                                data = response.json()
-                                if not data.get('success'):
-                                    print(f"  Error: {data.get('error')} (retry {retry + 1}/{max_retries})")
-                                    if retry < max_retries - 1:
-                                        time.sleep(2)
-                                        continue
-                                else:
-                                    total_tvl_synced += len(addresses)
-                                    added_count = data.get('added_count', 0)
-                                    existed_count = data.get('existed_count', 0)
-                                    print(f"  Batch synced: {len(addresses)} TVL addresses (added: {added_count}, existed: {existed_count})")
-                                    
-                                    # Insert existed data to local database
-                                    existed_data = data.get('existed', [])
-                                    if existed_data:
-                                        try:
-                                            tvl_conn = init_tvl_db(name)
-                                            tvl_cursor = tvl_conn.cursor()
-                                            for record in existed_data:
-                                                try:
-                                                    tvl_cursor.execute(
-                                                        """INSERT OR REPLACE INTO author_balances 
-                                                        (author_address, eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance, timestamp, last_update_timestamp)
-                                                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                                                        (record['author_address'], record['eth_balance'], record['weth_balance'],
-                                                         record['wbtc_balance'], record['usdt_balance'], record['usdc_balance'],
-                                                         record['dai_balance'], record['timestamp'], record['last_update_timestamp'])
-                                                    )
-                                                except Exception as e:
-                                                    print(f"    Error inserting existed TVL record: {e}")
-                                            tvl_conn.commit()
-                                            tvl_conn.close()
-                                            print(f"    Inserted {len(existed_data)} existed TVL records to local database")
-                                        except Exception as e:
-                                            print(f"    Error processing existed TVL data: {e}")
-                                    
-                                    success = True
-                                    break
-                        except Exception as e:
-                            print(f"  Exception syncing batch: {e} (retry {retry + 1}/{max_retries})")
-                            if retry < max_retries - 1:
-                                time.sleep(2)
-                                continue
-                    
-                    if not success:
-                        print(f"  Failed to sync batch after {max_retries} retries, skipping to next batch")
-                
-                f.close()
+                response = SESSION.post(
+                    f"{SERVER_URL}/{name}/{endpoint}",
+                    json={'addresses': addresses, **extra_body},
+                    headers={**get_auth_headers(), 'Content-Type': 'application/json'},
+                    timeout=10
+                )
                 
-                # Delete file after all batches processed
-                if total_tvl_synced > 0:
-                    os.remove(tvl_file_path)
-                    print(f"  Total TVL addresses synced and file removed: {total_tvl_synced}")
+                if response.status_code != 200:
+                    logger.info(f"  HTTP Error {response.status_code} for {kind} addresses (retry {retry + 1}/{max_retries})")
                 else:
-                    print(f"  No pending TVL addresses to sync")
-                    
-            except Exception as e:
-                print(f"  Error syncing TVL addresses: {e}")
-        else:
-            print(f"  No pending TVL file found")
-        
-        # Sync pending code addresses
-        total_code_synced = 0
-        code_file_path = f'../info_local/{name}_pending_code.txt'
-        
-        if os.path.exists(code_file_path):
-            try:
-                f = open(code_file_path, 'r')
-                batch_size = 1000
-                max_retries = 3
-                
-                while True:
-                    addresses = []
-                    # Read up to 1000 addresses using readline
-                    for _ in range(batch_size):
-                        line = f.readline().strip()
-                        if not line:
-                            break
-                        addresses.append(line)
-                    
-                    if not addresses:
+                    data = response.json()
+                    if not data.get('success'):
+                        logger.info(f"  Error: {data.get('error')} (retry {retry + 1}/{max_retries})")
+                    else:
+                        success = True
+                        pending_queue.ack(queue_conn, kind, addresses)
+                        total_synced += len(addresses)
+                        added_count = data.get('added_count', 0)
+                        existed_count = data.get('existed_count', 0)
+                        logger.info(f"  Batch synced: {len(addresses)} {kind} addresses (added: {added_count}, existed: {existed_count})")
+                        
+                        # Insert existed data to local database
+                        existed_data = data.get('existed', [])
+                        if existed_data:
+                            try:
+                                conn = init_db(name)
+                                store_records(conn, existed_data, name, data)
+                                conn.commit()
+                                conn.close()
+                                logger.info(f"    Inserted {len(existed_data)} existed {kind} records to local database")
+                            except Exception as e:
+                                logger.info(f"    Error processing existed {kind} data: {e}")
                         break
-                    
-                    print(f"  Syncing {len(addresses)} pending code addresses...")
-                    
-                    # Try to send to server with retries
-                    success = False
-                    for retry in range(max_retries):
-                        try:
-                            response = requests.post(
-                                f"{SERVER_URL}/{name}/add_code_addresses",
-                                json={'addresses': addresses},
-                                headers={**get_auth_headers(), 'Content-Type': 'application/json'},
-                                timeout=10
-                            )
-                            
-                            if response.status_code != 200:
-                                print(f"  HTTP Error {response.status_code} for code addresses (retry {retry + 1}/{max_retries})")
-                                if retry < max_retries - 1:
-                                    time.sleep(2)
-                                    continue
-                            else:
-                                data = response.json()
-                                if not data.get('success'):
-                                    print(f"  Error: {data.get('error')} (retry {retry + 1}/{max_retries})")
-                                    if retry < max_retries - 1:
-                                        time.sleep(2)
-                                        continue
-                                else:
-                                    total_code_synced += len(addresses)
-                                    added_count = data.get('added_count', 0)
-                                    existed_count = data.get('existed_count', 0)
-                                    print(f"  Batch synced: {len(addresses)} code addresses (added: {added_count}, existed: {existed_count})")
-                                    
-                                    # Insert existed data to local database
-                                    existed_data = data.get('existed', [])
-                                    if existed_data:
-                                        try:
-                                            code_conn = init_code_db(name)
-                                            code_cursor = code_conn.cursor()
-                                            for record in existed_data:
-                                                try:
-                                                    code_cursor.execute(
-                                                        """INSERT OR REPLACE INTO codes 
-                                                        (code_address, code, timestamp, last_update_timestamp)
-                                                        VALUES (?, ?, ?, ?)""",
-                                                        (record['code_address'], record['code'], record['timestamp'], record['last_update_timestamp'])
-                                                    )
-                                                except Exception as e:
-                                                    print(f"    Error inserting existed code record: {e}")
-                                            code_conn.commit()
-                                            code_conn.close()
-                                            print(f"    Inserted {len(existed_data)} existed code records to local database")
-                                        except Exception as e:
-                                            print(f"    Error processing existed code data: {e}")
-                                    
-                                    success = True
-                                    break
-                        except Exception as e:
-                            print(f"  Exception syncing batch: {e} (retry {retry + 1}/{max_retries})")
-                            if retry < max_retries - 1:
-                                time.sleep(2)
-                                continue
-                    
-                    if not success:
-                        print(f"  Failed to sync batch after {max_retries} retries, skipping to next batch")
-                
-                f.close()
-                
-                # Delete file after all batches processed
-                if total_code_synced > 0:
-                    os.remove(code_file_path)
-                    print(f"  Total code addresses synced and file removed: {total_code_synced}")
-                else:
-                    print(f"  No pending code addresses to sync")
-                    
             except Exception as e:
-                print(f"  Error syncing code addresses: {e}")
-        else:
-            print(f"  No pending code file found")
+                logger.info(f"  Exception syncing batch: {e} (retry {retry + 1}/{max_retries})")
+            if retry < max_retries - 1:
+                time.sleep(2)
         
-        print(f"  Total pending addresses synced: TVL={total_tvl_synced}, Code={total_code_synced}")
+        if not success:
+            # 放回队列, 下一轮再传; 这一轮先停, 免得对着故障的服务端空转
+            pending_queue.release(queue_conn, kind, addresses)
+            logger.info(f"  Failed to sync batch after {max_retries} retries, will retry next cycle")
+            break
+    return total_synced
+
+def sync_pending(name):
+    """Sync pending addresses to server
+    
+    Pending addresses live in the durable queue ../info_local/{name}_pending.db
+    (filled by the updater). Only addresses the server has not acknowledged yet
+    are sent, in batches of up to 1000 addresses.
+    """
+    try:
+        logger.info(f"\nSyncing pending addresses...")
+        queue_conn = pending_queue.connect(name)
+        
+        synced = {}
+        for kind in pending_queue.KINDS:
+            synced[kind] = upload_pending(name, queue_conn, kind)
+            state_counts = pending_queue.counts(queue_conn, kind)
+            logger.info(f"  {kind}: {synced[kind]} addresses synced this cycle, "
+                  f"{state_counts.get(pending_queue.QUEUED, 0) + state_counts.get(pending_queue.SENT, 0)} still pending, "
+                  f"{state_counts.get(pending_queue.ACKED, 0)} acknowledged")
+        
+        queue_conn.close()
+        logger.info(f"  Total pending addresses synced: TVL={synced['tvl']}, Code={synced['code']}")
         return True
         
     except Exception as e:
-        print(f"  Exception: {e}")
+        logger.info(f"  Exception: {e}")
         return False
 
+def _run_named(tasks, max_workers=None):
+    """
+    每个任务 (label, func, *args) 在以 label (如 'arb/tvl') 命名的线程里执行, 日志前缀即线程名
+    :param max_workers: 最多同时运行的任务数 (默认全部)
+    :return: 各任务的返回值列表, 抛异常的任务为 False
+    """
+    results = [False] * len(tasks)
+    slots = threading.BoundedSemaphore(max_workers or len(tasks))
+
+    def run(index, func, func_args):
+        with slots:
+            try:
+                results[index] = func(*func_args)
+            except Exception as e:
+                logger.info(f"  Exception: {e}")
+
+    threads = [threading.Thread(target=run, args=(index, task[1], task[2:]), name=task[0])
+               for index, task in enumerate(tasks)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def download_chain(name):
+    """一条链的下载: 快照初始化 -> 块 / TVL / code 三路并行 (各用各的库, 互不依赖)"""
+    start_time = time.time()
+    
+    # 0. Bootstrap fresh local databases from server snapshots
+    if not args.no_snapshot:
+        sync_snapshot(name)
+    
+    # 1. Sync highest block info
+    sync_highest_block(name)
+    
+    # 2-4. Sync blocks / TVL / code concurrently
+    ok = all(_run_named([
+        (f"{name}/blocks", sync_blocks, name, START_BLOCKS.get(name, START_BLOCK)),
+        (f"{name}/tvl", sync_tvl, name),
+        (f"{name}/code", sync_code, name),
+    ]))
+    return ok, time.time() - start_time
+
+def upload_chain(name):
+    """一条链的上传: 错误块 -> 确认高度 (有先后), 待处理地址与之并行"""
+    start_time = time.time()
+    
+    def sync_blocks_state(name):
+        # 1. Sync wrong blocks (回退水位) 之后才能 2. Sync confirmed height
+        wrong_ok = sync_wrong(name)
+        return sync_confirm(name) and wrong_ok
+    
+    ok = all(_run_named([
+        (f"{name}/blocks", sync_blocks_state, name),
+        # 3. Sync pending addresses
+        (f"{name}/pending", sync_pending, name),
+    ]))
+    return ok, time.time() - start_time
+
 def main():
     """Main synchronization function"""
     mode = "DOWNLOAD" if args.download else "UPLOAD"
     
-    print(f"=" * 80)
-    print(f"Starting syncer client")
-    print(f"Mode: {mode}")
-    print(f"Chain: {NAME}")
-    print(f"Server: {SERVER_URL}")
-    print(f"Start block: {START_BLOCK}")
-    print(f"Local DB path: {DB_PATH}")
+    logger.info(f"=" * 80)
+    logger.info(f"Starting syncer client")
+    logger.info(f"Mode: {mode}")
+    logger.info(f"Chains: {', '.join(NAMES)} (concurrency: {min(WORKERS, len(NAMES))})")
+    logger.info(f"Server: {SERVER_URL}")
+    if args.download:
+        logger.info(f"Start blocks: {', '.join(f'{name}={START_BLOCKS.get(name, START_BLOCK)}' for name in NAMES)}")
+    logger.info(f"Local DB path: {DB_PATH}")
     if AUTH_TOKEN:
-        print(f"Authentication: ENABLED (token loaded)")
+        logger.info(f"Authentication: ENABLED (token loaded)")
     else:
-        print(f"Authentication: DISABLED (no syncer_token.txt found)")
-    print(f"Time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"=" * 80)
+        logger.info(f"Authentication: DISABLED (no syncer_token.txt found)")
+    logger.info(f"Time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info(f"=" * 80)
     
     start_time = time.time()
     
-    if args.download:
-        # Download mode: Sync data from server
-        # 1. Sync highest block info
-        sync_highest_block(NAME)
-        
-        # 2. Sync blocks and transactions
-        sync_blocks(NAME, START_BLOCK)
-        
-        # 3. Sync TVL data
-        sync_tvl(NAME)
-        
-        # 4. Sync code data
-        sync_code(NAME)
-    
-    elif args.upload:
-        # Upload mode: Sync pending addresses and wrong blocks to server
-        # 1. Sync wrong blocks
-        sync_wrong(NAME)
-
-        # 2. Sync confirmed height
-        sync_confirm(NAME)
-
-        # 3. Sync pending addresses
-        sync_pending(NAME)
+    # 各条链互不依赖, 并行同步, 总耗时取决于最慢的那条链
+    sync_chain = download_chain if args.download else upload_chain
+    results = dict(zip(NAMES, _run_named([(name, sync_chain, name) for name in NAMES], WORKERS)))
     
     elapsed_time = time.time() - start_time
-    print(f"\n" + "=" * 80)
-    print(f"{mode} sync for {NAME} completed in {elapsed_time:.2f} seconds")
-    print(f"=" * 80)
+    logger.info(f"\n" + "=" * 80)
+    for name in NAMES:
+        result = results[name]
+        if result is False:
+            logger.info(f"{name}: failed")
+        else:
+            ok, chain_time = result
+            logger.info(f"{name}: {'ok' if ok else 'completed with errors'} in {chain_time:.2f} seconds")
+    logger.info(f"{mode} sync for {len(NAMES)} chains completed in {elapsed_time:.2f} seconds")
+    logger.info(f"=" * 80)
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""author_balances 余额的定点整数表示。
+
+原来余额存成 str(raw / 10**decimals), 即浮点数格式化出的文本: 下游每行都要
+float() 一遍, 同一余额两次查询可能格式化出不同的字符串, 变化检测也只能比文本。
+现在六个余额列都是 INTEGER, 存 "代币数量 x 10**BALANCE_DECIMALS" (nano 单位):
+  - raw -> 定点只做整数运算, 余额没变就是同一个整数, 变化检测是精确的整数比较
+  - 美元估值直接在 SQL 里按列乘价格算 (col * price / BALANCE_SCALE), 不再逐行转换
+  - 合计用 TOTAL() (浮点累加, 不会像 SUM() 那样整数溢出报错)
+  - 9 位小数下 int64 能表示 92 亿个代币, 正常代币单个地址不可能超; 垃圾代币的异常值在
+    to_fixed_row 里截到边界
+
+各链代币精度见 TOKEN_DECIMALS。旧库 bsc 的 USDT/USDC (18 位) 也按 6 位换算,
+存进去的数大了 10**12 倍, 由下游再除回来; 改成按真实精度换算后下游不再需要特判。
+
+旧库 (TEXT 列) 在 ensure_schema 时一次性重建成 INTEGER 列, 旧值按原来的换算反推,
+只损失一次浮点精度, 下次刷新就是精确值。
+
+syncer 接口上两种格式并存: 客户端请求带 balance_scale=BALANCE_SCALE 时服务端下发
+定点整数并在响应里回带 balance_scale; 不带的旧客户端仍拿到旧格式 (to_legacy_row);
+响应里没有 balance_scale 的是旧服务端, 客户端按 from_legacy_row 换算后入库。
+
+本文件在 backend_cloud / backend_local / info_cloud / info_local 各有一份, 保持一致。
+"""
+
+import sqlite3
+
+BALANCE_COLUMNS = ('eth_balance', 'weth_balance', 'wbtc_balance', 'usdt_balance', 'usdc_balance', 'dai_balance')
+
+BALANCE_DECIMALS = 9
+BALANCE_SCALE = 10 ** BALANCE_DECIMALS
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+# 余额合约返回的各列 raw 值的精度, 顺序同 BALANCE_COLUMNS
+DEFAULT_TOKEN_DECIMALS = (18, 18, 8, 6, 6, 18)
+TOKEN_DECIMALS = {
+    'bsc': (18, 18, 8, 18, 18, 18),
+}
+
+
+def token_decimals(name):
+    return TOKEN_DECIMALS.get(name, DEFAULT_TOKEN_DECIMALS)
+
+
+def to_fixed(raw, decimals):
+    """合约返回的 raw 整数 -> 定点整数 (截断到 BALANCE_DECIMALS 位小数)"""
+    if decimals >= BALANCE_DECIMALS:
+        return raw // 10 ** (decimals - BALANCE_DECIMALS)
+    return raw * 10 ** (BALANCE_DECIMALS - decimals)
+
+
+def _clamp(name, column, value, source):
+    if not INT64_MIN <= value <= INT64_MAX:
+        print(f"[balance_units] {name} {column} {source} out of int64 range, clamped")
+        value = max(INT64_MIN, min(INT64_MAX, value))
+    return value
+
+
+def to_fixed_row(name, raw_balances):
+    """
+    一行 raw 余额 -> 定点整数; 超出 SQLite INTEGER (int64) 范围的值 (垃圾代币 / 异常返回)
+    截到边界, 否则写库时 executemany 直接抛 OverflowError, 整批都写不进去
+    """
+    return [_clamp(name, column, to_fixed(raw, decimals), raw)
+            for column, raw, decimals in zip(BALANCE_COLUMNS, raw_balances, token_decimals(name))]
+
+
+def _legacy_factor(name, index):
+    """旧文本值 -> 定点整数的乘数 (旧值统一按 DEFAULT_TOKEN_DECIMALS 换算过)"""
+    return 10 ** (BALANCE_DECIMALS - (token_decimals(name)[index] - DEFAULT_TOKEN_DECIMALS[index]))
+
+
+def to_legacy_row(name, values):
+    """定点整数 -> 旧格式余额 (按 DEFAULT_TOKEN_DECIMALS 换算的代币数量), 下发给旧版客户端"""
+    return [None if value is None else value / _legacy_factor(name, index)
+            for index, value in enumerate(values)]
+
+
+def from_legacy_row(name, values):
+    """旧格式余额 (旧服务端下发的数字或文本) -> 定点整数, 换算同 ensure_schema 的迁移"""
+    return [None if value is None else _clamp(name, column, round(float(value) * _legacy_factor(name, index)), value)
+            for index, (column, value) in enumerate(zip(BALANCE_COLUMNS, values))]
+
+
+def ensure_schema(conn, name):
+    """
+    旧库的 TEXT 余额列重建成 INTEGER 定点列
+    :return: False 表示没有 author_balances 表, 否则 True
+    """
+    columns = conn.execute("PRAGMA table_info(author_balances)").fetchall()
+    if not columns:
+        return False
+    if all(column[2].upper() == 'INTEGER' for column in columns if column[1] in BALANCE_COLUMNS):
+        return True
+
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    # 拿到写锁后再看一次, 别的进程可能刚迁移完
+    columns = conn.execute("PRAGMA table_info(author_balances)").fetchall()
+    if all(column[2].upper() == 'INTEGER' for column in columns if column[1] in BALANCE_COLUMNS):
+        conn.rollback()
+        return True
+    print("[balance_units] migrating author_balances to fixed-point integer columns...")
+    indexes = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'author_balances' AND sql IS NOT NULL")]
+    definitions = []
+    selects = []
+    for _, column, column_type, _, _, pk in columns:
+        if column in BALANCE_COLUMNS:
+            definitions.append(f"{column} INTEGER")
+            factor = _legacy_factor(name, BALANCE_COLUMNS.index(column))
+            selects.append(f"CAST(ROUND(CAST({column} AS REAL) * {factor}) AS INTEGER)")
+        else:
+            definitions.append(f"{column} {column_type}{' PRIMARY KEY' if pk else ''}")
+            selects.append(column)
+    conn.execute(f"CREATE TABLE author_balances_fixed ({', '.join(definitions)})")
+    conn.execute(f"INSERT INTO author_balances_fixed SELECT {', '.join(selects)} FROM author_balances")
+    conn.execute("DROP TABLE author_balances")
+    conn.execute("ALTER TABLE author_balances_fixed RENAME TO author_balances")
+    for sql in indexes:
+        conn.execute(sql)
+    conn.commit()
+    return True
+
+
+def tvl_value_sql(prices, table=''):
+    """
+    一行余额折成美元的 SQL 表达式
+    :param prices: (原生币, ETH, BTC) 价格; 稳定币按 1 美元
+    """
+    native_price, eth_price, btc_price = (float(price) for price in prices)
+    prefix = f'{table}.' if table else ''
+    return (f"(({prefix}eth_balance * {native_price!r} + {prefix}weth_balance * {eth_price!r}"
+            f" + {prefix}wbtc_balance * {btc_price!r}"
+            f" + {prefix}usdt_balance + {prefix}usdc_balance + {prefix}dai_balance) / {float(BALANCE_SCALE)!r})")
@@ -0,0 +1,61 @@
+"""合约分发器里函数选择器的直接扫描, 取代 "pyevmasm 整段反汇编成文本再逐行匹配"。
+
+原来的 util.parse_functions 把整个合约反汇编成文本 (每条指令一个 Instruction
+对象 + 一次字符串格式化), 再找连续四行
+
+    PUSH4 <selector> / EQ 或 SUB / PUSH2 <dest> / JUMPI
+
+这里直接在字节上做同样的匹配: 一个编译好的正则 (C 实现的 re 引擎) 从头到尾
+按指令切分字节码, 每次要么吃掉完整的四条分发指令, 要么吃掉一条 PUSHn
+(连同它的 n 字节立即数) 或一段连续的无立即数指令, 所以立即数里的字节
+不会被误当成操作码。
+
+结果与旧实现逐字节一致, 包括它的怪癖:
+  - 选择器格式是 pyevmasm 的 '0x{:x}', 前导 0 会被去掉 (0x0000abcd -> '0xabcd')
+  - 第三条只检查 startswith("PUSH2"), 所以 PUSH20 ~ PUSH29 也算
+  - 末尾立即数不完整的 PUSH 连同之后的字节都被丢弃 (pyevmasm 在这里停止)
+  - 不是合法 hex 时同样抛 binascii.Error
+用 bench_selector_scan.py 对真实 codes 表校验一致性并测速。
+
+本文件在 info_cloud / info_local 各有一份, 保持一致。
+"""
+
+import re
+from binascii import unhexlify
+
+PUSH1 = 0x60
+PUSH32 = 0x7f
+PUSH4 = 0x63
+EQ = 0x14
+SUB = 0x03
+JUMPI = 0x57
+
+
+def _push(n):
+    return re.escape(bytes([PUSH1 + n - 1])) + b'.{%d}' % n
+
+
+# 名字以 "PUSH2" 开头的指令: PUSH2, PUSH20 ~ PUSH29
+_PUSH2_PREFIX = b'|'.join(_push(n) for n in [2] + list(range(20, 30)))
+
+# 一段不带立即数的指令 (一次吃掉连续多条), 或一条完整的 PUSHn;
+# 最后一支兜住末尾不完整的 PUSH (吃掉剩余全部字节, 相当于停止)
+_INSTRUCTION = b'|'.join([b'[^\\x60-\\x7f]+'] + [_push(n) for n in range(1, 33)] + [b'[\\x60-\\x7f].*'])
+
+_DISPATCH = (re.escape(bytes([PUSH4])) + b'(.{4})' + b'[' + re.escape(bytes([EQ, SUB])) + b']'
+             + b'(?:' + _PUSH2_PREFIX + b')' + re.escape(bytes([JUMPI])))
+
+# 分发模式放在前面: 匹配从上一个匹配的结尾继续, 每次至少吃掉一条完整指令
+_SCANNER = re.compile(b'(?:' + _DISPATCH + b')|(?:' + _INSTRUCTION + b')', re.DOTALL)
+
+
+def scan_selectors(code):
+    """hex 字节码 -> 分发器里的函数选择器列表, 与旧的 util.parse_functions 结果相同"""
+    if code.startswith("0x"):
+        code = code[2:]
+    selectors = []
+    for match in _SCANNER.finditer(unhexlify(code)):
+        selector = match.group(1)
+        if selector is not None:
+            selectors.append('0x{:x}'.format(int.from_bytes(selector, 'big')))
+    return selectors
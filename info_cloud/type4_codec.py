@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""type4 交易的紧凑存储格式。
+
+原格式 type4_transactions.tx_data 存整条交易的 json.dumps 文本 (input
+calldata、签名、authorizationList 全是十六进制字符串), 是块库膨胀和
+clean_block 频繁轮换的主因。紧凑格式:
+    tx_data      NULL
+    tx_index     INTEGER  交易在块内序号
+    from_address TEXT     relayer 地址 (原样保留大小写)
+    auth_count   INTEGER  authorizationList 长度
+    tx_blob      BLOB     其余字段 zlib 压缩后的 JSON
+block_number / tx_hash 本来就有列, blockNumber / hash / transactionIndex / from
+这几个字段能从列里原样还原时就不再进 blob (还原不了的原样留在 blob 里, 保证无损)。
+
+读端一律走 decode() 还原成和原来等价的 JSON 文本, 新旧两种行可以混存:
+    cursor.execute(f"SELECT block_number, tx_hash, {type4_codec.tx_data_sql(conn)} FROM type4_transactions")
+    for block_number, tx_hash, *stored in cursor:
+        tx_data = type4_codec.decode(block_number, tx_hash, *stored)
+
+旧行迁移: BlockWriter(compact=True) 空闲时分块迁移, 也可以命令行一次迁完
+(迁移只是改写行, 文件要等下次 clean_block 轮换才真正变小):
+    python3 type4_codec.py --name arb
+
+本文件在 backend_cloud / info_cloud 各有一份, 内容保持一致。
+"""
+
+import json
+import zlib
+
+COMPACT_COLUMNS = [('tx_index', 'INTEGER'), ('from_address', 'TEXT'),
+                   ('auth_count', 'INTEGER'), ('tx_blob', 'BLOB')]
+
+
+def _columns(conn):
+    return {row[1] for row in conn.execute("PRAGMA table_info(type4_transactions)")}
+
+
+def ensure_schema(conn):
+    """给 type4_transactions 补上紧凑格式的列 (已有则跳过), 表还不存在时返回 False"""
+    existing = _columns(conn)
+    if not existing:
+        return False
+    for column, column_type in COMPACT_COLUMNS:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE type4_transactions ADD COLUMN {column} {column_type}")
+    conn.commit()
+    return True
+
+
+def is_compact_schema(conn):
+    existing = _columns(conn)
+    return all(column in existing for column, _ in COMPACT_COLUMNS)
+
+
+def tx_data_sql(conn):
+    """SELECT 里取存储字段的表达式, 旧库没有紧凑列时用 NULL 占位, decode 参数个数不变"""
+    if is_compact_schema(conn):
+        return "tx_data, tx_index, from_address, tx_blob"
+    return "tx_data, NULL, NULL, NULL"
+
+
+def _to_int(value):
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value, 16)
+        except ValueError:
+            return None
+    return None
+
+
+def encode(tx_hash, block_number, tx_data):
+    """
+    原格式一行 -> 紧凑格式一行
+    :return: (tx_hash, block_number, None, tx_index, from_address, auth_count, tx_blob)
+    """
+    tx = json.loads(tx_data)
+    tx_index = _to_int(tx.get('transactionIndex'))
+    from_address = tx.get('from') if isinstance(tx.get('from'), str) else None
+    auth_count = len(tx.get('authorizationList') or [])
+
+    rest = dict(tx)
+    if rest.get('blockNumber') == hex(block_number):
+        del rest['blockNumber']
+    if rest.get('hash') == tx_hash:
+        del rest['hash']
+    if tx_index is not None and rest.get('transactionIndex') == hex(tx_index):
+        del rest['transactionIndex']
+    if from_address is not None:
+        del rest['from']
+    tx_blob = zlib.compress(json.dumps(rest, separators=(',', ':')).encode(), 6)
+    return (tx_hash, block_number, None, tx_index, from_address, auth_count, tx_blob)
+
+
+def decode(block_number, tx_hash, tx_data, tx_index, from_address, tx_blob):
+    """存储字段 -> 交易 JSON 文本, 旧格式行直接返回 tx_data"""
+    if tx_data is not None:
+        return tx_data
+    rest = json.loads(zlib.decompress(tx_blob))
+    tx = {}
+    if 'blockNumber' not in rest:
+        tx['blockNumber'] = hex(block_number)
+    if 'hash' not in rest:
+        tx['hash'] = tx_hash
+    if 'transactionIndex' not in rest and tx_index is not None:
+        tx['transactionIndex'] = hex(tx_index)
+    if 'from' not in rest and from_address is not None:
+        tx['from'] = from_address
+    tx.update(rest)
+    return json.dumps(tx)
+
+
+def migrate_chunk(conn, after_rowid=0, chunk=2000):
+    """
+    把 rowid > after_rowid 的一批旧格式行改写成紧凑格式并提交
+    :return: (本批最后的 rowid, 改写行数), rowid 没有前进表示迁完了
+    """
+    rows = conn.execute(
+        "SELECT rowid, tx_hash, block_number, tx_data FROM type4_transactions "
+        "WHERE rowid > ? AND tx_data IS NOT NULL ORDER BY rowid LIMIT ?",
+        (after_rowid, chunk)).fetchall()
+    if not rows:
+        return after_rowid, 0
+    updates = []
+    for rowid, tx_hash, block_number, tx_data in rows:
+        try:
+            _, _, _, tx_index, from_address, auth_count, tx_blob = encode(tx_hash, block_number, tx_data)
+        except (ValueError, TypeError, AttributeError):
+            continue  # 不是合法 JSON 的脏行原样保留
+        updates.append((tx_index, from_address, auth_count, tx_blob, rowid))
+    conn.executemany(
+        "UPDATE type4_transactions SET tx_data = NULL, tx_index = ?, from_address = ?, "
+        "auth_count = ?, tx_blob = ? WHERE rowid = ?", updates)
+    conn.commit()
+    return rows[-1][0], len(updates)
+
+
+if __name__ == '__main__':
+    import argparse
+    import sqlite3
+
+    parser = argparse.ArgumentParser(description='Migrate type4_transactions rows to the compact format')
+    parser.add_argument('--name', required=True, help='Blockchain network name')
+    parser.add_argument('--block_db_path', type=str, default='', help='block_db_path')
+    parser.add_argument('--chunk', type=int, default=2000, help='Rows per transaction')
+    args = parser.parse_args()
+
+    block_db_path = f'{args.name}_block.db'
+    if args.block_db_path != '':
+        block_db_path = f'{args.block_db_path}/{args.name}_block.db'
+
+    conn = sqlite3.connect(block_db_path, timeout=60)
+    ensure_schema(conn)
+    last_rowid, total = 0, 0
+    while True:
+        next_rowid, migrated = migrate_chunk(conn, last_rowid, args.chunk)
+        if next_rowid == last_rowid:
+            break
+        last_rowid = next_rowid
+        total += migrated
+        print(f"[type4_codec] {args.name}: migrated {total} rows (rowid {last_rowid})")
+    conn.close()
+    print(f"[type4_codec] {args.name}: done, {total} rows migrated")
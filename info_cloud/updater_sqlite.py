@@ -1,4 +1,8 @@
 import util
+import type4_codec
+import balance_units
+import code_store
+import code_tag_cache
 import time
 import logging
 import os
@@ -162,12 +166,13 @@ def update_info_by_block(info_db_path, block_db_path):
     block_conn = sqlite3.connect(block_db_path)
     block_tx_cursor = block_conn.cursor()
     block_timestamp_cursor = block_conn.cursor()
-    block_tx_cursor.execute("SELECT block_number, tx_hash, tx_data FROM type4_transactions ORDER BY block_number ASC")
+    block_tx_cursor.execute(f"SELECT block_number, tx_hash, {type4_codec.tx_data_sql(block_conn)} FROM type4_transactions ORDER BY block_number ASC")
     
     wrong_block_number = 0
     # Process row by row to avoid loading all data at once
     for row in block_tx_cursor:  # Iterate cursor directly
-        block_number, tx_hash, tx_data_str = row
+        block_number, tx_hash, *stored = row
+        tx_data_str = type4_codec.decode(block_number, tx_hash, *stored)
         
         tx_hash = "0x"+tx_hash
         info_cursor.execute("SELECT tx_hash FROM transactions WHERE tx_hash = ?", (tx_hash,))
@@ -261,50 +266,46 @@ def update_info_by_tvl(info_db_path, tvl_db_path):
     end_time = time.time()
     print(f"Price update: {end_time - start_time} seconds")
     
+    native_price = ETH_PRICE
+    if NAME == "bsc":
+        native_price = BNB_PRICE
+    elif NAME == "bera":
+        native_price = BERA_PRICE
+    elif NAME == "gnosis":
+        native_price = 1
+    prices = (native_price, ETH_PRICE, BTC_PRICE)
+
+    # 余额是定点整数 (balance_units), 估值整批在 SQL 里算: 挂上 tvl 库, 一条 UPDATE ... FROM
     start_time = time.time()
-    info_read_cursor.execute("SELECT authorizer_address FROM authorizers WHERE tvl_timestamp < ?", (int(time.time()) - DATA_EXPIRY,))
-    expired_count = 0
-    for row in info_read_cursor:
-        authorizer_address = row[0]
-        expired_count += 1
-        tvl_cursor.execute("SELECT eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance, timestamp FROM author_balances WHERE author_address = ?", (authorizer_address,))
-        result = tvl_cursor.fetchone()
-        if result is not None:
-            eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance, timestamp = result
-            if NAME == "bsc":
-                tvl_balance = float(eth_balance) * float(BNB_PRICE) + float(weth_balance) * float(ETH_PRICE) + float(wbtc_balance) * float(BTC_PRICE) + float(usdt_balance) / 10**12 + float(usdc_balance) / 10**12 + float(dai_balance)
-            elif NAME == "bera":
-                tvl_balance = float(eth_balance) * float(BERA_PRICE) + float(weth_balance) * float(ETH_PRICE) + float(wbtc_balance) * float(BTC_PRICE) + float(usdt_balance) + float(usdc_balance) + float(dai_balance)
-            elif NAME == "gnosis":
-                tvl_balance = float(eth_balance) + float(weth_balance) * float(ETH_PRICE) + float(wbtc_balance) * float(BTC_PRICE) + float(usdt_balance) + float(usdc_balance) + float(dai_balance)
-            else:
-                tvl_balance = float(eth_balance) * float(ETH_PRICE) + float(weth_balance) * float(ETH_PRICE) + float(wbtc_balance) * float(BTC_PRICE) + float(usdt_balance) + float(usdc_balance) + float(dai_balance)
-            info_write_cursor.execute("UPDATE authorizers SET tvl_balance = ?, tvl_timestamp = ? WHERE authorizer_address = ?", (tvl_balance, timestamp, authorizer_address))
+    info_write_cursor.execute("ATTACH DATABASE ? AS tvl_db", (tvl_db_path,))
+    info_write_cursor.execute(f"""
+        UPDATE authorizers SET tvl_balance = b.tvl_balance, tvl_timestamp = b.timestamp
+        FROM (SELECT author_address, {balance_units.tvl_value_sql(prices)} AS tvl_balance, timestamp
+              FROM tvl_db.author_balances) AS b
+        WHERE authorizers.authorizer_address = b.author_address AND authorizers.tvl_timestamp < ?
+    """, (int(time.time()) - DATA_EXPIRY,))
+    expired_count = info_write_cursor.rowcount
+    info_conn.commit()
+    info_write_cursor.execute("DETACH DATABASE tvl_db")
 
     end_time = time.time()
     print(f"TVL [expired]: {end_time - start_time} seconds, data count: {expired_count}")
     
     start_time = time.time()
-    tvl_cursor.execute("SELECT sum(eth_balance), sum(weth_balance), sum(wbtc_balance), sum(usdt_balance), sum(usdc_balance), sum(dai_balance) FROM author_balances")
+    # TOTAL: 浮点累加, 整数列合计不会溢出
+    tvl_cursor.execute("SELECT " + ", ".join(f"TOTAL({column})" for column in balance_units.BALANCE_COLUMNS)
+                       + " FROM author_balances")
     result = tvl_cursor.fetchone()
     if result is not None:
-        eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance = result
-        
-        eth_tvl_balance = float(eth_balance) * float(ETH_PRICE)
-        weth_tvl_balance = float(weth_balance) * float(ETH_PRICE)
-        wbtc_tvl_balance = float(wbtc_balance) * float(BTC_PRICE)
-        usdt_tvl_balance = float(usdt_balance)
-        usdc_tvl_balance = float(usdc_balance)
-        dai_tvl_balance = float(dai_balance)
+        eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance = (
+            total / balance_units.BALANCE_SCALE for total in result)
         
-        if NAME == "bsc":
-            eth_tvl_balance = float(eth_balance) * float(BNB_PRICE)
-            usdt_tvl_balance = float(usdt_balance) / 10**12
-            usdc_tvl_balance = float(usdc_balance) / 10**12
-        if NAME == "bera":
-            eth_tvl_balance = float(eth_balance) * float(BERA_PRICE)
-        if NAME == "gnosis":
-            eth_tvl_balance = float(eth_balance)    
+        eth_tvl_balance = eth_balance * float(native_price)
+        weth_tvl_balance = weth_balance * float(ETH_PRICE)
+        wbtc_tvl_balance = wbtc_balance * float(BTC_PRICE)
+        usdt_tvl_balance = usdt_balance
+        usdc_tvl_balance = usdc_balance
+        dai_tvl_balance = dai_balance
             
         total_tvl_balance = eth_tvl_balance + weth_tvl_balance + wbtc_tvl_balance + usdt_tvl_balance + usdc_tvl_balance + dai_tvl_balance
         
@@ -352,22 +353,25 @@ def update_info_by_code(info_db_path, code_db_path):
     code_authorizer_by_tag = {}
     code_tvl_by_tag = {}
     
+    # 地址 -> (code_hash, 内联代码) 一次查出; 标签按 code_hash 持久缓存,
+    # 只有新出现的字节码才反汇编, tag_info.json 改了也只重新映射缓存的选择器
+    code_store.ensure_schema(code_conn)
+    code_cursor.execute("SELECT LOWER(code_address), code_hash, code FROM codes")
+    code_of = {row[0]: row[1:] for row in code_cursor.fetchall()}
+    tag_cache = code_tag_cache.CodeTagCache(f'./db/{NAME}_code_tags.db')
+    
     info_read_cursor.execute("SELECT code_address, count(authorizer_address), sum(tvl_balance) FROM authorizers GROUP BY code_address")
     for row in info_read_cursor:
         code_address, authorizer_count, tvl_balance = row
         info_write_cursor.execute("INSERT INTO codes (code_address, authorizer_count, tvl_balance) VALUES (?, ?, ?) ON CONFLICT(code_address) DO UPDATE SET authorizer_count = excluded.authorizer_count, tvl_balance = excluded.tvl_balance", (code_address, authorizer_count, tvl_balance))
         
-        code_cursor.execute("SELECT code FROM codes WHERE LOWER(code_address) = ?", (code_address,))
-        row = code_cursor.fetchone()
-        if row is not None:
-            code = row[0]
-            functions = util.parse_functions(code)
-            tags = []
-            for function in functions:
-                if function in util.FUNCTION_TO_TAGS:
-                    for tag in util.FUNCTION_TO_TAGS[function]:
-                        if tag not in tags:
-                            tags.append(tag)
+        if code_address in code_of:
+            code_hash, code = code_of[code_address]
+            if code_hash is not None:
+                tags = tag_cache.tags(code_conn, code_hash)
+            else:
+                # 空代码 / 占位行, 不值得缓存
+                tags = util.code_tags(code)
             
             for tag in tags:
                 if tag not in code_count_by_tag:
@@ -392,6 +396,7 @@ def update_info_by_code(info_db_path, code_db_path):
             code_tvl_by_type[the_type] += tvl_balance
                 
             info_write_cursor.execute("UPDATE codes SET tags = ? WHERE code_address = ?", (json.dumps(tags), code_address))
+    tag_cache.close()
     
     code_info = json.load(open(f'code_info.json'))
     for item in code_info:
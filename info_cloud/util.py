@@ -6,7 +6,10 @@ from eth_account import Account
 import rlp
 from eth_utils import keccak
 from datetime import datetime
-from pyevmasm import disassemble_hex
+import selector_scan
+import type4_codec
+import balance_units
+import code_store
 import requests
 import time
 
@@ -97,14 +100,14 @@ def get_all_type4_txs():
     conn = sqlite3.connect(f'../backend/{NAME}_block.db')
     cursor = conn.cursor()
     # Get all type4 transaction data
-    cursor.execute("SELECT tx_hash, tx_data FROM type4_transactions")
+    cursor.execute(f"SELECT block_number, tx_hash, {type4_codec.tx_data_sql(conn)} FROM type4_transactions")
     rows = cursor.fetchall()
     
     type4_txs = []
     
     # Iterate through all transaction data
-    for (tx_hash, tx_data_str) in rows:
-        type4_tx = parse_type4_tx_data(tx_data_str)
+    for (block_number, tx_hash, *stored) in rows:
+        type4_tx = parse_type4_tx_data(type4_codec.decode(block_number, tx_hash, *stored))
         type4_txs.append(type4_tx)
     conn.close()
 
@@ -161,13 +164,10 @@ def get_authorizer_info(txs, code_infos, include_zero=False):
         except:
             time.sleep(1)
     
-    cursor.execute("SELECT author_address, eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance FROM author_balances")
-    data = cursor.fetchall()
-    for address, eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance in data:
-        if NAME != "bsc":
-            balance_of[address] = float(eth_balance) * float(ETH_PRICE) + float(weth_balance) * float(ETH_PRICE) + float(wbtc_balance) * float(BTC_PRICE) + float(usdt_balance) + float(usdc_balance) + float(dai_balance)
-        else:
-            balance_of[address] = float(eth_balance) * float(BNB_PRICE) + float(weth_balance) * float(ETH_PRICE) + float(wbtc_balance) * float(BTC_PRICE) + float(usdt_balance) / 10**12 + float(usdc_balance) / 10**12 + float(dai_balance)
+    native_price = BNB_PRICE if NAME == "bsc" else ETH_PRICE
+    # 余额是定点整数 (balance_units), 估值直接在 SQL 里算
+    cursor.execute(f"SELECT author_address, {balance_units.tvl_value_sql((native_price, ETH_PRICE, BTC_PRICE))} FROM author_balances")
+    balance_of = dict(cursor.fetchall())
 
     conn.close()
             
@@ -382,17 +382,8 @@ def get_overview(txs, authorizers, codes, relayers, code_infos):
 
 
 def parse_functions(code):
-    disassembled = disassemble_hex(code)
-    arr = disassembled.split("\n")
-    # print(arr)
-    functions = []
-    for i in range(len(arr)):
-        if arr[i].startswith("PUSH4"):
-            if i+1 < len(arr) and arr[i+1] in ["EQ", "SUB"]:
-                if i+2 < len(arr) and arr[i+2].startswith("PUSH2"):
-                    if i+3 < len(arr) and arr[i+3] == "JUMPI":
-                        functions.append(arr[i][6:])
-    return functions
+    # 直接在字节上匹配 PUSH4 / EQ|SUB / PUSH2 / JUMPI, 结果与原来的 pyevmasm 反汇编版一致
+    return selector_scan.scan_selectors(code)
 
 
 TAG_INFO = json.load(open('tag_info.json'))
@@ -405,22 +396,39 @@ for tag in TAG_INFO:
         FUNCTION_TO_TAGS[function].append(tag['tag'])
 
 
+def selector_tags(functions):
+    """函数选择器 -> 按 tag_info 匹配到的标签 (按出现顺序去重)"""
+    tags = []
+    for function in functions:
+        if function in FUNCTION_TO_TAGS:
+            for tag in FUNCTION_TO_TAGS[function]:
+                if tag not in tags:
+                    tags.append(tag)
+    return tags
+
+
+def code_tags(code):
+    """字节码 -> 标签"""
+    return selector_tags(parse_functions(code))
+
+
 def get_code_function_info():
     conn = sqlite3.connect(f'../backend/{NAME}_code.db')
     cursor = conn.cursor()
-    cursor.execute("SELECT code_address, code FROM codes")
+    code_store.ensure_schema(conn)
+    cursor.execute("SELECT code_address, code_hash, code FROM codes")
     rows = cursor.fetchall()
     
     ret = {}
-    # Iterate through all data
-    for (code_address, code) in rows:
-        functions = parse_functions(code)
-        tags = []
-        for function in functions:
-            if function in FUNCTION_TO_TAGS:
-                for tag in FUNCTION_TO_TAGS[function]:
-                    if tag not in tags:
-                        tags.append(tag)
+    tags_by_hash = {}
+    # Iterate through all data; 同一份字节码 (同一 code_hash) 只解析一次
+    for (code_address, code_hash, code) in rows:
+        if code_hash is None:
+            tags = code_tags(code)
+        else:
+            if code_hash not in tags_by_hash:
+                tags_by_hash[code_hash] = code_tags(code_store.load_code(conn, code_hash))
+            tags = tags_by_hash[code_hash]
         if len(tags) > 0:
             ret[code_address.lower()] = tags
         
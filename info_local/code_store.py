@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""{name}_code.db 的内容寻址存储。
+
+大量 7702 委托目标是同一份代理 / 克隆合约, 原来每个地址在 codes.code 里
+各存一份完整字节码, 下游每轮还要逐个反汇编。现在字节码按 keccak 哈希
+存进 code_blobs, 每份只存一次; codes 只记 code_hash 指向它:
+
+    code_blobs (code_hash TEXT PRIMARY KEY, code TEXT)
+    codes      (code_address, code, timestamp, last_update_timestamp, code_hash)
+
+  - 非空字节码: codes.code_hash = keccak(字节码), codes.code 置 NULL
+  - 空代码 / 还没抓过的占位行 ('' 或 '0x'): code_hash 为 NULL, 原样留在 codes.code
+读取统一用 CODE_COLUMN + JOIN_BLOBS, 结果与原来的 codes.code 相同。
+下游按 code_hash 去重, 解析成本只随不同字节码的个数增长。
+
+旧库在 ensure_schema 时分批迁移 (内联字节码搬进 code_blobs), 完成后在库的
+PRAGMA user_version 记下 SCHEMA_VERSION, 之后打开连接不再扫 codes。
+本文件在 backend_cloud / backend_local / info_cloud / info_local 各有一份, 保持一致。
+"""
+
+from eth_utils import keccak
+
+MIGRATE_BATCH = 1000
+SCHEMA_VERSION = 1
+
+CODE_COLUMN = "COALESCE(code_blobs.code, codes.code)"
+JOIN_BLOBS = "LEFT JOIN code_blobs ON code_blobs.code_hash = codes.code_hash"
+
+
+def code_hash(code):
+    """hex 字节码 -> '0x' + keccak 哈希; 空代码或不是合法 hex 时返回 None (留在 codes.code 里)"""
+    if not code:
+        return None
+    hex_code = code[2:] if code.startswith('0x') else code
+    if not hex_code:
+        return None
+    try:
+        return '0x' + keccak(bytes.fromhex(hex_code)).hex()
+    except ValueError:
+        return None
+
+
+def stage(conn, rows):
+    """
+    字节码写进 code_blobs (已有的跳过)
+    :param rows: [(code_address, code), ...]
+    :return: [(code_address, code_hash, inline_code), ...], 用于写 codes 行
+    """
+    staged = []
+    blobs = {}
+    for code_address, code in rows:
+        digest = code_hash(code)
+        if digest is None:
+            staged.append((code_address, None, code))
+        else:
+            blobs[digest] = code
+            staged.append((code_address, digest, None))
+    if blobs:
+        conn.executemany("INSERT OR IGNORE INTO code_blobs (code_hash, code) VALUES (?, ?)", blobs.items())
+    return staged
+
+
+def load_code(conn, digest):
+    row = conn.execute("SELECT code FROM code_blobs WHERE code_hash = ?", (digest,)).fetchone()
+    return row[0] if row else None
+
+
+def _migrate_inline(conn):
+    """还内联在 codes.code 里的字节码搬进 code_blobs, 每批一个事务"""
+    last_rowid = 0
+    migrated = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT rowid, code_address, code FROM codes "
+            "WHERE rowid > ? AND code_hash IS NULL AND LENGTH(code) > 2 ORDER BY rowid LIMIT ?",
+            (last_rowid, MIGRATE_BATCH)).fetchall()
+        if not rows:
+            conn.rollback()
+            break
+        last_rowid = rows[-1][0]
+        staged = stage(conn, [(code_address, code) for _, code_address, code in rows])
+        conn.executemany("UPDATE codes SET code_hash = ?, code = NULL WHERE code_address = ?",
+                         [(digest, code_address) for code_address, digest, _ in staged if digest is not None])
+        conn.commit()
+        migrated += len(rows)
+    if migrated:
+        print(f"[code_store] moved {migrated} inline codes into code_blobs")
+
+
+def ensure_schema(conn):
+    """
+    建 code_blobs / codes.code_hash, 并迁移旧库的内联字节码 (每个库只做一次)
+    :return: False 表示没有 codes 表, 否则 True
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(codes)")]
+    if not columns:
+        return False
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return True
+    conn.execute("CREATE TABLE IF NOT EXISTS code_blobs (code_hash TEXT PRIMARY KEY, code TEXT)")
+    if 'code_hash' not in columns:
+        conn.execute("ALTER TABLE codes ADD COLUMN code_hash TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_codes_code_hash ON codes(code_hash)")
+    conn.commit()
+    _migrate_inline(conn)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+    return True
+
+
+def prune(conn):
+    """删掉已经没有地址指向的字节码 (委托目标换了代码之后)"""
+    cursor = conn.execute("DELETE FROM code_blobs WHERE NOT EXISTS "
+                          "(SELECT 1 FROM codes WHERE codes.code_hash = code_blobs.code_hash)")
+    conn.commit()
+    return cursor.rowcount
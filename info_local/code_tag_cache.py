@@ -0,0 +1,82 @@
+"""按 code_hash 持久化的选择器 / 标签缓存。
+
+update_info_by_code 每轮都要对每份字节码跑一遍 util.parse_functions (整段反汇编),
+而绝大多数代码自上一轮以来根本没变。这里把解析结果按 code_hash 存进一个小 SQLite 库:
+
+    code_tags (code_hash TEXT PRIMARY KEY, selectors TEXT, tags TEXT, tag_info_hash TEXT)
+
+  - selectors 只取决于字节码, 同一 code_hash 永远不用重新扫描
+  - tags 取决于 tag_info.json, 记下生成时 tag_info.json 的哈希; 文件一改,
+    只从缓存的 selectors 重新映射标签, 仍然不碰字节码
+  - 只有新出现 (或换了代码) 的 code_hash 才会读字节码并解析
+
+用法:
+    cache = CodeTagCache(path)
+    tags = cache.tags(code_conn, code_hash)
+    cache.close()   # 新结果批量写回
+
+本文件在 info_cloud / info_local 各有一份, 保持一致。
+"""
+
+import json
+import hashlib
+import sqlite3
+
+import util
+import code_store
+
+
+def tag_info_hash(path='tag_info.json'):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class CodeTagCache:
+    def __init__(self, path, tag_info_path='tag_info.json'):
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS code_tags (
+            code_hash TEXT PRIMARY KEY,
+            selectors TEXT,
+            tags TEXT,
+            tag_info_hash TEXT
+        )
+        ''')
+        self.conn.commit()
+        self.tag_info_hash = tag_info_hash(tag_info_path)
+        # 整表读进内存: 行数只随不同字节码的个数增长
+        self.entries = {}
+        for code_hash, selectors, tags, entry_tag_info_hash in self.conn.execute(
+                "SELECT code_hash, selectors, tags, tag_info_hash FROM code_tags"):
+            self.entries[code_hash] = [json.loads(selectors), json.loads(tags), entry_tag_info_hash]
+        self.dirty = set()
+        self.scanned = 0
+        self.retagged = 0
+
+    def tags(self, code_conn, code_hash):
+        """code_hash 对应字节码的标签; 缓存没有时从 code_conn 读字节码解析"""
+        entry = self.entries.get(code_hash)
+        if entry is None:
+            code = code_store.load_code(code_conn, code_hash)
+            if code is None:
+                return []
+            selectors = util.parse_functions(code)
+            entry = [selectors, util.selector_tags(selectors), self.tag_info_hash]
+            self.entries[code_hash] = entry
+            self.dirty.add(code_hash)
+            self.scanned += 1
+        elif entry[2] != self.tag_info_hash:
+            entry[1] = util.selector_tags(entry[0])
+            entry[2] = self.tag_info_hash
+            self.dirty.add(code_hash)
+            self.retagged += 1
+        return entry[1]
+
+    def close(self):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO code_tags (code_hash, selectors, tags, tag_info_hash) VALUES (?, ?, ?, ?)",
+            [(code_hash, json.dumps(self.entries[code_hash][0]), json.dumps(self.entries[code_hash][1]),
+              self.entries[code_hash][2]) for code_hash in self.dirty])
+        self.conn.commit()
+        self.conn.close()
+        print(f"Code tag cache: {len(self.entries)} codes, scanned {self.scanned}, retagged {self.retagged}")
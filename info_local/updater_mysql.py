@@ -1,4 +1,8 @@
 import util
+import balance_units
+import code_store
+import code_tag_cache
+import pending_queue
 import time
 import logging
 import os
@@ -403,8 +407,8 @@ def update_info_by_tvl(mysql_db_name, tvl_db_path):
     tvl_conn = sqlite3.connect(tvl_db_path)
     tvl_cursor = tvl_conn.cursor()
     
-    # Open pending tvl file (overwrite mode)
-    pending_tvl_file = open(f'../info_local/{NAME}_pending_tvl.txt', 'w')
+    # 本地缺 TVL 数据的地址, 跑完后刷新进待上传队列
+    missing_tvl_addresses = []
     
     start_time = time.time()
     while True:
@@ -422,56 +426,62 @@ def update_info_by_tvl(mysql_db_name, tvl_db_path):
     end_time = time.time()
     print(f"Price update: {end_time - start_time} seconds")
     
+    native_price = ETH_PRICE
+    if NAME == "bsc":
+        native_price = BNB_PRICE
+    elif NAME == "bera":
+        native_price = BERA_PRICE
+    elif NAME == "gnosis":
+        native_price = 1
+    prices = (native_price, ETH_PRICE, BTC_PRICE)
+
+    # 余额是定点整数 (balance_units), 估值整批在 SQLite 里算:
+    # 授权人地址先灌进 tvl 库的临时表, 一次 LEFT JOIN 拿到估值, 查不到的进 pending
     start_time = time.time()
     info_read_cursor.execute("SELECT authorizer_address FROM authorizers")
-    count = 0
-    for row in info_read_cursor:
-        authorizer_address = row[0]
-        count += 1
-        tvl_cursor.execute("SELECT eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance, timestamp FROM author_balances WHERE author_address = ?", (authorizer_address,))
-        result = tvl_cursor.fetchone()
-        if result is not None:
-            eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance, timestamp = result
-            if NAME == "bsc":
-                tvl_balance = float(eth_balance) * float(BNB_PRICE) + float(weth_balance) * float(ETH_PRICE) + float(wbtc_balance) * float(BTC_PRICE) + float(usdt_balance) / 10**12 + float(usdc_balance) / 10**12 + float(dai_balance)
-            elif NAME == "bera":
-                tvl_balance = float(eth_balance) * float(BERA_PRICE) + float(weth_balance) * float(ETH_PRICE) + float(wbtc_balance) * float(BTC_PRICE) + float(usdt_balance) + float(usdc_balance) + float(dai_balance)
-            elif NAME == "gnosis":
-                tvl_balance = float(eth_balance) + float(weth_balance) * float(ETH_PRICE) + float(wbtc_balance) * float(BTC_PRICE) + float(usdt_balance) + float(usdc_balance) + float(dai_balance)
-            else:
-                tvl_balance = float(eth_balance) * float(ETH_PRICE) + float(weth_balance) * float(ETH_PRICE) + float(wbtc_balance) * float(BTC_PRICE) + float(usdt_balance) + float(usdc_balance) + float(dai_balance)
-            info_write_cursor.execute("UPDATE authorizers SET tvl_balance = %s, tvl_timestamp = %s WHERE authorizer_address = %s", (tvl_balance, timestamp, authorizer_address))
+    authorizer_addresses = [row[0] for row in info_read_cursor.fetchall()]
+    count = len(authorizer_addresses)
+    tvl_cursor.execute("CREATE TEMP TABLE IF NOT EXISTS authorizer_list (authorizer_address TEXT PRIMARY KEY)")
+    tvl_cursor.execute("DELETE FROM temp.authorizer_list")
+    tvl_cursor.executemany("INSERT OR IGNORE INTO temp.authorizer_list VALUES (?)",
+                           ((address,) for address in authorizer_addresses))
+    tvl_cursor.execute(f"""
+        SELECT l.authorizer_address, {balance_units.tvl_value_sql(prices, table='b')}, b.timestamp
+        FROM temp.authorizer_list AS l
+        LEFT JOIN author_balances AS b ON b.author_address = l.authorizer_address
+    """)
+    updates = []
+    for authorizer_address, tvl_balance, timestamp in tvl_cursor.fetchall():
+        if timestamp is None:
+            # Add missing address to pending queue
+            missing_tvl_addresses.append(authorizer_address)
         else:
-            # Add missing address to pending tvl file
-            pending_tvl_file.write(f"{authorizer_address}\n")
+            updates.append((tvl_balance, timestamp, authorizer_address))
+    info_write_cursor.executemany("UPDATE authorizers SET tvl_balance = %s, tvl_timestamp = %s WHERE authorizer_address = %s", updates)
     
-    # Close pending file
-    pending_tvl_file.close()
+    pending_conn = pending_queue.connect(NAME)
+    added, resolved = pending_queue.replace_missing(pending_conn, 'tvl', missing_tvl_addresses)
+    pending_conn.close()
+    print(f"Pending TVL addresses: {len(missing_tvl_addresses)} missing, {added} newly queued, {resolved} resolved")
 
     end_time = time.time()
     print(f"TVL [update]: {end_time - start_time} seconds, data count: {count}")
     
     start_time = time.time()
-    tvl_cursor.execute("SELECT sum(eth_balance), sum(weth_balance), sum(wbtc_balance), sum(usdt_balance), sum(usdc_balance), sum(dai_balance) FROM author_balances")
+    # TOTAL: 浮点累加, 整数列合计不会溢出
+    tvl_cursor.execute("SELECT " + ", ".join(f"TOTAL({column})" for column in balance_units.BALANCE_COLUMNS)
+                       + " FROM author_balances")
     result = tvl_cursor.fetchone()
     if result is not None:
-        eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance = result
-        
-        eth_tvl_balance = float(eth_balance) * float(ETH_PRICE)
-        weth_tvl_balance = float(weth_balance) * float(ETH_PRICE)
-        wbtc_tvl_balance = float(wbtc_balance) * float(BTC_PRICE)
-        usdt_tvl_balance = float(usdt_balance)
-        usdc_tvl_balance = float(usdc_balance)
-        dai_tvl_balance = float(dai_balance)
+        eth_balance, weth_balance, wbtc_balance, usdt_balance, usdc_balance, dai_balance = (
+            total / balance_units.BALANCE_SCALE for total in result)
         
-        if NAME == "bsc":
-            eth_tvl_balance = float(eth_balance) * float(BNB_PRICE)
-            usdt_tvl_balance = float(usdt_balance) / 10**12
-            usdc_tvl_balance = float(usdc_balance) / 10**12
-        if NAME == "bera":
-            eth_tvl_balance = float(eth_balance) * float(BERA_PRICE)
-        if NAME == "gnosis":
-            eth_tvl_balance = float(eth_balance)    
+        eth_tvl_balance = eth_balance * float(native_price)
+        weth_tvl_balance = weth_balance * float(ETH_PRICE)
+        wbtc_tvl_balance = wbtc_balance * float(BTC_PRICE)
+        usdt_tvl_balance = usdt_balance
+        usdc_tvl_balance = usdc_balance
+        dai_tvl_balance = dai_balance
             
         total_tvl_balance = eth_tvl_balance + weth_tvl_balance + wbtc_tvl_balance + usdt_tvl_balance + usdc_tvl_balance + dai_tvl_balance
         
@@ -505,8 +515,8 @@ def update_info_by_code(mysql_db_name, code_db_path):
     code_conn = sqlite3.connect(code_db_path)
     code_cursor = code_conn.cursor()
     
-    # Open pending code file (overwrite mode)
-    pending_code_file = open(f'../info_local/{NAME}_pending_code.txt', 'w')
+    # 本地缺 code 数据的地址, 跑完后刷新进待上传队列
+    missing_code_addresses = []
     
     code_address_to_type = {}
     code_info = json.load(open(f'code_info.json'))
@@ -529,22 +539,25 @@ def update_info_by_code(mysql_db_name, code_db_path):
     info_write_cursor.execute("UPDATE codes SET authorizer_count = 0, tvl_balance = 0")
     info_conn.commit()
     
+    # 地址 -> (code_hash, 内联代码) 一次查出; 标签按 code_hash 持久缓存,
+    # 只有新出现的字节码才反汇编, tag_info.json 改了也只重新映射缓存的选择器
+    code_store.ensure_schema(code_conn)
+    code_cursor.execute("SELECT LOWER(code_address), code_hash, code FROM codes")
+    code_of = {row[0]: row[1:] for row in code_cursor.fetchall()}
+    tag_cache = code_tag_cache.CodeTagCache(f'../info_local/{NAME}_code_tags.db')
+    
     info_read_cursor.execute("SELECT code_address, count(authorizer_address), sum(tvl_balance) FROM authorizers GROUP BY code_address")
     for row in info_read_cursor:
         code_address, authorizer_count, tvl_balance = row
         info_write_cursor.execute("UPDATE codes SET authorizer_count = authorizer_count + %s, tvl_balance = tvl_balance + %s WHERE code_address = %s", (authorizer_count, tvl_balance, code_address))
         
-        code_cursor.execute("SELECT code FROM codes WHERE LOWER(code_address) = ?", (code_address,))
-        row = code_cursor.fetchone()
-        if row is not None:
-            code = row[0]
-            functions = util.parse_functions(code)
-            tags = []
-            for function in functions:
-                if function in util.FUNCTION_TO_TAGS:
-                    for tag in util.FUNCTION_TO_TAGS[function]:
-                        if tag not in tags:
-                            tags.append(tag)
+        if code_address in code_of:
+            code_hash, code = code_of[code_address]
+            if code_hash is not None:
+                tags = tag_cache.tags(code_conn, code_hash)
+            else:
+                # 空代码 / 占位行, 不值得缓存
+                tags = util.code_tags(code)
             
             for tag in tags:
                 if tag not in code_count_by_tag:
@@ -570,11 +583,14 @@ def update_info_by_code(mysql_db_name, code_db_path):
                 
             info_write_cursor.execute("UPDATE codes SET tags = %s WHERE code_address = %s", (json.dumps(tags), code_address))
         else:
-            # Add missing address to pending code file
-            pending_code_file.write(f"{code_address}\n")
-    
-    # Close pending file
-    pending_code_file.close()
+            # Add missing address to pending queue
+            missing_code_addresses.append(code_address)
+    
+    pending_conn = pending_queue.connect(NAME)
+    added, resolved = pending_queue.replace_missing(pending_conn, 'code', missing_code_addresses)
+    pending_conn.close()
+    print(f"Pending code addresses: {len(missing_code_addresses)} missing, {added} newly queued, {resolved} resolved")
+    tag_cache.close()
     
     code_info = json.load(open(f'code_info.json'))
     for item in code_info:
@@ -4,7 +4,7 @@ from eth_utils import to_bytes
 from eth_account import Account
 import rlp
 from eth_utils import keccak
-from pyevmasm import disassemble_hex
+import selector_scan
 
 PER_EMPTY_ACCOUNT_COST = 25000
 
@@ -97,17 +97,8 @@ def parse_type4_tx_data(tx_data_str_):
 
 
 def parse_functions(code):
-    disassembled = disassemble_hex(code)
-    arr = disassembled.split("\n")
-    # print(arr)
-    functions = []
-    for i in range(len(arr)):
-        if arr[i].startswith("PUSH4"):
-            if i+1 < len(arr) and arr[i+1] in ["EQ", "SUB"]:
-                if i+2 < len(arr) and arr[i+2].startswith("PUSH2"):
-                    if i+3 < len(arr) and arr[i+3] == "JUMPI":
-                        functions.append(arr[i][6:])
-    return functions
+    # 直接在字节上匹配 PUSH4 / EQ|SUB / PUSH2 / JUMPI, 结果与原来的 pyevmasm 反汇编版一致
+    return selector_scan.scan_selectors(code)
 
 
 TAG_INFO = json.load(open('tag_info.json'))
@@ -119,3 +110,19 @@ for tag in TAG_INFO:
             FUNCTION_TO_TAGS[function] = []
         FUNCTION_TO_TAGS[function].append(tag['tag'])
 
+
+def selector_tags(functions):
+    """函数选择器 -> 按 tag_info 匹配到的标签 (按出现顺序去重)"""
+    tags = []
+    for function in functions:
+        if function in FUNCTION_TO_TAGS:
+            for tag in FUNCTION_TO_TAGS[function]:
+                if tag not in tags:
+                    tags.append(tag)
+    return tags
+
+
+def code_tags(code):
+    """字节码 -> 标签"""
+    return selector_tags(parse_functions(code))
+